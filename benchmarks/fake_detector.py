@@ -0,0 +1,46 @@
+import numpy as np
+import supervision as sv
+from benchmarks.synthetic import CLASS_NAMES
+from detector.detector import Detector
+
+
+class FakeDetector(Detector):
+    """
+    Deterministic in-process detector backend.
+
+    Instead of running a network, `detect` returns the known boxes of a
+    `SyntheticMatch` for the frames it is called with, by frame number when given
+    and in call order otherwise, so the rest of the pipeline can be benchmarked
+    without model weights or a GPU.
+    """
+    name = 'fake'
+
+    def __init__(self, match):
+        super().__init__()
+        self.match = match
+        self.class_names = CLASS_NAMES
+        self.frame_num = 0
+
+    def _detect(self, frames, conf, frame_nums):
+        detections = []
+        for frame_num in frame_nums or [None] * len(frames):
+            if frame_num is not None:
+                self.frame_num = frame_num
+            xyxy, confidence, class_id = self.match.detections(self.frame_num)
+            keep = confidence >= conf
+            detections.append(sv.Detections(xyxy=xyxy[keep], confidence=confidence[keep],
+                                            class_id=class_id[keep].astype(int)))
+            self.frame_num += 1
+        return detections
+
+    def detect_regions(self, frame, regions, frame_num=None):
+        # The frame's known boxes clipped to each region, as a crop would show them
+        detections = self.detect([frame], None if frame_num is None else [frame_num])[0]
+        region_detections = []
+        for x1, y1, x2, y2 in regions:
+            xyxy = np.clip(detections.xyxy, [x1, y1, x1, y1], [x2, y2, x2, y2]).astype(np.float32)
+            inside = (xyxy[:, 2] > xyxy[:, 0]) & (xyxy[:, 3] > xyxy[:, 1])
+            region = detections[inside]
+            region.xyxy = xyxy[inside]
+            region_detections.append(region)
+        return region_detections
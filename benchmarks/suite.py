@@ -0,0 +1,161 @@
+"""
+Offline benchmark of the whole pipeline on synthetic clips.
+
+Usage:
+    python -m benchmarks.suite --lengths 250 1000 --save-baseline
+    python -m benchmarks.suite --lengths 250 1000
+    python -m benchmarks.suite --detectors fake onnx=models/best.onnx ultralytics=models/best.pt
+
+Every run renders a synthetic clip and runs `main.main` on it without the stage
+cache in a fresh process, so the reported peak RSS belongs to that run alone. By
+default detections come from `FakeDetector`; real backends can be benchmarked
+side by side by naming them with their weights. Results are compared against a stored baseline
+and the command exits with status 1 when a stage regressed.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+
+def _run_pipeline(n_frames, seed, backend='fake', model_path=None):
+    # Imported here so the parent process never loads the pipeline's dependencies
+    import main as pipeline
+    from benchmarks.fake_detector import FakeDetector
+    from benchmarks.synthetic import SyntheticMatch
+    from utils.profiling import StageProfiler, peak_rss_mb
+
+    with tempfile.TemporaryDirectory(prefix='benchmark-') as workdir:
+        video_path = os.path.join(workdir, 'input.mp4')
+        match = SyntheticMatch(n_frames, seed=seed)
+        match.write(video_path)
+
+        model = FakeDetector(match) if backend == FakeDetector.name else None
+        profiler = StageProfiler()
+        start = time.perf_counter()
+        pipeline.main(video_path=video_path, output_dir=os.path.join(workdir, 'output'), model_path=model_path,
+                      model=model, cache_dir=None, profiler=profiler, backend=None if model else backend)
+        wall_time = time.perf_counter() - start
+
+    stages = {record['stage']: {'wall_time': record['wall_time'], 'fps': record['fps'],
+                                'peak_rss_mb': record['peak_rss_mb']}
+              for record in profiler.stages}
+    stages['total'] = {'wall_time': wall_time, 'fps': n_frames / wall_time, 'peak_rss_mb': peak_rss_mb()}
+    return stages
+
+
+def run_benchmark(n_frames, seed=0, repeat=1, backend='fake', model_path=None):
+    """
+    Benchmarks the pipeline on one synthetic clip length with one detector backend.
+
+    Each repetition runs in a new process; the fastest wall time and the lowest
+    peak RSS of every stage are kept.
+
+    Returns:
+        dict: stage name -> {'wall_time', 'fps', 'peak_rss_mb'}, including 'total'.
+    """
+    best = {}
+    context = multiprocessing.get_context('spawn')
+    for _ in range(repeat):
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            stages = executor.submit(_run_pipeline, n_frames, seed, backend, model_path).result()
+
+        for name, result in stages.items():
+            if name not in best or result['wall_time'] < best[name]['wall_time']:
+                peak_rss = best.get(name, result)['peak_rss_mb']
+                best[name] = dict(result)
+                if peak_rss is not None and result['peak_rss_mb'] is not None:
+                    best[name]['peak_rss_mb'] = min(peak_rss, result['peak_rss_mb'])
+    return best
+
+
+def find_regressions(results, baseline, tolerance=0.2):
+    """
+    Stages that got slower or used more memory than in the baseline.
+
+    Args:
+        results (dict): Run name (str, see `main`) -> stage results, as from
+            `run_benchmark`.
+        baseline (dict): Results of an earlier run in the same format.
+        tolerance (float): Allowed relative change before a stage is flagged.
+
+    Returns:
+        List[str]: One description per regression.
+    """
+    regressions = []
+    for run, stages in results.items():
+        for name, result in stages.items():
+            reference = baseline.get(run, {}).get(name)
+            if reference is None:
+                continue
+            if reference['fps'] and result['fps'] and result['fps'] < reference['fps'] * (1 - tolerance):
+                regressions.append(f"{run} / {name}: {result['fps']:.1f} fps "
+                                   f"(baseline {reference['fps']:.1f} fps)")
+            if (reference['peak_rss_mb'] and result['peak_rss_mb']
+                    and result['peak_rss_mb'] > reference['peak_rss_mb'] * (1 + tolerance)):
+                regressions.append(f"{run} / {name}: peak RSS {result['peak_rss_mb']:.0f} MiB "
+                                   f"(baseline {reference['peak_rss_mb']:.0f} MiB)")
+    return regressions
+
+
+def format_results(results):
+    lines = [f"{'run':>16} {'stage':<20} {'wall (s)':>9} {'fps':>9} {'peak RSS (MiB)':>15}"]
+    for run, stages in results.items():
+        for name, result in stages.items():
+            fps = f"{result['fps']:.1f}" if result['fps'] else '-'
+            peak_rss = f"{result['peak_rss_mb']:.0f}" if result['peak_rss_mb'] else '-'
+            lines.append(f"{run:>16} {name:<20} {result['wall_time']:>9.3f} {fps:>9} {peak_rss:>15}")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--lengths', type=int, nargs='+', default=[250, 1000], help='Clip lengths in frames')
+    parser.add_argument('--repeat', type=int, default=1, help='Runs per clip length; the fastest is kept')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='Baseline results (JSON)')
+    parser.add_argument('--save-baseline', action='store_true', help='Store these results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Relative slowdown or memory growth to flag')
+    parser.add_argument('--output', help='Also write the results to this JSON file')
+    parser.add_argument('--detectors', nargs='+', default=['fake'],
+                        help="Detector backends as 'fake' or '<backend>=<weights>', e.g. onnx=models/best.onnx")
+    args = parser.parse_args(argv)
+
+    # Runs are named by clip length, plus the backend for real detectors
+    results = {}
+    for detector in args.detectors:
+        backend, _, model_path = detector.partition('=')
+        for n_frames in args.lengths:
+            name = str(n_frames) if backend == 'fake' else f"{n_frames}-{backend}"
+            results[name] = run_benchmark(n_frames, args.seed, args.repeat, backend, model_path or None)
+    print(format_results(results))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one")
+        return 0
+
+    with open(args.baseline) as f:
+        regressions = find_regressions(results, json.load(f), args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
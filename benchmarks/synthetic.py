@@ -0,0 +1,127 @@
+import cv2
+import numpy as np
+
+CLASS_NAMES = {0: 'ball', 1: 'goalkeeper', 2: 'player', 3: 'referee'}
+
+TEAM_COLORS = [((30, 30, 200), (240, 240, 240)), ((200, 60, 20), (20, 20, 20))]
+REFEREE_COLORS = ((0, 220, 220), (20, 20, 20))
+PITCH_COLOR = (40, 140, 40)
+
+
+class SyntheticMatch:
+    """
+    Deterministic synthetic broadcast clip with known object boxes.
+
+    Two teams of players (shirt and shorts colors), a referee and a ball move over a
+    green pitch while the camera pans back and forth. Textured stripes sit where
+    `CameraMovementEstimator` looks for features, so camera movement is measurable.
+    `detections(frame_num)` returns what a perfect detector would report, plus the
+    occasional missed or spurious ball, for `FakeDetector`.
+    """
+
+    def __init__(self, n_frames, frame_size=(1920, 1080), n_players=22, fps=24, seed=0, pan_amplitude=200):
+        self.n_frames = n_frames
+        self.width, self.height = frame_size
+        self.n_players = n_players
+        self.fps = fps
+        self.seed = seed
+        self.pan_amplitude = pan_amplitude
+
+        rng = np.random.default_rng(seed)
+        frames = np.arange(n_frames)[:, None]
+
+        # Camera pans back and forth over a background wider than the frame
+        self.pan = np.round(pan_amplitude * (1 - np.cos(2 * np.pi * np.arange(n_frames) / (10 * fps))) / 2)
+        self.pan = self.pan.astype(np.int64)
+
+        self.background = np.empty((self.height, self.width + pan_amplitude + 1, 3), dtype=np.uint8)
+        self.background[:] = PITCH_COLOR
+        texture = rng.integers(0, 200, (self.height, self.background.shape[1]), dtype=np.uint8)
+        for start, stop in ((0, 60), (850, 1150 + pan_amplitude)):
+            self.background[:, start:stop] = texture[:, start:stop, None]
+
+        # Players drift around a home position in world (background) coordinates
+        n_objects = n_players + 1
+        home = np.column_stack([rng.uniform(200, self.width + pan_amplitude - 200, n_objects),
+                                rng.uniform(250, self.height - 150, n_objects)])
+        phase = rng.uniform(0, 2 * np.pi, (n_objects, 2))
+        period = rng.uniform(4, 12, (n_objects, 2)) * fps
+        radius = rng.uniform(20, 120, (n_objects, 2))
+        self.object_feet = home[None] + radius[None] * np.sin(2 * np.pi * frames[..., None] / period[None]
+                                                              + phase[None])
+
+        # The ball travels between players, switching target every two seconds
+        holder = rng.integers(0, n_players, n_frames // (2 * fps) + 2)
+        segment = np.arange(n_frames) // (2 * fps)
+        t = (np.arange(n_frames) % (2 * fps)) / (2 * fps)
+        start = self.object_feet[np.arange(n_frames), holder[segment]]
+        stop = self.object_feet[np.arange(n_frames), holder[segment + 1]]
+        self.ball = start + np.clip(2 * t, 0, 1)[:, None] * (stop - start) + [[15, -5]]
+
+        self.ball_visible = rng.random(n_frames) > 0.05
+        self.spurious_ball = rng.random(n_frames) < 0.05
+        self.spurious_position = np.column_stack([rng.uniform(0, self.width, n_frames),
+                                                  rng.uniform(0, self.height, n_frames)])
+
+    def _object_boxes(self, frame_num):
+        feet = self.object_feet[frame_num] - [self.pan[frame_num], 0]
+        return np.column_stack([feet[:, 0] - 20, feet[:, 1] - 90, feet[:, 0] + 20, feet[:, 1]])
+
+    def _ball_box(self, frame_num):
+        x, y = self.ball[frame_num] - [self.pan[frame_num], 0]
+        return np.array([x - 7, y - 7, x + 7, y + 7])
+
+    def detections(self, frame_num):
+        """
+        Boxes that a detector should report in a frame.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: (N, 4) xyxy boxes, (N,)
+            confidences and (N,) class ids (see `CLASS_NAMES`).
+        """
+        boxes = self._object_boxes(frame_num)
+        class_id = np.full(len(boxes), 2)
+        class_id[0] = 1
+        class_id[-1] = 3
+        confidence = np.full(len(boxes), 0.85)
+
+        visible = (boxes[:, 2] > 0) & (boxes[:, 0] < self.width)
+        boxes, class_id, confidence = boxes[visible], class_id[visible], confidence[visible]
+
+        if self.ball_visible[frame_num]:
+            boxes = np.vstack([boxes, self._ball_box(frame_num)])
+            class_id = np.append(class_id, 0)
+            confidence = np.append(confidence, 0.6)
+        if self.spurious_ball[frame_num]:
+            x, y = self.spurious_position[frame_num]
+            boxes = np.vstack([boxes, [x - 7, y - 7, x + 7, y + 7]])
+            class_id = np.append(class_id, 0)
+            confidence = np.append(confidence, 0.3)
+
+        return boxes.astype(np.float32), confidence.astype(np.float32), class_id
+
+    def frames(self):
+        """Yields the rendered BGR frames."""
+        for frame_num in range(self.n_frames):
+            pan = self.pan[frame_num]
+            frame = self.background[:, pan:pan + self.width].copy()
+
+            for index, box in enumerate(np.round(self._object_boxes(frame_num)).astype(int).tolist()):
+                x1, y1, x2, y2 = box
+                shirt, shorts = REFEREE_COLORS if index == self.n_players else TEAM_COLORS[index % 2]
+                cv2.rectangle(frame, (x1, y1), (x2, (y1 + y2) // 2), shirt, cv2.FILLED)
+                cv2.rectangle(frame, (x1, (y1 + y2) // 2), (x2, y2), shorts, cv2.FILLED)
+
+            x, y = np.round(self.ball[frame_num] - [pan, 0]).astype(int).tolist()
+            cv2.circle(frame, (x, y), 7, (255, 255, 255), cv2.FILLED)
+
+            yield frame
+
+    def write(self, output_video_path):
+        out = cv2.VideoWriter(output_video_path, cv2.VideoWriter.fourcc(*'mp4v'), self.fps,
+                              (self.width, self.height))
+        try:
+            for frame in self.frames():
+                out.write(frame)
+        finally:
+            out.release()
@@ -1,13 +1,25 @@
-import pickle
-import os
+from concurrent.futures import ProcessPoolExecutor
 import cv2
 import numpy as np
-from utils.bbox_utils import measure_distance, measure_xy_distance
+from tracker.track_table import TrackTable
+from utils.frame_store import FrameStore
+from utils.profiling import get_profiler
+from utils.renderer import draw_panel
+from utils.video_utils import get_video_info, iter_video
+
+
+def _estimate_chunk(estimator, video_path, warm_start, start, stop):
+    # Frames before `start` only warm up the tracked features and are discarded
+    camera_movement = estimator._estimate_camera_movement(iter_video(video_path, warm_start, stop))
+    return camera_movement[start - warm_start:]
 
 
 class CameraMovementEstimator:
     def __init__(self, frame):
         self.minimum_distance = 5
+        # Optical flow can run on a downscaled grayscale frame (e.g. 0.5); movements are
+        # always reported in full-resolution pixels
+        self.downscale = 1.0
 
         first_frame_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
         mask_features= np.zeros_like(first_frame_gray)
@@ -28,69 +40,175 @@ class CameraMovementEstimator:
             criteria= (cv2.TERM_CRITERIA_EPS|cv2.TERM_CRITERIA_COUNT, 10, 0.03)
         )
 
-    def adjust_track_positions(self, tracks, camera_movement_per_frame):
-        for object, object_tracks in tracks.items():
-            for frame_num, track in enumerate(object_tracks):
-                for track_id, track_info in track.items():
-                    position = track_info['position']
-                    camera_movement = camera_movement_per_frame[frame_num]
-                    position_adjusted= (position[0]-camera_movement[0], position[1]-camera_movement[1])
-                    tracks[object][frame_num][track_id]['position_adjusted']= position_adjusted
-
-    def get_camera_movement(self, frames, read_from_stub=False, stub_path=None):
-        if read_from_stub and stub_path is not None and os.path.exists(stub_path):
-            with open(stub_path, 'rb') as f:
-                camera_movement = pickle.load(f)
-            return camera_movement
+    def adjust_table_positions(self, table, camera_movement_per_frame):
+        camera_movement = np.asarray(camera_movement_per_frame, dtype=np.float32).reshape(-1, 2)
+        table.position_adjusted = table.position - camera_movement[table.frame]
 
-        camera_movement = [[0,0]]* len(frames)
-        old_gray = cv2.cvtColor(frames[0], cv2.COLOR_BGR2GRAY)
-        old_features= cv2.goodFeaturesToTrack(old_gray, **self.features)
+    def adjust_track_positions(self, tracks, camera_movement_per_frame):
+        table = TrackTable.from_tracks(tracks)
+        self.adjust_table_positions(table, camera_movement_per_frame)
+        table.update_tracks(tracks)
+
+    def get_camera_movement(self, frames, cache=None, video_path=None, n_workers=1, chunk_size=1000, overlap=10):
+        """
+        Per-frame camera movement (x, y) in pixels.
+
+        With `n_workers > 1` the video at `video_path` is split into chunks of
+        `chunk_size` frames estimated in parallel processes; each chunk starts
+        `overlap` frames early so its tracked features are warmed up before the
+        first frame it reports. Because features are re-detected at each chunk's
+        start, movements close to chunk boundaries can differ slightly from a
+        sequential run.
+        """
+        params = {
+            'features': self.features,
+            'lk_params': self.lk_params,
+            'minimum_distance': self.minimum_distance,
+            'downscale': self.downscale,
+        }
+        if n_workers > 1:
+            params.update(chunk_size=chunk_size, overlap=overlap)
+
+        if cache is not None:
+            cache_key = cache.key('camera_movement', files=[video_path], params=params)
+            arrays = cache.load(cache_key)
+            if arrays is not None:
+                return arrays['camera_movement'].tolist()
+
+        if n_workers > 1:
+            camera_movement = self._estimate_camera_movement_parallel(video_path, n_workers, chunk_size, overlap)
+        else:
+            camera_movement = self._estimate_camera_movement(frames)
+
+        if cache is not None:
+            cache.save(cache_key, {'camera_movement': np.array(camera_movement, dtype=np.float32)})
 
-        for frame_num in range(1, len(frames)):
-            frame_gray=cv2.cvtColor(frames[frame_num], cv2.COLOR_BGR2GRAY)
-            new_features, _,_ = cv2.calcOpticalFlowPyrLK(old_gray, frame_gray, old_features, None, **self.lk_params)
+        return camera_movement
 
-            max_distance=0
-            camera_movement_x, camera_movement_y= 0,0
+    def _estimate_camera_movement_parallel(self, video_path, n_workers, chunk_size, overlap):
+        _, _, _, frame_count = get_video_info(video_path)
+        starts = list(range(0, max(frame_count, 1), chunk_size))
+        # The container's frame count can be approximate, so the last chunk reads to the end
+        stops = starts[1:] + [None]
 
-            for i, (new, old) in enumerate(zip(new_features, old_features)):
-                new_features_point= new.ravel()
-                old_features_point= old.ravel()
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            futures = [executor.submit(_estimate_chunk, self, video_path, max(0, start - overlap), start, stop)
+                       for start, stop in zip(starts, stops)]
+            camera_movement = []
+            for future in futures:
+                camera_movement += future.result()
 
-                distance = measure_distance(new_features_point, old_features_point)
+        return camera_movement
 
-                if distance > max_distance:
-                    max_distance = distance
-                    camera_movement_x, camera_movement_y = measure_xy_distance(new_features_point, old_features_point)
+    def _to_gray(self, frame):
+        if frame.ndim == 2:
+            # Already converted and downscaled, e.g. by a FrameStore's grayscale plane
+            return frame
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if self.downscale != 1:
+            gray = cv2.resize(gray, None, fx=self.downscale, fy=self.downscale, interpolation=cv2.INTER_AREA)
+        return gray
+
+    def _max_displacement(self, new_features, old_features):
+        displacement = (new_features - old_features).reshape(-1, 2)
+        if len(displacement) == 0:
+            return np.zeros(2)
+        distances = np.linalg.norm(displacement, axis=1)
+        return displacement[np.argmax(distances)].astype(np.float64)
+
+    def start(self, frame):
+        """Starts incremental estimation on a frame stream; `frame` has no movement."""
+        self._old_gray = self._to_gray(frame)
+
+        mask = self.features['mask']
+        if mask.shape != self._old_gray.shape:
+            height, width = self._old_gray.shape
+            mask = cv2.resize(mask, (width, height), interpolation=cv2.INTER_NEAREST)
+        self._features = dict(self.features, mask=mask)
+
+        self._old_features = cv2.goodFeaturesToTrack(self._old_gray, **self._features)
+        return [0, 0]
+
+    def update(self, frame):
+        """Camera movement between the previous frame of the stream and `frame`."""
+        frame_gray = self._to_gray(frame)
+
+        if self._old_features is None:
+            # Nothing to track in the previous frame; look for features again
+            self._old_features = cv2.goodFeaturesToTrack(frame_gray, **self._features)
+            self._old_gray = frame_gray
+            return [0, 0]
+
+        with get_profiler().section('camera_movement.optical_flow', frames=1):
+            new_features, _, _ = cv2.calcOpticalFlowPyrLK(self._old_gray, frame_gray, self._old_features, None,
+                                                          **self.lk_params)
+
+        camera_movement = [0, 0]
+        movement = self._max_displacement(new_features, self._old_features) / self.downscale
+        if np.hypot(movement[0], movement[1]) > self.minimum_distance:
+            camera_movement = movement.tolist()
+            self._old_features = cv2.goodFeaturesToTrack(self._old_gray, **self._features)
+
+        self._old_gray = frame_gray
+        return camera_movement
 
-            if max_distance > self.minimum_distance:
-                camera_movement[frame_num] = camera_movement_x, camera_movement_y
-                old_features = cv2.goodFeaturesToTrack(old_gray, **self.features)
+    def estimate_video(self, video_path, checkpoint, chunk_size=1000, read_ahead=0):
+        """
+        Camera movement of every frame of a video, saving the movements and the
+        optical-flow state to `checkpoint` after every `chunk_size` frames. When the
+        checkpoint holds chunks of an interrupted run, estimation resumes after them.
+
+        `video_path` can also be a `FrameStore`, whose grayscale plane is used when it
+        was stored at this estimator's `downscale`.
+        """
+        def read(start):
+            if isinstance(video_path, FrameStore) and video_path.gray_downscale == self.downscale:
+                return video_path.iter_gray(start)
+            return iter_video(video_path, start, read_ahead=read_ahead)
+
+        if checkpoint.state is None:
+            frames = read(0)
+            first_frame = next(frames, None)
+            if first_frame is None:
+                return []
+            chunk, stop = [self.start(first_frame)], 1
+        else:
+            stop = checkpoint.state['stop']
+            self._old_gray, self._old_features, self._features = checkpoint.state['flow']
+            frames = read(stop)
+            chunk = []
+
+        def save():
+            checkpoint.save({'camera_movement': np.array(chunk, dtype=np.float32).reshape(-1, 2)},
+                            {'stop': stop, 'flow': (self._old_gray, self._old_features, self._features)})
+
+        for frame in frames:
+            chunk.append(self.update(frame))
+            stop += 1
+            if len(chunk) == chunk_size:
+                save()
+                chunk = []
+        if chunk:
+            save()
+
+        return checkpoint.concatenate('camera_movement', np.empty((0, 2), dtype=np.float32)).tolist()
+
+    def _estimate_camera_movement(self, frames):
+        frames = iter(frames)
+        camera_movement = [self.start(next(frames))]
+        for frame in frames:
+            camera_movement.append(self.update(frame))
+        return camera_movement
 
-            old_gray = frame_gray.copy()
+    def draw_frame_camera_movement(self, frame, frame_num, camera_movement_per_frame):
+        draw_panel(frame, (0,0), (500, 100), (255,255,255), 0.6)
 
-        if stub_path is not None:
-            with open(stub_path, 'wb') as f:
-                pickle.dump(camera_movement, f)
+        x_movement, y_movement = camera_movement_per_frame[frame_num]
+        frame = cv2.putText(frame, f"Camera Movement X: {x_movement:.2f}", (10,30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0,0,0), 3 )
+        frame = cv2.putText(frame, f"Camera Movement Y: {y_movement:.2f}", (10,60), cv2.FONT_HERSHEY_SIMPLEX, 1, (0,0,0), 3 )
 
-        return camera_movement
+        return frame
 
     def draw_camera_movement(self, frames, camera_movement_per_frame):
-        output_frames= []
-
         for frame_num, frame in enumerate(frames):
-            frame= frame.copy()
-
-            overlay= frame.copy()
-            cv2.rectangle(overlay, (0,0), (500, 100), (255,255,255), -1)
-            alpha = 0.6
-            cv2.addWeighted(overlay, alpha, frame, 1 - alpha, 0, frame)
-
-            x_movement, y_movement = camera_movement_per_frame[frame_num]
-            frame = cv2.putText(frame, f"Camera Movement X: {x_movement:.2f}", (10,30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0,0,0), 3 )
-            frame = cv2.putText(frame, f"Camera Movement Y: {y_movement:.2f}", (10,60), cv2.FONT_HERSHEY_SIMPLEX, 1, (0,0,0), 3 )
-
-            output_frames.append(frame)
-
-        return output_frames
+            yield self.draw_frame_camera_movement(frame.copy(), frame_num, camera_movement_per_frame)
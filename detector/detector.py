@@ -0,0 +1,228 @@
+import ast
+import cv2
+import numpy as np
+import supervision as sv
+from utils.profiling import get_profiler
+
+
+class Detector:
+    """
+    Object detector run on batches of BGR frames.
+
+    Backends implement `_detect` and set `class_names` (class id -> name).
+    Detections are kept when their confidence reaches the threshold of their class
+    in `class_conf`, or `conf` for the other classes; the backend is asked for
+    everything above the lowest of these thresholds.
+    """
+    name = None
+
+    # Attributes that change the detections, and so are part of the tracks cache key
+    PARAMS = ('input_size', 'conf', 'class_conf')
+
+    def __init__(self):
+        self.input_size = 640
+        self.conf = 0.1
+        # Class name -> threshold, e.g. {"ball": 0.05, "referee": 0.3}
+        self.class_conf = {}
+        self.class_names = {}
+
+    def params(self):
+        return {name: getattr(self, name) for name in self.PARAMS}
+
+    def detect(self, frames, frame_nums=None):
+        """
+        Detections of a batch of frames.
+
+        `frame_nums`, the frames' positions in the video, is only used by backends
+        that replay known detections, such as the benchmark's fake detector.
+
+        Returns:
+            List[sv.Detections]: One per frame, with boxes in frame pixels.
+        """
+        min_conf = min([self.conf] + list(self.class_conf.values()))
+        detections = self._detect(frames, min_conf, frame_nums)
+        if not self.class_conf:
+            return detections
+
+        # Class ids need not be contiguous; ids without a name keep the default threshold
+        thresholds = np.full(max(self.class_names) + 1, self.conf)
+        for class_id, class_name in self.class_names.items():
+            thresholds[class_id] = self.class_conf.get(class_name, self.conf)
+        return [detection[detection.confidence >= thresholds[detection.class_id]] for detection in detections]
+
+    def _detect(self, frames, conf, frame_nums):
+        raise NotImplementedError
+
+    def detect_regions(self, frame, regions, frame_num=None):
+        """
+        Detections in crops of a frame, each scaled up to the detector's input size.
+
+        Args:
+            frame (np.ndarray): The frame.
+            regions (List[Tuple[int, int, int, int]]): (x1, y1, x2, y2) crops, of
+                the same size when there are several.
+            frame_num (Optional[int]): The frame's position in the video.
+
+        Returns:
+            List[sv.Detections]: One per region, with boxes in frame pixels.
+        """
+        crops = [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in regions]
+        detections = self.detect(crops, None if frame_num is None else [frame_num] * len(crops))
+        for (x1, y1, _, _), detection in zip(regions, detections):
+            detection.xyxy = detection.xyxy + np.array([x1, y1, x1, y1], dtype=np.float32)
+        return detections
+
+    def letterbox(self, frames):
+        """
+        Resizes a batch of same-sized frames into one (N, 3, size, size) float32 RGB
+        tensor, keeping the aspect ratio and padding with grey. The scale and padding
+        are computed once for the whole batch.
+
+        Returns:
+            Tuple[np.ndarray, float, np.ndarray]: The tensor, the scale and the (x, y)
+            padding, so that `frame_xy = (tensor_xy - padding) / scale`.
+        """
+        size = self.input_size
+        height, width = frames[0].shape[:2]
+        scale = min(size / height, size / width)
+        new_width, new_height = round(width * scale), round(height * scale)
+        pad_x, pad_y = (size - new_width) // 2, (size - new_height) // 2
+
+        batch = np.full((len(frames), size, size, 3), 114, dtype=np.uint8)
+        for image, frame in zip(batch, frames):
+            image[pad_y:pad_y + new_height, pad_x:pad_x + new_width] = cv2.resize(
+                frame, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+
+        # BGR HWC uint8 -> RGB CHW float in a single pass over the batch
+        tensor = np.ascontiguousarray(batch[..., ::-1].transpose(0, 3, 1, 2), dtype=np.float32)
+        tensor /= 255
+        return tensor, scale, np.array([pad_x, pad_y, pad_x, pad_y], dtype=np.float32)
+
+
+class UltralyticsDetector(Detector):
+    """
+    Runs a YOLO model through ultralytics, which does its own preprocessing.
+
+    Any object with YOLO's predict() interface can be passed as `model`.
+    """
+    name = 'ultralytics'
+
+    def __init__(self, model_path=None, model=None, n_threads=None):
+        super().__init__()
+        if n_threads is not None:
+            import torch
+            torch.set_num_threads(n_threads)
+        if model is None:
+            from ultralytics import YOLO
+            model = YOLO(model_path)
+        self.model = model
+        self.class_names = dict(getattr(model, 'names', None) or {})
+
+    def _detect(self, frames, conf, frame_nums):
+        results = self.model.predict(frames, conf=conf, imgsz=self.input_size)
+        if results:
+            self.class_names = results[0].names
+        return [sv.Detections.from_ultralytics(result) for result in results]
+
+
+class OnnxDetector(Detector):
+    """
+    Runs a YOLO model exported to ONNX (`yolo export format=onnx`) with ONNX
+    Runtime on the CPU.
+
+    The export's output (N, 4 + classes, anchors) is decoded here and reduced with
+    per-class non-maximum suppression. With a static input shape in the export,
+    `input_size` is taken from the model.
+    """
+    name = 'onnx'
+
+    def __init__(self, model_path, providers=('CPUExecutionProvider',), n_threads=None):
+        super().__init__()
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        if n_threads is not None:
+            options.intra_op_num_threads = n_threads
+        self.session = onnxruntime.InferenceSession(model_path, sess_options=options, providers=list(providers))
+        self.iou = 0.7
+
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        batch_size, _, height, _ = model_input.shape
+        # Exports without dynamic axes only accept batches of their own size
+        self.model_batch_size = batch_size if isinstance(batch_size, int) else None
+        if isinstance(height, int):
+            self.input_size = height
+
+        names = self.session.get_modelmeta().custom_metadata_map.get('names')
+        if names is None:
+            raise ValueError(f"{model_path} has no class names in its metadata; export it with ultralytics")
+        self.class_names = ast.literal_eval(names)
+
+    def _detect(self, frames, conf, frame_nums):
+        with get_profiler().section('detection.letterbox', frames=len(frames)):
+            tensor, scale, padding = self.letterbox(frames)
+
+        step = self.model_batch_size or len(frames)
+        outputs = []
+        for start in range(0, len(frames), step):
+            batch = tensor[start:start + step]
+            if len(batch) < step:
+                batch = np.concatenate([batch, np.zeros((step - len(batch),) + batch.shape[1:], batch.dtype)])
+            outputs.append(self.session.run(None, {self.input_name: batch})[0])
+        predictions = np.concatenate(outputs)[:len(frames)].transpose(0, 2, 1)
+
+        return [self._decode(prediction, conf, scale, padding, frame.shape) for prediction, frame in
+                zip(predictions, frames)]
+
+    def _decode(self, prediction, conf, scale, padding, frame_shape):
+        scores = prediction[:, 4:]
+        class_id = scores.argmax(axis=1)
+        confidence = scores[np.arange(len(scores)), class_id]
+        keep = confidence >= conf
+        xywh, class_id, confidence = prediction[keep, :4], class_id[keep], confidence[keep]
+
+        xyxy = np.concatenate([xywh[:, :2] - xywh[:, 2:] / 2, xywh[:, :2] + xywh[:, 2:] / 2], axis=1)
+        xyxy = (xyxy - padding) / scale
+        height, width = frame_shape[:2]
+        xyxy = np.clip(xyxy, 0, [width, height, width, height]).astype(np.float32)
+
+        if len(xyxy):
+            boxes = np.concatenate([xyxy[:, :2], xyxy[:, 2:] - xyxy[:, :2]], axis=1)
+            kept = cv2.dnn.NMSBoxesBatched(boxes.tolist(), confidence.tolist(), class_id.tolist(), conf, self.iou)
+            kept = np.asarray(kept, dtype=np.int64).reshape(-1)
+            xyxy, class_id, confidence = xyxy[kept], class_id[kept], confidence[kept]
+
+        return sv.Detections(xyxy=xyxy.reshape(-1, 4), confidence=confidence.astype(np.float32),
+                             class_id=class_id.astype(int),
+                             data={'class_name': np.array([self.class_names[i] for i in class_id], dtype=str)})
+
+
+BACKENDS = {
+    UltralyticsDetector.name: UltralyticsDetector,
+    OnnxDetector.name: OnnxDetector,
+}
+
+
+def load_detector(model_path=None, model=None, backend=None, n_threads=None):
+    """
+    The detector for `model_path` or `model`.
+
+    Args:
+        model_path (Optional[str]): Weights to load; '.onnx' files default to the
+            ONNX Runtime backend and anything else to ultralytics.
+        model (Optional): A `Detector`, used as is, or an object with YOLO's
+            predict() interface, run through the ultralytics backend.
+        backend (Optional[str]): A name in `BACKENDS` overriding the default.
+        n_threads (Optional[int]): CPU threads for inference.
+    """
+    if isinstance(model, Detector):
+        return model
+    if model is not None:
+        return UltralyticsDetector(model=model)
+
+    if backend is None:
+        backend = OnnxDetector.name if str(model_path).lower().endswith('.onnx') else UltralyticsDetector.name
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown detector backend '{backend}'; choose from {sorted(BACKENDS)}")
+    return BACKENDS[backend](model_path, n_threads=n_threads)
@@ -0,0 +1,253 @@
+import os
+import shutil
+import numpy as np
+from tracker.track_table import COLUMNS, METRIC_COLUMNS, OBJECT_CLASSES, TrackTable
+from utils.video_utils import DEFAULT_FPS
+
+DATASETS = ('tracks', 'possession')
+
+# TrackTable columns with two values per row are exported as one column per axis
+VECTOR_COLUMNS = {
+    'bbox': ('x1', 'y1', 'x2', 'y2'),
+    'position': ('position_x', 'position_y'),
+    'position_adjusted': ('position_adjusted_x', 'position_adjusted_y'),
+    'position_transformed': ('pitch_x', 'pitch_y'),
+}
+
+
+def _partitioning():
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    return ds.partitioning(pa.schema([('match', pa.string()), ('period', pa.int32())]), flavor='hive')
+
+
+class ParquetExporter:
+    """
+    Streams tracks, pitch positions, teams, kinematics and possession into Parquet
+    datasets that can be scanned by column, match, period and frame range.
+
+    Two datasets are written under `root`:
+
+    - `tracks`: one row per object and frame, with the frame, its time in seconds,
+      the object ('players', 'referees' or 'ball'), track id, bounding box,
+      pixel, camera-adjusted and pitch (meters) positions, team, `has_ball` and the
+      `SpeedAndDistanceEstimator` metrics.
+    - `possession`: one row per frame, with the ball holder's track id, the team in
+      control and each team's overall and rolling possession share.
+
+    Both are partitioned Hive-style as `<dataset>/match=<match>/period=<period>/`,
+    with periods starting at the frames in `period_starts`. Frames are buffered and
+    written as one row group per `chunk_size` frames (and period), sorted by frame,
+    so readers skip row groups outside a frame range from their statistics.
+
+    A match is written next to its previous export and swapped in on `close`, so
+    readers never see a half-written match. Use as a context manager, or call
+    `close`.
+
+    Args:
+        root (str): Directory of the datasets.
+        match (str): Match identifier, e.g. the video's name.
+        period_starts (Sequence[int]): First frame of each period, periods being
+            numbered from 1.
+        fps (float): Frame rate of the video, for the time column.
+        chunk_size (int): Frames per row group.
+        compression (str): Parquet compression codec.
+    """
+
+    def __init__(self, root, match, period_starts=(0,), fps=DEFAULT_FPS, chunk_size=1000, compression='zstd'):
+        if '/' in str(match) or os.sep in str(match):
+            raise ValueError(f"Match id {match!r} cannot contain a path separator")
+        self.root = root
+        self.match = str(match)
+        self.period_starts = np.asarray(period_starts, dtype=np.int64)
+        self.fps = fps if fps > 0 else DEFAULT_FPS
+        self.chunk_size = chunk_size
+        self.compression = compression
+
+        # Hidden directories are ignored by dataset discovery until they are renamed
+        self._tmp_dirs = {dataset: os.path.join(root, dataset, f".match={self.match}.tmp") for dataset in DATASETS}
+        for directory in self._tmp_dirs.values():
+            shutil.rmtree(directory, ignore_errors=True)
+        self._writers = {}
+        self._buffers = {dataset: [] for dataset in DATASETS}
+        self._buffered_frames = 0
+
+    def write(self, table, possession, ball_holders, frame_offset=0):
+        """
+        Adds the frames of `table` to the export.
+
+        Args:
+            table (TrackTable): Rows of consecutive frames; its frame `f` is frame
+                `frame_offset + f` of the video.
+            possession (PossessionAnalytics): Possession of the video so far,
+                still keeping every frame of `table`.
+            ball_holders (np.ndarray): (table.n_frames,) track id of the player with
+                the ball in each frame, -1 for none.
+            frame_offset (int): Video frame of the table's first frame.
+        """
+        frames = frame_offset + np.arange(table.n_frames)
+        tracks = {'frame': (table.frame + frame_offset).astype(np.int32),
+                  'object': table.object_class, 'track_id': table.track_id}
+        for name in COLUMNS:
+            if name in VECTOR_COLUMNS:
+                for axis, column in enumerate(VECTOR_COLUMNS[name]):
+                    tracks[column] = getattr(table, name)[:, axis]
+            elif name not in ('frame', 'track_id', 'object_class'):
+                tracks[name] = getattr(table, name)
+
+        frame_possession = {'frame': frames.astype(np.int32), 'ball_holder': np.asarray(ball_holders, np.int32),
+                            'team': np.array([possession.team(f) for f in frames], dtype=np.int8)}
+        shares = np.array([possession.possession(f) for f in frames]).reshape(-1, len(possession.teams))
+        rolling = np.array([possession.rolling_possession(f) for f in frames]).reshape(-1, len(possession.teams))
+        for i, team in enumerate(possession.teams):
+            frame_possession[f'possession_{team}'] = shares[:, i].astype(np.float32)
+            frame_possession[f'rolling_possession_{team}'] = rolling[:, i].astype(np.float32)
+
+        self._buffers['tracks'].append(tracks)
+        self._buffers['possession'].append(frame_possession)
+        self._buffered_frames += table.n_frames
+        if self._buffered_frames >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Writes the buffered frames, as row groups of at most `chunk_size` frames."""
+        if self._buffered_frames == 0:
+            return
+        for dataset, buffer in self._buffers.items():
+            columns = {name: np.concatenate([chunk[name] for chunk in buffer]) for name in buffer[0]}
+            buffer.clear()
+
+            # Tables of a whole video are split here into row groups of chunk_size frames
+            frames = columns['frame']
+            chunk = (frames - frames.min()) // self.chunk_size
+            period = np.searchsorted(self.period_starts, frames, side='right')
+            groups = chunk * (len(self.period_starts) + 1) + period
+            order = np.argsort(groups, kind='stable')
+            starts = np.flatnonzero(np.r_[True, groups[order][1:] != groups[order][:-1]])
+            for rows in np.split(order, starts[1:]):
+                if len(rows):
+                    self._write_rows(dataset, int(period[rows[0]]), {name: values[rows] for name, values in
+                                                                     columns.items()})
+        self._buffered_frames = 0
+
+    def _write_rows(self, dataset, period, columns):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        # Rows arrive sorted by frame, which keeps each row group's frame statistics tight
+        arrays = {'frame': pa.array(columns['frame']), 'time': pa.array(columns['frame'] / self.fps)}
+        for name, values in columns.items():
+            if name == 'frame':
+                continue
+            if name == 'object':
+                arrays[name] = pa.DictionaryArray.from_arrays(pa.array(values.astype(np.int8)),
+                                                              pa.array(OBJECT_CLASSES))
+            else:
+                # NaN (not computed) is stored as null
+                arrays[name] = pa.array(values, from_pandas=values.dtype.kind == 'f')
+        table = pa.table(arrays)
+
+        key = (dataset, period)
+        if key not in self._writers:
+            directory = os.path.join(self._tmp_dirs[dataset], f"period={period}")
+            os.makedirs(directory, exist_ok=True)
+            self._writers[key] = pq.ParquetWriter(os.path.join(directory, 'part-0.parquet'), table.schema,
+                                                  compression=self.compression)
+        self._writers[key].write_table(table, row_group_size=len(table))
+
+    def close(self):
+        """Writes what is left and replaces the match's previous export."""
+        self.flush()
+        for writer in self._writers.values():
+            writer.close()
+        self._writers = {}
+
+        for dataset, tmp_dir in self._tmp_dirs.items():
+            directory = os.path.join(self.root, dataset, f"match={self.match}")
+            if os.path.exists(directory):
+                shutil.rmtree(directory)
+            if os.path.exists(tmp_dir):
+                os.replace(tmp_dir, directory)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+            return
+        # Keep the previous export of the match rather than a partial one
+        for writer in self._writers.values():
+            writer.close()
+        for tmp_dir in self._tmp_dirs.values():
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def read_dataset(root, dataset='tracks', columns=None, match=None, period=None, start_frame=None, stop_frame=None,
+                 filter=None):
+    """
+    Reads the rows of an exported dataset, scanning only the requested columns and
+    the files and row groups that can hold matching rows.
+
+    Args:
+        root (str): The exporter's root directory.
+        dataset (str): 'tracks' or 'possession'.
+        columns (Optional[List[str]]): Columns to read, all by default.
+        match (Optional[str]): Only this match.
+        period (Optional[int]): Only this period.
+        start_frame (Optional[int]): First frame to read.
+        stop_frame (Optional[int]): Frame to stop before.
+        filter (Optional[pyarrow.compute.Expression]): Further row filter, e.g.
+            `pc.field('track_id') == 7`.
+
+    Returns:
+        pyarrow.Table: The rows, with `match` and `period` columns.
+    """
+    import pyarrow.dataset as ds
+
+    if dataset not in DATASETS:
+        raise ValueError(f"Unknown dataset '{dataset}'; choose from {list(DATASETS)}")
+
+    conditions = [] if filter is None else [filter]
+    if match is not None:
+        conditions.append(ds.field('match') == str(match))
+    if period is not None:
+        conditions.append(ds.field('period') == period)
+    if start_frame is not None:
+        conditions.append(ds.field('frame') >= start_frame)
+    if stop_frame is not None:
+        conditions.append(ds.field('frame') < stop_frame)
+
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+
+    parquet = ds.dataset(os.path.join(root, dataset), format='parquet', partitioning=_partitioning())
+    return parquet.to_table(columns=columns, filter=expression)
+
+
+def read_track_table(root, match, period=None, start_frame=None, stop_frame=None):
+    """
+    The exported tracks of a match as a `TrackTable`, e.g. to draw or analyse them
+    again with the pipeline's stages. Frames keep their numbers in the video.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    rows = read_dataset(root, 'tracks', match=match, period=period, start_frame=start_frame,
+                        stop_frame=stop_frame)
+
+    def values(name):
+        return rows.column(name).to_numpy(zero_copy_only=False)
+
+    frame = values('frame')
+    columns = {'frame': frame, 'track_id': values('track_id'),
+               'object_class': pc.index_in(rows.column('object').cast(pa.string()),
+                                           value_set=pa.array(OBJECT_CLASSES)).to_numpy(zero_copy_only=False)}
+    for name, axes in VECTOR_COLUMNS.items():
+        columns[name] = np.stack([values(axis) for axis in axes], axis=1)
+    for name in ('confidence', 'team', 'has_ball') + METRIC_COLUMNS:
+        columns[name] = values(name)
+
+    n_frames = stop_frame if stop_frame is not None else (int(frame.max()) + 1 if len(frame) else 0)
+    return TrackTable(n_frames, **columns)
@@ -1,105 +1,70 @@
-import cv2
-import numpy as np
-from player_ball_assigner.assigner import PlayerBallAssigner
-from utils.video_utils import read_video, save_video
-from tracker.tracker import Tracker
-from team_assigner.assigner import TeamAssigner
-from camera_movement.estimator import CameraMovementEstimator
-from view_transformer.view_transformer import ViewTransformer
-from speed_and_distance_estimator.estimator import SpeedAndDistanceEstimator
-
-
-def main():
-    # Load video
-    video_frames = read_video("input_vids/input.mp4")
-
-    # Initialize tracker
-    tracker = Tracker("models/best.pt")
-
-    # Get object tracks from the video
-    tracks = tracker.get_object_tracks(
-        video_frames,
-        read_from_stub=True,
-        stub_path="stubs/tracks.pkl"
-    )
-
-    # Add pixel positions to tracks
-    tracker.add_position_to_tracks(tracks)
-
-    # Initialize and apply camera movement estimation
-    camera_movement = CameraMovementEstimator(video_frames[0])
-    camera_movement_per_frame = camera_movement.get_camera_movement(
-        video_frames,
-        read_from_stub=True,
-        stub_path="stubs/camera_movement.pkl"
-    )
-    camera_movement.adjust_track_positions(tracks, camera_movement_per_frame)
-
-    # Apply view transformation for a bird's-eye view perspective
-    view_transformer = ViewTransformer()
-    view_transformer.add_transformed_position_to_tracks(tracks)
-
-    # Interpolate ball positions for smoother tracking
-    tracks['ball'] = tracker.interpolate_ball_positions(tracks['ball'])
-
-    # Initialize and apply speed, distance, and player load calculations
-    speed_and_distance_estimator = SpeedAndDistanceEstimator()
-    speed_and_distance_estimator.add_speed_and_distance_to_tracks(tracks)
-
-    # Assign team colors to players
-    team_assigner = TeamAssigner()
-    team_assigner.assign_team_color(video_frames[0], tracks['players'][0])
-    for frame_num, player_track in enumerate(tracks['players']):
-        for player_id, track in player_track.items():
-            team = team_assigner.get_player_team(
-                video_frames[frame_num],
-                track['bbox'],
-                player_id
-            )
-            tracks['players'][frame_num][player_id]['team'] = team
-            tracks['players'][frame_num][player_id]['team_color'] = team_assigner.team_colors[team]
-
-    # Assign ball possession
-    player_assigner = PlayerBallAssigner()
-    team_ball_control = []
-    for frame_num, player_track in enumerate(tracks['players']):
-        ball_bbox = tracks['ball'][frame_num][1]['bbox']
-        assigned_player = player_assigner.assign_ball(player_track, ball_bbox)
-
-        if assigned_player != -1:
-            tracks['players'][frame_num][assigned_player]['has_ball'] = True
-            team_ball_control.append(tracks['players'][frame_num][assigned_player]['team'])
-        else:
-            # Fall back to last known possession if it exists
-            if len(team_ball_control) > 0:
-                team_ball_control.append(team_ball_control[-1])
-            else:
-                team_ball_control.append(-1)
-    team_ball_control = np.array(team_ball_control)
-
-    # --- DRAWING AND SAVING ---
-
-    # Draw all annotations (ellipses, possession triangles, team control) onto the video frames
-    output_frames = tracker.draw_annotations(video_frames, tracks, team_ball_control)
-
-    # Draw camera movement arrows
-    output_frames = camera_movement.draw_camera_movement(output_frames, camera_movement_per_frame)
-
-    # Draw player metrics (speed, distance, acceleration, load) onto the video frames
-    output_frames = speed_and_distance_estimator.draw_player_metrics(output_frames, tracks)
-
-    # Save the final annotated video
-    save_video(output_frames, "output_vids/output.mp4")
-
-    # Generate and save formation plot images for each frame
-    print("Generating formation and track plots...")
-    speed_and_distance_estimator.plot_player_formations_and_tracks(
-        tracks,
-        video_frames[0].shape,
-        "output_vids/formations"
-    )
-    print("Done generating plots.")
+import argparse
+import json
+from detector.detector import BACKENDS
+from pipeline.stages import NODE_NAMES, build_pipeline
+from utils.profiling import StageProfiler, use_profiler
+from utils.stage_cache import StageCache
+
+
+def main(video_path="input_vids/input.mp4", output_dir="output_vids", model_path="models/best.pt", model=None,
+         cache_dir="stubs/cache", profiler=None, report_path=None, config=None, targets=None, force=(),
+         chunk_size=1000, backend=None, frame_store=False, export_dir=None, match=None):
+    # Every stage and hot loop is timed; pass StageProfiler(enabled=False) to turn
+    # telemetry off, or enable cProfile/tracemalloc capture on the profiler
+    profiler = StageProfiler() if profiler is None else profiler
+
+    # Every node's output is kept in the stage cache, so a rerun only recomputes the
+    # nodes whose inputs or parameters changed, and an interrupted run resumes
+    # tracking and camera movement from their last completed chunk
+    cache = StageCache(cache_dir) if cache_dir is not None else None
+
+    with use_profiler(profiler):
+        pipeline = build_pipeline(video_path, output_dir=output_dir, model_path=model_path, model=model, cache=cache,
+                                  profiler=profiler, config=config, chunk_size=chunk_size, backend=backend,
+                                  frame_store=frame_store, export_dir=export_dir, match=match)
+        pipeline.run(targets=targets, force=force)
+
+    if profiler.enabled:
+        print(profiler.summary())
+        if report_path is not None:
+            profiler.write_report(report_path)
+
+    return profiler
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Football match analysis pipeline")
+    parser.add_argument('--video', dest='video_path', default="input_vids/input.mp4", help="Input video")
+    parser.add_argument('--model', dest='model_path', default="models/best.pt", help="YOLO weights (.pt or .onnx)")
+    parser.add_argument('--backend', choices=sorted(BACKENDS),
+                        help="Detector backend (default: onnx for .onnx weights, ultralytics otherwise)")
+    parser.add_argument('--output-dir', default="output_vids", help="Directory for the output videos")
+    parser.add_argument('--cache-dir', default="stubs/cache", help="Directory for node outputs and checkpoints")
+    parser.add_argument('--no-cache', action='store_true', help="Recompute everything without the cache")
+    parser.add_argument('--config', help="JSON file of parameter overrides per node")
+    parser.add_argument('--only', dest='targets', nargs='+', choices=NODE_NAMES,
+                        help="Run only these nodes and what they depend on")
+    parser.add_argument('--force', nargs='+', default=[], choices=NODE_NAMES,
+                        help="Recompute these nodes even if their output is cached")
+    parser.add_argument('--frame-store', action='store_true',
+                        help="Decode the video once into a memory-mapped frame store in the cache")
+    parser.add_argument('--export', dest='export_dir',
+                        help="Also write tracks, metrics and possession as Parquet datasets to this directory")
+    parser.add_argument('--match', help="Match id of the Parquet export (default: the video's name)")
+    parser.add_argument('--chunk-size', type=int, default=1000, help="Frames per resumable checkpoint")
+    parser.add_argument('--report', dest='report_path', help="Write a JSON or CSV telemetry report")
+    args = parser.parse_args(argv)
+
+    config = None
+    if args.config:
+        with open(args.config) as f:
+            config = json.load(f)
+
+    return dict(video_path=args.video_path, output_dir=args.output_dir, model_path=args.model_path,
+                cache_dir=None if args.no_cache else args.cache_dir, report_path=args.report_path, config=config,
+                targets=args.targets, force=args.force, chunk_size=args.chunk_size, backend=args.backend,
+                frame_store=args.frame_store, export_dir=args.export_dir, match=args.match)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main(**parse_args())
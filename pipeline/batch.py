@@ -0,0 +1,282 @@
+"""
+Runs the full pipeline on many videos across a pool of worker processes.
+
+Usage:
+    python -m pipeline.batch input_vids/ --workers 4
+    python -m pipeline.batch manifest.json --workers 4 --retries 2
+
+Each worker loads the detector once and reuses it for every video it processes,
+with its CPU thread pools sized so that all workers together use each core once.
+Failed videos are retried, and a per-video summary is printed and written next to
+the outputs.
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv')
+THREAD_ENV_VARS = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'NUMEXPR_NUM_THREADS')
+
+_worker_state = {}
+
+
+def load_jobs(source, output_dir):
+    """
+    Videos to process, from a directory or a manifest file.
+
+    A manifest is either a text file with one video path per line or a JSON list
+    whose items are paths or objects `{"video": ..., "name": ..., "config": {...}}`.
+    Relative paths in a manifest are relative to the manifest.
+
+    Returns:
+        List[dict]: Jobs with 'video', 'name', 'output_dir' and 'config' keys.
+    """
+    if os.path.isdir(source):
+        entries = [os.path.join(source, name) for name in sorted(os.listdir(source))
+                   if name.lower().endswith(VIDEO_EXTENSIONS)]
+        base_dir = ''
+    else:
+        base_dir = os.path.dirname(source)
+        with open(source) as f:
+            if source.endswith('.json'):
+                entries = json.load(f)
+            else:
+                entries = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+    jobs = []
+    for entry in entries:
+        entry = {'video': entry} if isinstance(entry, str) else dict(entry)
+        video = os.path.join(base_dir, entry['video'])
+        name = entry.get('name') or os.path.splitext(os.path.basename(video))[0]
+        jobs.append({'video': video, 'name': name, 'output_dir': os.path.join(output_dir, name),
+                     'config': entry.get('config')})
+
+    names = [job['name'] for job in jobs]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"Videos with the same output name: {duplicates}; set 'name' in the manifest")
+    return jobs
+
+
+@contextmanager
+def _thread_limits(n_threads):
+    # Spawned workers read these when numpy, OpenCV and torch start their thread pools
+    previous = {name: os.environ.get(name) for name in THREAD_ENV_VARS}
+    os.environ.update({name: str(n_threads) for name in THREAD_ENV_VARS})
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def _init_worker(n_threads, started):
+    import cv2
+    cv2.setNumThreads(n_threads)
+    _worker_state.update(n_threads=n_threads, started=started)
+
+
+def _run_job(process, job, *args):
+    # Reported before the job can kill its worker, so that only jobs that started
+    # are charged an attempt when the pool breaks
+    _worker_state['started'].put(job['name'])
+    return process(job, *args)
+
+
+def _process_video(job, model_path, backend, cache_dir, chunk_size):
+    import main as pipeline
+    from detector.detector import load_detector
+    from utils.profiling import StageProfiler
+
+    # Loaded by the first job of the worker and reused by the next ones
+    if 'model' not in _worker_state:
+        _worker_state['model'] = load_detector(model_path, backend=backend, n_threads=_worker_state['n_threads'])
+
+    profiler = StageProfiler()
+    start = time.perf_counter()
+    pipeline.main(video_path=job['video'], output_dir=job['output_dir'], model_path=model_path,
+                  model=_worker_state['model'], cache_dir=cache_dir, profiler=profiler, config=job['config'],
+                  chunk_size=chunk_size)
+    wall_time = time.perf_counter() - start
+
+    n_frames = max((record['frames'] or 0 for record in profiler.stages), default=0)
+    return {'wall_time': wall_time, 'frames': n_frames, 'stages': {record['stage']: record['wall_time']
+                                                                    for record in profiler.stages}}
+
+
+def run_batch(jobs, model_path="models/best.pt", n_workers=None, threads_per_worker=None, retries=1,
+              cache_dir="stubs/cache", chunk_size=1000, backend=None):
+    """
+    Processes every job on a pool of `n_workers` processes.
+
+    Args:
+        jobs (List[dict]): Jobs from `load_jobs`.
+        model_path (str): YOLO weights (.pt or .onnx) loaded once per worker.
+        n_workers (Optional[int]): Number of worker processes; defaults to the CPU count.
+        threads_per_worker (Optional[int]): CPU threads per worker; defaults to the
+            CPU count divided by `n_workers`.
+        retries (int): How many times a failed video is retried.
+        cache_dir (Optional[str]): Stage cache shared by all workers, or None.
+        chunk_size (int): Frames per resumable checkpoint.
+        backend (Optional[str]): Detector backend, see `detector.detector.load_detector`.
+
+    Returns:
+        List[dict]: One summary per job, in job order.
+    """
+    n_cpus = os.cpu_count() or 1
+    n_workers = max(1, min(n_workers or n_cpus, len(jobs) or 1))
+    threads_per_worker = threads_per_worker or max(1, n_cpus // n_workers)
+
+    summaries = [{'name': job['name'], 'video': job['video'], 'output_dir': job['output_dir'], 'status': 'pending',
+                  'attempts': 0, 'error': None} for job in jobs]
+    job_indices = {job['name']: index for index, job in enumerate(jobs)}
+    queue = list(range(len(jobs)))
+    batch_start = time.perf_counter()
+
+    context = multiprocessing.get_context('spawn')
+    started = context.SimpleQueue()
+    with _thread_limits(threads_per_worker):
+        while queue:
+            # A worker that dies (e.g. out of memory) breaks the whole pool; the
+            # unfinished jobs are then requeued on a fresh one
+            with ProcessPoolExecutor(max_workers=n_workers, mp_context=context, initializer=_init_worker,
+                                     initargs=(threads_per_worker, started)) as executor:
+                futures, running, broken = {}, set(), []
+
+                def submit(index):
+                    futures[executor.submit(_run_job, _process_video, jobs[index], model_path, backend, cache_dir,
+                                            chunk_size)] = index
+
+                def collect_started():
+                    while not started.empty():
+                        index = job_indices[started.get()]
+                        summaries[index]['attempts'] += 1
+                        running.add(index)
+
+                for index in queue:
+                    submit(index)
+                queue = []
+
+                while futures:
+                    done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    collect_started()
+                    for future in done:
+                        index = futures.pop(future)
+                        summary = summaries[index]
+                        try:
+                            summary.update(future.result(), status='ok', error=None)
+                            summary['fps'] = summary['frames'] / summary['wall_time'] if summary['wall_time'] else None
+                        except BrokenProcessPool:
+                            broken.append(index)
+                            continue
+                        except Exception as error:
+                            summary.update(status='failed', error=''.join(
+                                traceback.format_exception_only(type(error), error)).strip())
+                            print(f"{summary['name']}: attempt {summary['attempts']} failed: {summary['error']}")
+                            running.discard(index)
+                            if summary['attempts'] <= retries:
+                                try:
+                                    submit(index)
+                                except BrokenProcessPool:
+                                    broken.append(index)
+                            continue
+                        running.discard(index)
+
+                    if broken:
+                        # The pool is broken and fails every job left in it
+                        wait(futures)
+                        broken += futures.values()
+                        collect_started()
+                        break
+
+            # Jobs that never started are requeued as they are, unless no job started
+            # at all, when the workers themselves cannot start
+            for index in broken:
+                summary = summaries[index]
+                if index not in running and running:
+                    queue.append(index)
+                    continue
+                if index not in running:
+                    summary['attempts'] += 1
+                summary.update(status='failed', error="worker died")
+                print(f"{summary['name']}: attempt {summary['attempts']} failed: {summary['error']}")
+                if summary['attempts'] <= retries:
+                    queue.append(index)
+
+    batch_time = time.perf_counter() - batch_start
+    total_frames = sum(summary.get('frames', 0) for summary in summaries if summary['status'] == 'ok')
+    print(f"Processed {total_frames} frames of {sum(s['status'] == 'ok' for s in summaries)}/{len(summaries)} "
+          f"videos in {batch_time:.1f} s ({total_frames / batch_time if batch_time else 0:.1f} fps overall, "
+          f"{n_workers} workers x {threads_per_worker} threads)")
+    return summaries
+
+
+def write_summary(summaries, path):
+    """Writes the per-video summaries as JSON, or as CSV when `path` ends with '.csv'."""
+    if not path.endswith('.csv'):
+        with open(path, 'w') as f:
+            json.dump(summaries, f, indent=2)
+        return
+
+    fields = ['name', 'video', 'output_dir', 'status', 'attempts', 'frames', 'wall_time', 'fps', 'error']
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fields, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(summaries)
+
+
+def main(argv=None):
+    from detector.detector import BACKENDS
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('source', help="Directory of videos or manifest file (.json or one path per line)")
+    parser.add_argument('--model', dest='model_path', default="models/best.pt", help="YOLO weights (.pt or .onnx)")
+    parser.add_argument('--backend', choices=sorted(BACKENDS), help="Detector backend (default: from --model)")
+    parser.add_argument('--output-dir', default="output_vids", help="One subdirectory per video is created here")
+    parser.add_argument('--workers', type=int, help="Worker processes (default: CPU count)")
+    parser.add_argument('--threads-per-worker', type=int, help="CPU threads per worker (default: CPUs / workers)")
+    parser.add_argument('--retries', type=int, default=1, help="Retries of a failed video")
+    parser.add_argument('--cache-dir', default="stubs/cache", help="Stage cache shared by the workers")
+    parser.add_argument('--no-cache', action='store_true')
+    parser.add_argument('--chunk-size', type=int, default=1000, help="Frames per resumable checkpoint")
+    parser.add_argument('--summary', help="Summary file (default: <output-dir>/batch_summary.json)")
+    args = parser.parse_args(argv)
+
+    jobs = load_jobs(args.source, args.output_dir)
+    if not jobs:
+        print(f"No videos found in {args.source}")
+        return 1
+
+    summaries = run_batch(jobs, model_path=args.model_path, n_workers=args.workers,
+                          threads_per_worker=args.threads_per_worker, retries=args.retries,
+                          cache_dir=None if args.no_cache else args.cache_dir, chunk_size=args.chunk_size,
+                          backend=args.backend)
+
+    print(f"{'video':<30} {'status':<8} {'attempts':>8} {'frames':>8} {'wall (s)':>9} {'fps':>8}")
+    for summary in summaries:
+        fps = f"{summary['fps']:.1f}" if summary.get('fps') else '-'
+        wall_time = f"{summary['wall_time']:.1f}" if 'wall_time' in summary else '-'
+        print(f"{summary['name']:<30} {summary['status']:<8} {summary['attempts']:>8} "
+              f"{summary.get('frames', '-'):>8} {wall_time:>9} {fps:>8}")
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    summary_path = args.summary or os.path.join(args.output_dir, 'batch_summary.json')
+    write_summary(summaries, summary_path)
+    print(f"Summary saved to {summary_path}")
+
+    return 0 if all(summary['status'] == 'ok' for summary in summaries) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,217 @@
+import json
+import os
+import shutil
+from typing import Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from utils.profiling import StageProfiler
+from utils.stage_cache import load_arrays, save_arrays
+
+
+class Checkpoint:
+    """
+    Chunks of a partly computed node output, persisted so that an interrupted run
+    resumes after the last completed chunk instead of starting over.
+
+    A chunked node calls `save` after every chunk with the chunk's arrays and
+    whatever state it needs to continue (e.g. the tracker state and the next frame).
+    On the next run `chunks` holds the saved arrays and `state` the last state.
+
+    The state is made of JSON values and arrays, possibly nested in dicts and lists
+    (tuples come back as lists). Chunks and the state's arrays are stored like
+    `StageCache` entries, as `.npy` files, and the rest of the state in the
+    checkpoint's `meta.json`, written last.
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory
+        self.chunks: List[Dict[str, np.ndarray]] = []
+        self.state = None
+
+        meta_path = self._path('meta.json')
+        if meta_path is None or not os.path.exists(meta_path):
+            return
+
+        with open(meta_path) as f:
+            meta = json.load(f)
+        # A chunk written after the last state (interrupted between the two writes) is ignored
+        for index in range(meta['n_chunks']):
+            self.chunks.append(load_arrays(self._path(f"chunk-{index:05d}"))[0])
+        state_arrays = load_arrays(self._path(f"state-{meta['n_chunks']:05d}"), mmap_mode=None)
+        self.state = _join_state(meta['state'], state_arrays[0] if state_arrays else {})
+
+    def _path(self, name):
+        return None if self.directory is None else os.path.join(self.directory, name)
+
+    def save(self, arrays: Dict[str, np.ndarray], state=None):
+        self.chunks.append(arrays)
+        self.state = state
+        if self.directory is None:
+            return
+
+        n_chunks = len(self.chunks)
+        save_arrays(self._path(f"chunk-{n_chunks - 1:05d}"), arrays)
+        state_arrays = {}
+        meta = {'n_chunks': n_chunks, 'state': _split_state(state, state_arrays, 'state')}
+        if state_arrays:
+            save_arrays(self._path(f"state-{n_chunks:05d}"), state_arrays)
+
+        tmp_path = self._path('.meta.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._path('meta.json'))
+        shutil.rmtree(self._path(f"state-{n_chunks - 1:05d}"), ignore_errors=True)
+
+    def concatenate(self, name: str, empty: np.ndarray) -> np.ndarray:
+        """The chunks' arrays called `name`, joined along the first axis."""
+        return np.concatenate([empty] + [chunk[name] for chunk in self.chunks])
+
+    def clear(self):
+        if self.directory is not None:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def _split_state(value, arrays, name):
+    # Replaces the arrays of a state by references to the entries added to `arrays`
+    if isinstance(value, np.ndarray):
+        arrays[name] = value
+        return {'__array__': name}
+    if isinstance(value, dict):
+        return {key: _split_state(item, arrays, f"{name}.{key}") for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_split_state(item, arrays, f"{name}.{index}") for index, item in enumerate(value)]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _join_state(value, arrays):
+    if isinstance(value, dict):
+        if set(value) == {'__array__'}:
+            return arrays[value['__array__']]
+        return {key: _join_state(item, arrays) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_join_state(item, arrays) for item in value]
+    return value
+
+
+class Node:
+    """
+    One stage of a `Pipeline`.
+
+    Args:
+        name (str): Unique name of the node.
+        run (Callable): `run(inputs, checkpoint)` computing the node's output, a dict
+            of arrays, from `inputs`, the outputs of the nodes named in `inputs`.
+            `checkpoint` is a `Checkpoint` the node may use to save progress.
+        inputs (Iterable[str]): Names of the nodes whose outputs this node reads.
+        params (Optional[dict]): Parameters that change the node's output; any change
+            recomputes the node and everything downstream.
+        files (Iterable[str]): Input files whose contents the output depends on.
+        output_files (Iterable[str]): Files the node writes; the node reruns when one
+            of them is missing even if its output is cached.
+    """
+
+    def __init__(self, name: str, run: Callable, inputs: Iterable[str] = (), params: Optional[dict] = None,
+                 files: Iterable[str] = (), output_files: Iterable[str] = ()):
+        self.name = name
+        self.run = run
+        self.inputs = list(inputs)
+        self.params = params or {}
+        self.files = list(files)
+        self.output_files = list(output_files)
+
+
+class Pipeline:
+    """
+    Runs a DAG of `Node`s, persisting each node's output in a `StageCache`.
+
+    A node's cache key covers its parameters, input files and the keys of its input
+    nodes, so a run recomputes exactly the nodes whose parameters or inputs changed,
+    plus the nodes downstream of them, and loads every other output from the cache.
+    Partial outputs of chunked nodes are checkpointed next to the cache entries.
+    Without a cache every node is computed in memory.
+    """
+
+    def __init__(self, cache=None, profiler: Optional[StageProfiler] = None):
+        self.cache = cache
+        self.profiler = StageProfiler(enabled=False) if profiler is None else profiler
+        self.nodes: Dict[str, Node] = {}
+
+    def add(self, node: Node) -> Node:
+        if node.name in self.nodes:
+            raise ValueError(f"Duplicate pipeline node: {node.name}")
+        missing = [name for name in node.inputs if name not in self.nodes]
+        if missing:
+            raise ValueError(f"Node {node.name} reads unknown nodes {missing}; add them first")
+        self.nodes[node.name] = node
+        return node
+
+    def _dependencies(self, targets):
+        # Nodes can only read nodes added before them, so insertion order is a
+        # topological order
+        needed = set()
+        stack = list(targets)
+        while stack:
+            name = stack.pop()
+            if name not in self.nodes:
+                raise KeyError(f"Unknown pipeline node: {name}")
+            if name not in needed:
+                needed.add(name)
+                stack.extend(self.nodes[name].inputs)
+        return [name for name in self.nodes if name in needed]
+
+    def _checkpoint(self, key, resume=True):
+        if self.cache is None:
+            return Checkpoint()
+        directory = os.path.join(self.cache.cache_dir, f".{key}.checkpoint")
+        if not resume:
+            shutil.rmtree(directory, ignore_errors=True)
+        return Checkpoint(directory)
+
+    def run(self, targets: Optional[Iterable[str]] = None, force: Iterable[str] = ()) -> Dict[str, dict]:
+        """
+        Computes `targets` (all nodes by default) and the nodes they depend on.
+
+        Args:
+            targets (Optional[Iterable[str]]): Names of the nodes to compute.
+            force (Iterable[str]): Nodes to recompute even when their output is cached.
+
+        Returns:
+            Dict[str, dict]: Output arrays of every node that was computed or loaded.
+        """
+        force = set(force)
+        unknown = force - set(self.nodes)
+        if unknown:
+            raise KeyError(f"Unknown pipeline nodes: {sorted(unknown)}")
+
+        outputs, keys = {}, {}
+        n_frames = None
+        for name in self._dependencies(self.nodes if targets is None else targets):
+            node = self.nodes[name]
+            arrays, key = None, None
+
+            if self.cache is not None:
+                key = keys[name] = self.cache.key(name, files=node.files, params={
+                    'params': node.params,
+                    'inputs': {input_name: keys[input_name] for input_name in node.inputs},
+                })
+                if name not in force and all(os.path.exists(path) for path in node.output_files):
+                    arrays = self.cache.load(key)
+
+            if arrays is None:
+                checkpoint = self._checkpoint(key, resume=name not in force)
+                with self.profiler.stage(name, frames=n_frames) as record:
+                    arrays = node.run({input_name: outputs[input_name] for input_name in node.inputs}, checkpoint)
+                    if 'n_frames' in arrays:
+                        record['frames'] = int(arrays['n_frames'])
+                if self.cache is not None:
+                    self.cache.save(key, arrays)
+                checkpoint.clear()
+
+            outputs[name] = arrays
+            if 'n_frames' in arrays:
+                n_frames = int(arrays['n_frames'])
+
+        return outputs
@@ -0,0 +1,362 @@
+"""
+Analyses a video file or a live camera frame by frame, with a fixed latency.
+
+Usage:
+    python -m pipeline.live --video input_vids/input.mp4 --output output_vids/live.mp4
+    python -m pipeline.live --camera 0 --show
+
+Unlike `build_pipeline`, whose nodes each process the whole video before the next
+one starts, every stage here is updated once per frame and keeps a bounded state:
+tracking, camera movement, pitch positions and teams are computed when a frame
+arrives, while the ball trajectory, kinematics and ball possession, which need to
+see a few later frames, are finalized after a fixed number of frames. Each frame is
+annotated and emitted `latency_frames` frames after it was read.
+"""
+import argparse
+import json
+import os
+import time
+from collections import deque
+from contextlib import nullcontext
+import cv2
+import numpy as np
+from camera_movement.estimator import CameraMovementEstimator
+from detector.detector import BACKENDS, Detector
+from export.parquet import ParquetExporter
+from pipeline.stages import configure, configure_detector
+from player_ball_assigner.assigner import BallHolderStream, PlayerBallAssigner
+from possession.analytics import PossessionAnalytics
+from speed_and_distance_estimator.estimator import SpeedAndDistanceEstimator
+from speed_and_distance_estimator.kinematics import RollingKinematics
+from team_assigner.assigner import TeamAssigner
+from tracker.ball_trajectory import BallTrajectoryStream
+from tracker.track_table import METRIC_COLUMNS, OBJECT_CLASSES, TrackTable, object_class_id
+from tracker.tracker import Tracker
+from utils.profiling import StageProfiler, get_profiler, use_profiler
+from utils.renderer import FrameRenderer
+from utils.video_utils import DEFAULT_FPS, VideoWriter, get_video_info, iter_video
+from view_transformer.view_transformer import ViewTransformer
+
+NODE_NAMES = ('tracks', 'ball_trajectory', 'camera_movement', 'view_transform', 'kinematics', 'teams', 'possession')
+
+
+class LiveAnalyzer:
+    """
+    The football analysis pipeline as an online, frame-by-frame process.
+
+    `update` takes the next frame of the stream and returns the annotated frames
+    that became final, so a frame comes out exactly `latency_frames` frames after
+    it went in (`flush` returns the rest at the end of the stream). Frames waiting
+    for their lookahead are the only frames held in memory.
+
+    Args:
+        model_path (Optional[str]): YOLO weights (.pt or .onnx).
+        model (Optional): A `Detector`, or an object with YOLO's predict()
+            interface, replacing the weights.
+        backend (Optional[str]): Detector backend (see `detector.detector.BACKENDS`).
+        fps (float): Frame rate of the stream, for kinematics and the latency in
+            seconds.
+        config (Optional[dict]): Parameter overrides per stage, as for
+            `build_pipeline`, for the stages in `NODE_NAMES`.
+        ball_lookahead (int): Frames the ball trajectory waits for before a frame's
+            ball is final; gaps in ball detections are only filled when they end
+            within it.
+        latency_window (int): Number of recent frames the measured latency is
+            reported over.
+        exporter (Optional[ParquetExporter]): Receives every emitted frame's rows;
+            closing it is left to the caller.
+    """
+
+    def __init__(self, model_path="models/best.pt", model=None, backend=None, fps=DEFAULT_FPS, config=None,
+                 ball_lookahead=8, latency_window=1000, exporter=None):
+        config = dict(config or {})
+        unknown = set(config) - set(NODE_NAMES)
+        if unknown:
+            raise ValueError(f"Unknown live stages in config: {sorted(unknown)}")
+
+        self.fps = fps if fps > 0 else DEFAULT_FPS
+        tracks_config = dict(config.get('tracks', {}))
+        detector_config = {name: tracks_config.pop(name) for name in Detector.PARAMS if name in tracks_config}
+        self.tracker = configure(Tracker(model_path, model=model, backend=backend), tracks_config)
+        configure_detector(self.tracker, detector_config)
+        configure(self.tracker.ball_trajectory, config.get('ball_trajectory', {}))
+        self.view_transformer = configure(ViewTransformer(), config.get('view_transform', {}))
+        self.speed_and_distance_estimator = configure(SpeedAndDistanceEstimator(frame_rate=self.fps),
+                                                       config.get('kinematics', {}))
+        self.team_assigner = configure(TeamAssigner(), config.get('teams', {}))
+        self.player_assigner = configure(PlayerBallAssigner(), config.get('possession', {}))
+        # The camera estimator needs the first frame of the stream
+        self.camera_movement_config = config.get('camera_movement', {})
+        self.ball_lookahead = ball_lookahead
+        self.latency_window = latency_window
+        self.exporter = exporter
+        self.start()
+
+    def start(self):
+        """Starts a new stream."""
+        estimator = self.speed_and_distance_estimator
+        self.tracker.start()
+        self.camera_movement = None
+        self.team_assigner.player_team_dict = {}
+        self.team_assigner.team_colors = {}
+        self.possession = PossessionAnalytics()
+        # A frame's possession is only looked up as the frame is emitted
+        self.possession.history = self.possession.rolling_window + 1
+
+        self._ball = BallTrajectoryStream(self.tracker.ball_trajectory, self.ball_lookahead)
+        # ByteTrack never brings back a track lost for more than max_time_lost frames
+        self._kinematics = RollingKinematics(estimator.frame_rate, estimator.frame_window, estimator.max_gap,
+                                             track_lifetime=self.tracker.tracker.max_time_lost)
+        self._holders = BallHolderStream(self.player_assigner)
+        # frame_num -> the frame, its one-frame TrackTable and the stage outputs
+        # finalized so far; frames leave in order once every stage is done with them
+        self._frames = {}
+        self._next_emitted = 0
+        self._frame_num = 0
+        self._latencies = deque(maxlen=self.latency_window)
+
+        self._tracks = {object_name: {} for object_name in OBJECT_CLASSES}
+        self._camera_movement_per_frame = {}
+        self.renderer = FrameRenderer()
+        self.renderer.add_layer(self.tracker.draw_frame_annotations, self._tracks, self.possession)
+        self.renderer.add_layer(self._draw_camera_movement, self._camera_movement_per_frame)
+        self.renderer.add_layer(self.speed_and_distance_estimator.draw_frame_player_metrics, self._tracks)
+
+    @property
+    def latency_frames(self):
+        """Frames between reading a frame and emitting it annotated."""
+        return max(self._kinematics.delay, self.ball_lookahead + self._holders.delay)
+
+    def update(self, frame):
+        """
+        Processes the next frame of the stream.
+
+        Returns:
+            List[Tuple[int, np.ndarray]]: (frame number, annotated frame) of the
+            frames that became final, drawn in place on the frames passed in.
+        """
+        read_time = time.perf_counter()
+        frame_num = self._frame_num
+        self._frame_num += 1
+
+        with get_profiler().section('live.update', frames=1):
+            table, ball = self._track(frame, frame_num)
+            self._frames[frame_num] = {'frame': frame, 'table': table, 'read_time': read_time}
+
+            players = np.flatnonzero(table.object_mask('players'))
+            for done_frame, metrics in self._kinematics.update(frame_num, table.track_id[players],
+                                                               table.position_transformed[players]):
+                self._frames[done_frame]['metrics'] = metrics
+            for done_frame, ball_bbox in self._ball.update(frame_num, ball['bbox'], ball['confidence']):
+                self._finalize_ball(done_frame, ball_bbox)
+
+            return self._emit()
+
+    def flush(self):
+        """Finalizes and returns the frames still waiting at the end of the stream."""
+        with get_profiler().section('live.flush'):
+            for done_frame, metrics in self._kinematics.flush():
+                self._frames[done_frame]['metrics'] = metrics
+            for done_frame, ball_bbox in self._ball.flush():
+                self._finalize_ball(done_frame, ball_bbox)
+            for done_frame, holder in self._holders.flush():
+                self._frames[done_frame]['holder'] = holder
+            return self._emit()
+
+    def _track(self, frame, frame_num):
+        columns = self.tracker.update(frame, frame_num)
+        is_ball = columns['object_class'] == object_class_id('ball')
+        ball = {name: values[is_ball] for name, values in columns.items()}
+        columns = {name: values[~is_ball] for name, values in columns.items()}
+        # Each frame is a table of its own, numbered 0, so the batch stages apply as is
+        table = TrackTable(1, **dict(columns, frame=np.zeros(len(columns['frame']))))
+
+        if self.camera_movement is None:
+            self.camera_movement = configure(CameraMovementEstimator(frame), self.camera_movement_config)
+            movement = self.camera_movement.start(frame)
+        else:
+            movement = self.camera_movement.update(frame)
+        self._camera_movement_per_frame[frame_num] = movement
+        self._add_positions(table, movement)
+
+        rows = table.object_rows(0, 'players')
+        if not self.team_assigner.team_colors and len(rows) >= 2:
+            self.team_assigner.fit_team_colors(frame, table.bbox[rows])
+        if self.team_assigner.team_colors and len(rows) > 0:
+            table.team[rows] = self.team_assigner.get_player_teams(frame, table.bbox[rows], table.track_id[rows])
+
+        return table, ball
+
+    def _add_positions(self, table, movement):
+        self.tracker.add_position_to_table(table)
+        self.camera_movement.adjust_table_positions(table, [movement])
+        self.view_transformer.add_transformed_position_to_table(table)
+
+    def _finalize_ball(self, frame_num, ball_bbox):
+        record = self._frames[frame_num]
+        table = record['table']
+        if not np.isnan(ball_bbox).any():
+            table = table.replace_object_rows('ball', [0], [1], bbox=[ball_bbox])
+            self._add_positions(table, self._camera_movement_per_frame[frame_num])
+            record['table'] = table
+
+        holder = self.player_assigner.nearest_players(table, np.asarray(ball_bbox).reshape(1, 4))[0]
+        for done_frame, holder in self._holders.update(frame_num, holder):
+            self._frames[done_frame]['holder'] = holder
+
+    def _emit(self):
+        emitted = []
+        while self._next_emitted in self._frames:
+            record = self._frames[self._next_emitted]
+            if 'metrics' not in record or 'holder' not in record:
+                break
+            frame_num = self._next_emitted
+            del self._frames[frame_num]
+            self._next_emitted += 1
+            emitted.append((frame_num, self._render(frame_num, record)))
+            self._latencies.append(time.perf_counter() - record['read_time'])
+        return emitted
+
+    def _render(self, frame_num, record):
+        table, holder = record['table'], record['holder']
+
+        players = np.flatnonzero(table.object_mask('players'))
+        for name in METRIC_COLUMNS:
+            getattr(table, name)[players] = record['metrics'][name]
+
+        team = -1
+        if holder != -1:
+            row = table.find_rows(np.zeros(1), np.array([holder]), 'players')[0]
+            if row >= 0:
+                table.has_ball[row] = True
+                team = table.team[row]
+        self.possession.update(team)
+        if self.exporter is not None:
+            self.exporter.write(table, self.possession, [holder], frame_offset=frame_num)
+
+        # The draw layers index tracks and camera movement by frame number; only the
+        # frames still in flight are kept
+        tracks = table.to_tracks(team_colors=self.team_assigner.team_colors or None)
+        for object_name, object_tracks in self._tracks.items():
+            object_tracks.clear()
+            object_tracks[frame_num] = tracks[object_name][0]
+
+        frame = self.renderer.render_frame(record['frame'], frame_num)
+        del self._camera_movement_per_frame[frame_num]
+        return frame
+
+    def _draw_camera_movement(self, frame, frame_num, camera_movement_per_frame):
+        return self.camera_movement.draw_frame_camera_movement(frame, frame_num, camera_movement_per_frame)
+
+    def latency(self):
+        """
+        The latency of the stream: the fixed delay in frames and seconds, and the
+        measured wall time from reading a frame to emitting it, over the last
+        `latency_window` frames.
+        """
+        latencies = np.array(self._latencies) * 1000
+        stats = {'latency_frames': self.latency_frames, 'latency_seconds': self.latency_frames / self.fps,
+                 'frames': self._next_emitted}
+        if len(latencies):
+            stats.update(mean_ms=float(latencies.mean()), p95_ms=float(np.percentile(latencies, 95)),
+                         max_ms=float(latencies.max()))
+        return stats
+
+    def run(self, frames, output_video_path=None, show=False):
+        """
+        Analyses a stream of frames to the end, writing the annotated frames to
+        `output_video_path` and/or showing them in a window (press q to stop).
+
+        Returns:
+            dict: The stream's `latency`.
+        """
+        def annotated_frames():
+            for frame in frames:
+                yield from self.update(frame)
+            yield from self.flush()
+
+        self.start()
+        writer = None
+        try:
+            for _, annotated in annotated_frames():
+                if output_video_path is not None:
+                    if writer is None:
+                        writer = VideoWriter(output_video_path, self.fps, (annotated.shape[1], annotated.shape[0]))
+                    writer.write(annotated)
+                if show:
+                    cv2.imshow('Football analysis', annotated)
+                    if cv2.waitKey(1) & 0xFF == ord('q'):
+                        break
+        finally:
+            if writer is not None:
+                writer.close()
+            if show:
+                cv2.destroyAllWindows()
+        return self.latency()
+
+
+def paced(frames, fps):
+    """Yields `frames` no faster than `fps`, as a live source would deliver them."""
+    start = time.perf_counter()
+    for frame_num, frame in enumerate(frames):
+        delay = start + frame_num / fps - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        yield frame
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--video', help="Video file to analyse as if it were live")
+    source.add_argument('--camera', type=int, help="Index of a local camera to analyse")
+    parser.add_argument('--model', dest='model_path', default="models/best.pt", help="YOLO weights (.pt or .onnx)")
+    parser.add_argument('--backend', choices=sorted(BACKENDS),
+                        help="Detector backend (default: onnx for .onnx weights, ultralytics otherwise)")
+    parser.add_argument('--output', help="Annotated output video")
+    parser.add_argument('--show', action='store_true', help="Show the annotated frames in a window")
+    parser.add_argument('--config', help="JSON file of parameter overrides per stage")
+    parser.add_argument('--ball-lookahead', type=int, default=8,
+                        help="Frames the ball trajectory waits for before a frame's ball is final")
+    parser.add_argument('--realtime', action='store_true',
+                        help="Feed the video at its frame rate instead of as fast as it decodes")
+    parser.add_argument('--export', dest='export_dir',
+                        help="Also write tracks, metrics and possession as Parquet datasets to this directory")
+    parser.add_argument('--match', help="Match id of the Parquet export (default: the video's name or camera-N)")
+    parser.add_argument('--report', dest='report_path', help="Write a JSON or CSV telemetry report")
+    args = parser.parse_args(argv)
+
+    config = None
+    if args.config:
+        with open(args.config) as f:
+            config = json.load(f)
+
+    video = args.video if args.video is not None else args.camera
+    fps = get_video_info(video)[2] or DEFAULT_FPS
+    # A camera delivers frames as they are captured; only a file is decoded ahead
+    frames = iter_video(video, read_ahead=16 if args.video is not None else 0)
+    if args.realtime and args.video is not None:
+        frames = paced(frames, fps)
+
+    exporter = None
+    if args.export_dir is not None:
+        match = args.match
+        if match is None:
+            match = os.path.splitext(os.path.basename(args.video))[0] if args.video is not None else f"camera-{video}"
+        exporter = ParquetExporter(args.export_dir, match, fps=fps)
+
+    profiler = StageProfiler()
+    with use_profiler(profiler), exporter or nullcontext():
+        analyzer = LiveAnalyzer(args.model_path, backend=args.backend, fps=fps, config=config,
+                                ball_lookahead=args.ball_lookahead, exporter=exporter)
+        latency = analyzer.run(frames, output_video_path=args.output, show=args.show)
+
+    print(profiler.summary())
+    print(json.dumps(latency, indent=2))
+    if args.report_path is not None:
+        profiler.write_report(args.report_path)
+    return latency
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,297 @@
+import copy
+import os
+import numpy as np
+from camera_movement.estimator import CameraMovementEstimator
+from detector.detector import Detector
+from export.parquet import DATASETS, ParquetExporter
+from pipeline.graph import Node, Pipeline
+from player_ball_assigner.assigner import PlayerBallAssigner
+from possession.analytics import PossessionAnalytics
+from speed_and_distance_estimator.estimator import SpeedAndDistanceEstimator
+from team_assigner.assigner import TeamAssigner
+from tracker.track_table import COLUMNS, METRIC_COLUMNS, TrackTable
+from tracker.tracker import Tracker
+from utils.frame_store import FrameStore
+from utils.renderer import FrameRenderer
+from utils.stage_cache import StageCache
+from utils.video_utils import get_video_info, iter_video, read_first_frame
+from view_transformer.view_transformer import ViewTransformer
+
+# Frames decoded ahead on a background thread by the nodes that read the video
+READ_AHEAD = 16
+
+# Frame stores take width * height * 3 bytes per frame (about 6 MB at 1080p), far
+# more than stage results, so they are kept in a directory of the cache with a
+# budget of their own rather than evicting (or being evicted by) the results
+FRAME_STORE_DIR = 'frames'
+FRAME_STORE_BYTES = 64 * 1024 ** 3
+
+NODE_NAMES = ('tracks', 'ball_trajectory', 'positions', 'camera_movement', 'view_transform', 'kinematics',
+              'teams', 'possession', 'render', 'plots', 'export')
+
+
+def configure(component, params):
+    """
+    Sets the attributes of `component` named in `params` and returns it. A dict for
+    a sub-component (e.g. the tracker's keyframes) configures it in place.
+    """
+    for name, value in params.items():
+        if not hasattr(component, name):
+            raise ValueError(f"Unknown parameter '{name}' for {type(component).__name__}")
+        if isinstance(value, dict) and hasattr(getattr(component, name), '__dict__'):
+            configure(getattr(component, name), value)
+        else:
+            setattr(component, name, value)
+    return component
+
+
+def configure_detector(tracker, params):
+    """
+    Gives the tracker a shallow copy of its detector with `params` applied, as the
+    detector may be shared (e.g. by the jobs of a batch worker). Returns the
+    tracker's detector, the original one when there are no `params`.
+    """
+    if params:
+        tracker.detector = configure(copy.copy(tracker.detector), params)
+    return tracker.detector
+
+
+def _params(component, names):
+    return {name: getattr(component, name) for name in names}
+
+
+def _load_table(outputs, *column_nodes):
+    # The ball_trajectory table holds the final rows; other nodes only add columns
+    table = TrackTable.from_arrays(outputs['ball_trajectory'])
+    for node_name in column_nodes:
+        for name, values in outputs[node_name].items():
+            if name in COLUMNS:
+                setattr(table, name, np.array(values))
+    return table
+
+
+def build_pipeline(video_path, output_dir="output_vids", model_path="models/best.pt", model=None, cache=None,
+                   profiler=None, config=None, chunk_size=1000, backend=None, frame_store=False, export_dir=None,
+                   match=None):
+    """
+    The football analysis pipeline as a DAG of nodes named in `NODE_NAMES`.
+
+    Args:
+        video_path (str): Input video.
+        output_dir (str): Directory for the annotated video and the formation video.
+        model_path (Optional[str]): YOLO weights (.pt or .onnx); may be None when
+            `model` is given.
+        model (Optional): A `Detector`, or an object with YOLO's predict() interface,
+            replacing the weights.
+        cache (Optional[StageCache]): Where node outputs and checkpoints are stored.
+        profiler (Optional[StageProfiler]): Records the time spent in each node.
+        config (Optional[dict]): Parameter overrides per node, e.g.
+            `{"tracks": {"conf": 0.2, "keyframes": {"interval": 4}}}`. Keys are
+            attributes of the component that runs the node; the tracks node also
+            takes the detector's `Detector.PARAMS`.
+        chunk_size (int): Frames per checkpoint of the tracking and camera nodes.
+        backend (Optional[str]): Detector backend (see `detector.detector.BACKENDS`);
+            by default chosen from the extension of `model_path`.
+        frame_store (bool): Decode the video once into a `FrameStore` in the cache,
+            with a grayscale plane for the camera node, and read every node's frames
+            from it. Stores are kept under `FRAME_STORE_DIR` of the cache, least
+            recently used ones being removed beyond `FRAME_STORE_BYTES`.
+        export_dir (Optional[str]): Adds an `export` node writing the tracks and
+            possession to Parquet datasets in this directory (see
+            `export.parquet.ParquetExporter`); its config takes `period_starts` and
+            `compression`.
+        match (Optional[str]): Match id of the export; defaults to the video's name.
+
+    Returns:
+        Pipeline: The pipeline, ready to `run`.
+    """
+    config = dict(config or {})
+    unknown = set(config) - set(NODE_NAMES)
+    if unknown:
+        raise ValueError(f"Unknown pipeline nodes in config: {sorted(unknown)}")
+
+    if frame_store and cache is None:
+        raise ValueError("frame_store needs a cache to keep the decoded frames in")
+
+    first_frame = read_first_frame(video_path)
+    _, _, fps, _ = get_video_info(video_path)
+    output_video_path = os.path.join(output_dir, "output.mp4")
+    formations_video_path = os.path.join(output_dir, "formations.mp4")
+
+    tracks_config = dict(config.get('tracks', {}))
+    detector_config = {name: tracks_config.pop(name) for name in Detector.PARAMS if name in tracks_config}
+    tracker = configure(Tracker(model_path, model=model, backend=backend), tracks_config)
+    configure_detector(tracker, detector_config)
+    ball_trajectory = configure(tracker.ball_trajectory, config.get('ball_trajectory', {}))
+    camera_movement = configure(CameraMovementEstimator(first_frame), config.get('camera_movement', {}))
+    view_transformer = configure(ViewTransformer(), config.get('view_transform', {}))
+    speed_and_distance_estimator = configure(SpeedAndDistanceEstimator(frame_rate=fps),
+                                              config.get('kinematics', {}))
+    team_assigner = configure(TeamAssigner(), config.get('teams', {}))
+    player_assigner = configure(PlayerBallAssigner(), config.get('possession', {}))
+    if config.get('render'):
+        raise ValueError(f"Unknown parameters for render: {sorted(config['render'])}")
+    plot_params = {'n_workers': 1, 'trail_length': 20}
+    unknown = set(config.get('plots', {})) - set(plot_params)
+    if unknown:
+        raise ValueError(f"Unknown parameters for plots: {sorted(unknown)}")
+    plot_params.update(config.get('plots', {}), output_video_path=formations_video_path)
+    # Workers only change how fast the plots are drawn, so they stay out of the cache key
+    plot_workers = plot_params.pop('n_workers')
+    export_params = {'period_starts': [0], 'compression': 'zstd'}
+    unknown = set(config.get('export', {})) - set(export_params)
+    if unknown:
+        raise ValueError(f"Unknown parameters for export: {sorted(unknown)}")
+    export_params.update(config.get('export', {}))
+    if match is None:
+        match = os.path.splitext(os.path.basename(str(video_path)))[0]
+
+    source = {}
+
+    def video():
+        # The frame store is only built when a node that reads frames has to run
+        if 'video' not in source:
+            source['video'] = video_path
+            if frame_store:
+                gray_downscale = camera_movement.downscale
+                stores = StageCache(os.path.join(cache.cache_dir, FRAME_STORE_DIR), max_bytes=FRAME_STORE_BYTES)
+                key = stores.key('frames', files=[video_path], params={'gray_downscale': gray_downscale})
+                source['video'] = FrameStore.build(video_path, os.path.join(stores.cache_dir, key),
+                                                   gray_downscale=gray_downscale, read_ahead=READ_AHEAD)
+                stores.evict(keep=key)
+        return source['video']
+
+    def read_frames(writable=False):
+        if isinstance(video(), FrameStore):
+            return video().iter_frames(copy=writable)
+        return iter_video(video_path, read_ahead=READ_AHEAD)
+
+    def run_tracks(inputs, checkpoint):
+        return tracker.track_video(video(), checkpoint, chunk_size=chunk_size).to_arrays()
+
+    def run_ball_trajectory(inputs, checkpoint):
+        return tracker.reconstruct_ball_trajectory(TrackTable.from_arrays(inputs['tracks'])).to_arrays()
+
+    def run_positions(inputs, checkpoint):
+        table = _load_table(inputs)
+        tracker.add_position_to_table(table)
+        return {'position': table.position}
+
+    def run_camera_movement(inputs, checkpoint):
+        movement = camera_movement.estimate_video(video(), checkpoint, chunk_size=chunk_size,
+                                                  read_ahead=READ_AHEAD)
+        return {'camera_movement': np.array(movement, dtype=np.float32).reshape(-1, 2)}
+
+    def run_view_transform(inputs, checkpoint):
+        table = _load_table(inputs, 'positions')
+        camera_movement.adjust_table_positions(table, inputs['camera_movement']['camera_movement'])
+        view_transformer.add_transformed_position_to_table(table)
+        return {'position_adjusted': table.position_adjusted, 'position_transformed': table.position_transformed}
+
+    def run_kinematics(inputs, checkpoint):
+        table = _load_table(inputs, 'view_transform')
+        speed_and_distance_estimator.add_speed_and_distance_to_table(table)
+        return {name: getattr(table, name) for name in METRIC_COLUMNS}
+
+    def run_teams(inputs, checkpoint):
+        table = _load_table(inputs)
+        team_assigner.fit_team_colors(first_frame, table.bbox[table.object_rows(0, 'players')])
+        team_assigner.add_team_to_table(video(), table, read_ahead=READ_AHEAD)
+        return {'team': table.team, 'team_colors': np.array([team_assigner.team_colors[1],
+                                                              team_assigner.team_colors[2]])}
+
+    def run_possession(inputs, checkpoint):
+        table = _load_table(inputs, 'teams')
+        ball_holders = player_assigner.assign_ball_to_table(table, table.object_bboxes('ball', 1))
+
+        holder_rows = table.find_rows(np.arange(table.n_frames), np.maximum(ball_holders, 0), 'players')
+        team_ball_control = np.where((ball_holders != -1) & (holder_rows >= 0), table.team[holder_rows], -1)
+        return {'has_ball': table.has_ball, 'ball_holders': ball_holders, 'team_ball_control': team_ball_control}
+
+    def team_colors(inputs):
+        colors = inputs['teams']['team_colors']
+        return {1: np.array(colors[0]), 2: np.array(colors[1])}
+
+    def run_render(inputs, checkpoint):
+        table = _load_table(inputs, 'positions', 'view_transform', 'kinematics', 'teams', 'possession')
+        tracks = table.to_tracks(team_colors=team_colors(inputs))
+        camera_movement_per_frame = inputs['camera_movement']['camera_movement'].tolist()
+
+        # Frames without a holder fall back to the last known possession
+        possession = PossessionAnalytics.from_team_ball_control(inputs['possession']['team_ball_control'])
+
+        # Every module registers a draw layer; each frame is decoded, drawn once in place
+        # by all layers and streamed straight into the video encoder
+        renderer = FrameRenderer()
+        renderer.add_layer(tracker.draw_frame_annotations, tracks, possession)
+        renderer.add_layer(camera_movement.draw_frame_camera_movement, camera_movement_per_frame)
+        renderer.add_layer(speed_and_distance_estimator.draw_frame_player_metrics, tracks)
+
+        os.makedirs(output_dir, exist_ok=True)
+        renderer.render(read_frames(writable=True), output_video_path, fps)
+        return {'output_video_path': np.array(output_video_path)}
+
+    def run_plots(inputs, checkpoint):
+        table = _load_table(inputs, 'view_transform', 'teams')
+        os.makedirs(output_dir, exist_ok=True)
+        speed_and_distance_estimator.plot_player_formations_and_tracks(
+            table,
+            first_frame.shape,
+            output_video_path=formations_video_path,
+            team_colors=team_colors(inputs),
+            pitch_size=view_transformer.pitch_size,
+            n_workers=plot_workers,
+            trail_length=plot_params['trail_length']
+        )
+        return {'output_video_path': np.array(formations_video_path)}
+
+    def run_export(inputs, checkpoint):
+        table = _load_table(inputs, 'positions', 'view_transform', 'kinematics', 'teams', 'possession')
+        possession = PossessionAnalytics.from_team_ball_control(inputs['possession']['team_ball_control'])
+        # The exporter splits the table into row groups of chunk_size frames
+        with ParquetExporter(export_dir, match, fps=fps, chunk_size=chunk_size, **export_params) as exporter:
+            exporter.write(table, possession, inputs['possession']['ball_holders'])
+        return {'export_dir': np.array(export_dir)}
+
+    # Without weights on disk (e.g. the benchmark's fake detector) the model's type
+    # stands in for their contents
+    model_files = [video_path] + ([model_path] if model_path is not None else [])
+    model_params = dict(tracker.detector.params(), backend=tracker.detector.name,
+                        **_params(tracker, ('batch_size',)))
+    if tracker.n_shards > 1:
+        model_params.update(_params(tracker, ('n_shards', 'shard_overlap')))
+    if tracker.keyframes.interval > 1:
+        model_params['keyframes'] = tracker.keyframes.params()
+    if tracker.ball_search.enabled:
+        model_params['ball_search'] = tracker.ball_search.params()
+    if model_path is None:
+        model_params['model'] = type(model).__name__
+
+    pipeline = Pipeline(cache=cache, profiler=profiler)
+    pipeline.add(Node('tracks', run_tracks, files=model_files, params=model_params))
+    pipeline.add(Node('ball_trajectory', run_ball_trajectory, inputs=['tracks'],
+                      params=dict(vars(ball_trajectory))))
+    pipeline.add(Node('positions', run_positions, inputs=['ball_trajectory']))
+    pipeline.add(Node('camera_movement', run_camera_movement, files=[video_path],
+                      params=_params(camera_movement, ('features', 'lk_params', 'minimum_distance', 'downscale'))))
+    pipeline.add(Node('view_transform', run_view_transform, inputs=['ball_trajectory', 'positions', 'camera_movement'],
+                      params=_params(view_transformer, ('pixel_vertices', 'target_vertices'))))
+    pipeline.add(Node('kinematics', run_kinematics, inputs=['ball_trajectory', 'view_transform'],
+                      params=_params(speed_and_distance_estimator, ('frame_rate', 'frame_window', 'max_gap'))))
+    pipeline.add(Node('teams', run_teams, inputs=['ball_trajectory'], files=[video_path],
+                      params=_params(team_assigner, ('crop_size', 'kmeans_iterations'))))
+    pipeline.add(Node('possession', run_possession, inputs=['ball_trajectory', 'teams'],
+                      params=_params(player_assigner, ('max_player_ball_distance', 'max_gap_frames',
+                                                       'min_spell_frames'))))
+    pipeline.add(Node('render', run_render, files=[video_path], params={'output_video_path': output_video_path},
+                      inputs=['ball_trajectory', 'positions', 'camera_movement', 'view_transform', 'kinematics',
+                              'teams', 'possession'],
+                      output_files=[output_video_path]))
+    pipeline.add(Node('plots', run_plots, inputs=['ball_trajectory', 'view_transform', 'teams'],
+                      params=plot_params, output_files=[formations_video_path]))
+    if export_dir is not None:
+        pipeline.add(Node('export', run_export, inputs=['ball_trajectory', 'positions', 'view_transform', 'kinematics',
+                                                        'teams', 'possession'],
+                          params=dict(export_params, export_dir=export_dir, match=match, chunk_size=chunk_size),
+                          output_files=[os.path.join(export_dir, dataset, f"match={match}") for dataset in DATASETS]))
+    return pipeline
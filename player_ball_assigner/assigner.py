@@ -1,8 +1,22 @@
+from collections import deque
+import numpy as np
 from utils.bbox_utils import get_center_of_bbox, measure_distance
 
+
+def _runs(values):
+    starts = np.flatnonzero(np.r_[True, values[1:] != values[:-1]])
+    lengths = np.diff(np.r_[starts, len(values)])
+    return starts, lengths, values[starts]
+
+
 class PlayerBallAssigner:
     def __init__(self):
         self.max_player_ball_distance = 70
+        # Hysteresis: frames without a holder between two spells of the same player are
+        # bridged when at most `max_gap_frames` long, and spells shorter than
+        # `min_spell_frames` are treated as flicker and given back to the previous holder
+        self.max_gap_frames = 5
+        self.min_spell_frames = 3
 
     def assign_ball(self, player, ball_bbox):
         MINIMUM_DISTANCE = 99999
@@ -20,8 +34,142 @@ class PlayerBallAssigner:
 
             if distance <= self.max_player_ball_distance:
                 if distance < MINIMUM_DISTANCE:
-                    minimum_distance = distance
+                    MINIMUM_DISTANCE = distance
                     assigned_player = player_id
 
         return assigned_player
 
+    def nearest_players(self, table, ball_bboxes):
+        """
+        Nearest player within reach of the ball in every frame, without hysteresis.
+
+        Args:
+            table (TrackTable): Tracks with player bounding boxes.
+            ball_bboxes (np.ndarray): (n_frames, 4) ball bounding boxes, NaN when unknown.
+
+        Returns:
+            np.ndarray: (n_frames,) track id of the nearest player, -1 when nobody is in reach.
+        """
+        ball_bboxes = np.asarray(ball_bboxes, dtype=np.float64)
+        # Same truncation as get_center_of_bbox
+        ball_centers = np.trunc((ball_bboxes[:, :2] + ball_bboxes[:, 2:]) / 2)
+
+        players = np.flatnonzero(table.object_mask('players'))
+        frames = table.frame[players]
+        bboxes = table.bbox[players].astype(np.float64)
+        ball_center = ball_centers[frames]
+
+        feet_y = bboxes[:, 3] - ball_center[:, 1]
+        distance_left = np.hypot(bboxes[:, 0] - ball_center[:, 0], feet_y)
+        distance_right = np.hypot(bboxes[:, 2] - ball_center[:, 0], feet_y)
+        distance = np.minimum(distance_left, distance_right)
+
+        in_reach = distance <= self.max_player_ball_distance
+        players, frames, distance = players[in_reach], frames[in_reach], distance[in_reach]
+
+        # First row of each frame after sorting by (frame, distance) is the nearest player
+        order = np.lexsort((distance, frames))
+        frames, players = frames[order], players[order]
+        first = np.ones(len(frames), dtype=bool)
+        first[1:] = frames[1:] != frames[:-1]
+
+        holders = np.full(table.n_frames, -1, dtype=np.int64)
+        holders[frames[first]] = table.track_id[players[first]]
+        return holders
+
+    def bridge_gaps(self, holders):
+        """Gives runs without a holder between two spells of the same player to that player."""
+        holders = holders.copy()
+        starts, lengths, values = _runs(holders)
+        for i in range(1, len(starts) - 1):
+            if values[i] == -1 and lengths[i] <= self.max_gap_frames and values[i - 1] == values[i + 1]:
+                holders[starts[i]:starts[i] + lengths[i]] = values[i - 1]
+        return holders
+
+    def smooth_holders(self, holders):
+        holders = self.bridge_gaps(holders)
+
+        # A short spell goes to the holder of the frame before it, which may itself
+        # come from an earlier spell: the last one kept
+        starts, lengths, values = _runs(holders)
+        for i in range(1, len(starts)):
+            if values[i] != -1 and lengths[i] < self.min_spell_frames:
+                holders[starts[i]:starts[i] + lengths[i]] = holders[starts[i] - 1]
+
+        return holders
+
+    def assign_ball_to_table(self, table, ball_bboxes):
+        """
+        Assigns the ball to a player in every frame in one pass and marks the holders'
+        rows with `has_ball`.
+
+        Returns:
+            np.ndarray: (n_frames,) track id of the player with the ball, -1 for none.
+        """
+        holders = self.smooth_holders(self.nearest_players(table, ball_bboxes))
+
+        rows = table.find_rows(np.arange(table.n_frames), np.maximum(holders, 0), 'players')
+        rows = rows[(holders != -1) & (rows >= 0)]
+        table.has_ball[:] = False
+        table.has_ball[rows] = True
+
+        return holders
+
+
+class BallHolderStream:
+    """
+    Online `PlayerBallAssigner.smooth_holders` with a fixed delay, giving the same
+    holders as the batch method.
+
+    A gap is bridged once `max_gap_frames` later frames are known, and a spell is
+    told from flicker once its first `min_spell_frames` frames are bridged, so the
+    holder of a frame is decided `delay` frames later. Besides these frames, only the
+    `max_gap_frames` frames before them (the start of a gap) and the holder of the
+    last spell kept are needed.
+    """
+
+    def __init__(self, assigner):
+        self.assigner = assigner
+        self.delay = assigner.max_gap_frames + assigner.min_spell_frames - 1
+        # Nearest players of the last decided frames
+        self._history = deque(maxlen=assigner.max_gap_frames)
+        # (frame_num, nearest player) of the frames not decided yet
+        self._pending = deque()
+        # Bridged holder of the last decided frame, and the holder its spell was given
+        self._bridged = None
+        self._holder = -1
+
+    def update(self, frame_num, holder):
+        """
+        Adds the nearest player to the ball (-1 for none) in the next frame.
+
+        Returns:
+            List[Tuple[int, int]]: (frame, holder) of the frames decided by this one,
+            at most one.
+        """
+        self._pending.append((frame_num, int(holder)))
+        if len(self._pending) <= self.delay:
+            return []
+        return self._decide(1)
+
+    def flush(self):
+        """Decides the frames still waiting for later frames at the end of the stream."""
+        return self._decide(len(self._pending))
+
+    def _decide(self, n_frames):
+        decided = []
+        for _ in range(n_frames):
+            nearest = np.array(list(self._history) + [holder for _, holder in self._pending], dtype=np.int64)
+            bridged = self.assigner.bridge_gaps(nearest)[len(self._history):]
+
+            if bridged[0] != self._bridged:
+                # A new spell is kept unless it is a short one after the first
+                length = np.argmax(np.r_[bridged, bridged[0] + 1] != bridged[0])
+                if self._bridged is None or bridged[0] == -1 or length >= self.assigner.min_spell_frames:
+                    self._holder = int(bridged[0])
+                self._bridged = bridged[0]
+
+            frame_num, holder = self._pending.popleft()
+            self._history.append(holder)
+            decided.append((frame_num, self._holder))
+        return decided
@@ -0,0 +1,151 @@
+import numpy as np
+
+
+class PossessionAnalytics:
+    """
+    Ball possession statistics maintained incrementally, one frame at a time.
+
+    Cumulative per-team frame counts are kept as prefix sums, so overall and rolling
+    window possession for any frame are O(1). Consecutive frames controlled by the same
+    team are grouped into possession spells.
+
+    By default every frame is kept. With `history`, as for a live stream of unknown
+    length, only the last `history` frames and spells are kept. Per-frame queries
+    then only reach back that far, and a rolling window needs `history` above
+    `rolling_window`. `summary` still covers the whole stream.
+    """
+
+    def __init__(self, rolling_window=240, teams=(1, 2), history=None):
+        self.rolling_window = rolling_window
+        self.teams = teams
+        self.history = history
+        # Frames dropped from the start of team_ball_control and _cumulative
+        self.first_frame = 0
+        self.team_ball_control = []
+        # _cumulative[f - first_frame][i] = frames up to and including f controlled by teams[i]
+        self._cumulative = []
+        self.spells = []
+        # team -> number of spells and longest spell, over the whole stream
+        self._spell_counts = {}
+        self._longest_spells = {}
+
+    def __len__(self):
+        return self.first_frame + len(self.team_ball_control)
+
+    def update(self, team=None):
+        """
+        Records the team in control of the ball for the next frame.
+
+        A frame where no player has the ball (`team` None or -1) keeps the last team
+        that had it, or -1 while nobody has had the ball yet.
+        """
+        if team is None or team == -1:
+            team = self.team_ball_control[-1] if self.team_ball_control else -1
+        team = int(team)
+
+        previous = self._cumulative[-1] if self._cumulative else (0,) * len(self.teams)
+        self._cumulative.append(tuple(count + (team == t) for count, t in zip(previous, self.teams)))
+        self.team_ball_control.append(team)
+
+        frame_num = len(self) - 1
+        if team != -1:
+            if self.spells and self.spells[-1]['team'] == team and self.spells[-1]['end_frame'] == frame_num:
+                self.spells[-1]['end_frame'] = frame_num + 1
+            else:
+                self.spells.append({'team': team, 'start_frame': frame_num, 'end_frame': frame_num + 1})
+                self._spell_counts[team] = self._spell_counts.get(team, 0) + 1
+            spell = self.spells[-1]
+            self._longest_spells[team] = max(self._longest_spells.get(team, 0), spell['end_frame'] - spell['start_frame'])
+
+        # Dropping in batches of `history` keeps the lists' indexing O(1) and appends
+        # amortized O(1)
+        if self.history is not None and len(self.team_ball_control) >= 2 * self.history:
+            dropped = len(self.team_ball_control) - self.history
+            del self.team_ball_control[:dropped], self._cumulative[:dropped]
+            self.first_frame += dropped
+        if self.history is not None and len(self.spells) >= 2 * self.history:
+            del self.spells[:len(self.spells) - self.history]
+
+        return team
+
+    @classmethod
+    def from_team_ball_control(cls, team_ball_control, **kwargs):
+        possession = cls(**kwargs)
+        for team in team_ball_control:
+            possession.update(team)
+        return possession
+
+    def _index(self, frame_num):
+        if not 0 <= frame_num - self.first_frame < len(self.team_ball_control):
+            raise IndexError(f"Frame {frame_num} is not kept; frames {self.first_frame} to {len(self) - 1} are")
+        return frame_num - self.first_frame
+
+    def _counts(self, frame_num):
+        if frame_num < 0:
+            return (0,) * len(self.teams)
+        return self._cumulative[self._index(frame_num)]
+
+    def team(self, frame_num):
+        """The team in control of the ball in `frame_num`, -1 for none yet."""
+        return self.team_ball_control[self._index(frame_num)]
+
+    @staticmethod
+    def _shares(counts):
+        total = sum(counts)
+        if total == 0:
+            return (0.0,) * len(counts)
+        return tuple(count / total for count in counts)
+
+    def possession(self, frame_num):
+        """Share of frames controlled by each team from the start up to `frame_num`."""
+        return self._shares(self._counts(frame_num))
+
+    def rolling_possession(self, frame_num, window=None):
+        """Share of frames controlled by each team over the last `window` frames."""
+        window = window or self.rolling_window
+        current = self._counts(frame_num)
+        before = self._counts(frame_num - window)
+        return self._shares(tuple(c - b for c, b in zip(current, before)))
+
+    def time_series(self, window=None):
+        """
+        Per-frame possession as arrays, for whole-match reports.
+
+        Returns:
+            dict: 'frame', 'team', and for each team `t`: 'cumulative_t', 'possession_t'
+            and 'rolling_possession_t'.
+        """
+        if self.first_frame > 0:
+            raise ValueError(f"The time series needs every frame; only the last {self.history} are kept")
+        window = window or self.rolling_window
+        n_frames = len(self)
+        cumulative = np.array(self._cumulative, dtype=np.int64).reshape(n_frames, len(self.teams))
+
+        before = np.zeros_like(cumulative)
+        if window < n_frames:
+            before[window:] = cumulative[:-window]
+        rolling = cumulative - before
+
+        def shares(counts):
+            total = counts.sum(axis=1, keepdims=True)
+            return np.divide(counts, total, out=np.zeros(counts.shape), where=total > 0)
+
+        series = {'frame': np.arange(n_frames), 'team': np.array(self.team_ball_control, dtype=np.int64)}
+        cumulative_shares, rolling_shares = shares(cumulative), shares(rolling)
+        for i, team in enumerate(self.teams):
+            series[f'cumulative_{team}'] = cumulative[:, i]
+            series[f'possession_{team}'] = cumulative_shares[:, i]
+            series[f'rolling_possession_{team}'] = rolling_shares[:, i]
+        return series
+
+    def summary(self):
+        summary = {'frames': len(self), 'spells': sum(self._spell_counts.values())}
+        final_counts = self._counts(len(self) - 1)
+        for team, share, count in zip(self.teams, self._shares(final_counts), final_counts):
+            # Every frame a team controls belongs to one of its spells
+            n_spells = self._spell_counts.get(team, 0)
+            summary[f'possession_{team}'] = share
+            summary[f'spells_{team}'] = n_spells
+            summary[f'longest_spell_{team}'] = self._longest_spells.get(team, 0)
+            summary[f'mean_spell_{team}'] = count / n_spells if n_spells else 0.0
+        return summary
@@ -0,0 +1,195 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+import cv2
+import numpy as np
+from tracker.track_table import object_class_id
+from utils.profiling import get_profiler
+from utils.video_utils import save_video
+
+_worker_state = {}
+
+
+def _init_worker(renderer, table):
+    # The table is sent once per worker process instead of once per task
+    _worker_state['renderer'] = renderer
+    _worker_state['table'] = table
+
+
+def _render_task(start, stop, output_dir, encode):
+    renderer, table = _worker_state['renderer'], _worker_state['table']
+    encoded = []
+    for frame_num, board in renderer.iter_range(table, start, stop):
+        if output_dir is not None:
+            cv2.imwrite(renderer.frame_path(output_dir, frame_num), board)
+        if encode:
+            encoded.append(cv2.imencode('.png', board)[1])
+    return encoded
+
+
+class FormationRenderer:
+    """
+    Tactical-board renderer for player formations and trails, rasterized with OpenCV.
+
+    Pitch positions (meters) are drawn on a pre-rendered board image that is copied
+    per frame. Each track keeps its last `trail_length` positions in a ring buffer, so
+    trails are never rebuilt by rescanning earlier frames.
+    """
+
+    def __init__(self, frame_shape, pitch_size=(23.32, 68), team_colors=None, trail_length=20):
+        self.height, self.width = frame_shape[:2]
+        self.pitch_size = pitch_size
+        self.team_colors = team_colors or {}
+        self.trail_length = trail_length
+
+        # Fit the pitch inside the board with a margin, keeping its aspect ratio
+        pitch_length, pitch_width = pitch_size
+        self.scale = 0.9 * min(self.width / pitch_length, self.height / pitch_width)
+        self.offset = np.array([(self.width - pitch_length * self.scale) / 2,
+                                (self.height - pitch_width * self.scale) / 2])
+
+        self.board = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        self.board[:] = (34, 139, 34)  # ForestGreen
+        corners = self.to_board(np.array([[0, 0], [pitch_length, pitch_width]]))
+        cv2.rectangle(self.board, tuple(corners[0]), tuple(corners[1]), (255, 255, 255), 2)
+
+    def to_board(self, positions):
+        return np.round(np.asarray(positions) * self.scale + self.offset).astype(np.int32)
+
+    def frame_path(self, output_dir, frame_num):
+        return os.path.join(output_dir, f"formation_{frame_num:05d}.png")
+
+    def _trail_color(self, color):
+        # Trails are drawn at 60% opacity over the green background
+        return tuple(0.6 * c + 0.4 * g for c, g in zip(color, self.board[0, 0]))
+
+    def draw_frame(self, frame_num, players, ball_position, trails):
+        board = self.board.copy()
+
+        for track_id, position, color in players:
+            trail = [point for frame, point in trails.get(track_id, ()) if frame >= frame_num - self.trail_length]
+            if len(trail) > 1:
+                cv2.polylines(board, [np.array(trail, dtype=np.int32)], False, self._trail_color(color), 2,
+                              cv2.LINE_AA)
+
+        for track_id, position, color in players:
+            cv2.circle(board, tuple(position), 10, color, cv2.FILLED, cv2.LINE_AA)
+            cv2.circle(board, tuple(position), 10, (0, 0, 0), 1, cv2.LINE_AA)
+
+            text = str(track_id)
+            (text_width, _), _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 2)
+            cv2.putText(board, text, (position[0] - text_width // 2, position[1] - 15), cv2.FONT_HERSHEY_SIMPLEX,
+                        0.5, (255, 255, 255), 2)
+
+        if ball_position is not None:
+            cv2.circle(board, tuple(ball_position), 7, (0, 255, 255), cv2.FILLED, cv2.LINE_AA)
+            cv2.circle(board, tuple(ball_position), 7, (0, 0, 0), 1, cv2.LINE_AA)
+
+        title = f"Frame: {frame_num}"
+        (text_width, _), _ = cv2.getTextSize(title, cv2.FONT_HERSHEY_SIMPLEX, 1, 2)
+        cv2.putText(board, title, ((self.width - text_width) // 2, 40), cv2.FONT_HERSHEY_SIMPLEX, 1,
+                    (255, 255, 255), 2)
+
+        return board
+
+    def iter_range(self, table, start, stop):
+        """
+        Yields (frame_num, board) for frames `start` to `stop`; the `trail_length`
+        frames before `start` are only used to fill the trail buffers.
+        """
+        player_class, ball_class = object_class_id('players'), object_class_id('ball')
+        trails = {}
+
+        for frame_num in range(max(0, start - self.trail_length), min(stop, table.n_frames)):
+            rows = np.arange(table.frame_offsets[frame_num], table.frame_offsets[frame_num + 1])
+            rows = rows[~np.isnan(table.position_transformed[rows]).any(axis=1)]
+            positions = self.to_board(table.position_transformed[rows])
+            classes = table.object_class[rows]
+
+            player_rows = np.flatnonzero(classes == player_class)
+            players = [(int(table.track_id[rows[i]]), positions[i],
+                        tuple(map(float, self.team_colors.get(int(table.team[rows[i]]), (255, 255, 255)))))
+                       for i in player_rows]
+
+            if frame_num >= start:
+                ball_rows = np.flatnonzero(classes == ball_class)
+                ball_position = positions[ball_rows[-1]] if len(ball_rows) > 0 else None
+                with get_profiler().section('formation_plots.draw', frames=1):
+                    board = self.draw_frame(frame_num, players, ball_position, trails)
+                yield frame_num, board
+
+            for track_id, position, _ in players:
+                if track_id not in trails:
+                    trails[track_id] = deque(maxlen=self.trail_length)
+                trails[track_id].append((frame_num, tuple(position)))
+
+            # Drop buffers of tracks that have not been seen for a whole trail length
+            if frame_num % self.trail_length == 0:
+                trails = {track_id: trail for track_id, trail in trails.items()
+                          if trail[-1][0] >= frame_num - self.trail_length}
+
+    def _ranges(self, n_frames, frame_nums, chunk_size):
+        if frame_nums is None:
+            return [(start, min(start + chunk_size, n_frames)) for start in range(0, n_frames, chunk_size)]
+
+        ranges = []
+        for frame_num in sorted(set(frame_num for frame_num in frame_nums if 0 <= frame_num < n_frames)):
+            if ranges and ranges[-1][1] == frame_num and frame_num - ranges[-1][0] < chunk_size:
+                ranges[-1][1] = frame_num + 1
+            else:
+                ranges.append([frame_num, frame_num + 1])
+        return [tuple(frame_range) for frame_range in ranges]
+
+    def _iter_boards(self, table, ranges, output_dir, encode, n_workers):
+        if n_workers <= 1:
+            for start, stop in ranges:
+                for frame_num, board in self.iter_range(table, start, stop):
+                    if output_dir is not None:
+                        cv2.imwrite(self.frame_path(output_dir, frame_num), board)
+                    if encode:
+                        yield board
+            return
+
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker,
+                                 initargs=(self, table)) as executor:
+            # At most one task per worker is in flight, and the next range is only
+            # submitted once the oldest result is taken, so encoded boards never
+            # pile up faster than the caller consumes them
+            ranges = iter(ranges)
+            pending = deque(executor.submit(_render_task, start, stop, output_dir, encode)
+                            for start, stop in islice(ranges, n_workers))
+            while pending:
+                encoded = pending.popleft().result()
+                for start, stop in islice(ranges, 1):
+                    pending.append(executor.submit(_render_task, start, stop, output_dir, encode))
+                for png in encoded:
+                    yield cv2.imdecode(png, cv2.IMREAD_COLOR)
+
+    def render(self, table, output_dir=None, output_video_path=None, frame_nums=None, n_workers=1, chunk_size=500,
+               fps=None):
+        """
+        Renders the boards of all frames (or of `frame_nums` only).
+
+        Args:
+            table (TrackTable): Tracks with pitch positions and teams.
+            output_dir (Optional[str]): Directory to write one PNG per frame to.
+            output_video_path (Optional[str]): Path of a single video of all boards.
+            frame_nums (Optional[Iterable[int]]): Subset of frames to render.
+            n_workers (int): Number of processes to split frame ranges across.
+            chunk_size (int): Maximum number of frames per process task.
+            fps (Optional[float]): Frame rate of the video, normally the source's.
+        """
+        if output_dir is not None:
+            os.makedirs(output_dir, exist_ok=True)
+
+        ranges = self._ranges(table.n_frames, frame_nums, chunk_size)
+        if not ranges:
+            return
+
+        boards = self._iter_boards(table, ranges, output_dir, output_video_path is not None, n_workers)
+        if output_video_path is not None:
+            save_video(boards, output_video_path, fps)
+        else:
+            for _ in boards:
+                pass
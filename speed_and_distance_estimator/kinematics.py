@@ -0,0 +1,171 @@
+from collections import deque
+import numpy as np
+
+
+def cumsum_per_group(values, group_start):
+    """Cumulative sum of `values` restarting wherever `group_start` is True."""
+    cumsum = np.cumsum(values)
+    first = np.flatnonzero(group_start)
+    lengths = np.diff(np.append(first, len(values)))
+    return cumsum - np.repeat(cumsum[first] - values[first], lengths)
+
+
+def compute_kinematics(frame, track_id, position, frame_rate, frame_window=5, max_gap=None):
+    """
+    Speed, cumulative distance, acceleration and player load for many tracks at once.
+
+    Rows are grouped by track and split into segments wherever a track is missing for
+    more than `max_gap` frames. Velocities are centered differences over a window of
+    `frame_window` frames that never crosses a segment boundary, and accelerations are
+    centered differences of those velocities. Distance and player load integrate speed
+    and acceleration magnitude over time along each track.
+
+    Args:
+        frame (np.ndarray): (N,) frame number of each row.
+        track_id (np.ndarray): (N,) track id of each row.
+        position (np.ndarray): (N, 2) pitch position in meters, NaN when unknown.
+        frame_rate (float): Frames per second of the video.
+        frame_window (int): Length in frames of the centered differencing window.
+        max_gap (Optional[int]): Longest gap in frames bridged within a segment;
+            defaults to `frame_window`.
+
+    Returns:
+        dict: 'speed' (km/h), 'distance' (m), 'acceleration' (m/s^2) and
+        'player_load' (m/s) arrays aligned with the input rows, NaN where unknown.
+    """
+    max_gap = frame_window if max_gap is None else max_gap
+    half_window = max(frame_window // 2, 1)
+
+    n_rows = len(frame)
+    metrics = {name: np.full(n_rows, np.nan) for name in ('speed', 'distance', 'acceleration', 'player_load')}
+
+    known = np.flatnonzero(~np.isnan(position).any(axis=1))
+    if len(known) == 0:
+        return metrics
+    order = known[np.lexsort((frame[known], track_id[known]))]
+    frames = frame[order].astype(np.int64)
+    tracks = track_id[order]
+    positions = position[order].astype(np.float64)
+
+    new_track = np.ones(len(order), dtype=bool)
+    new_track[1:] = tracks[1:] != tracks[:-1]
+    new_segment = new_track.copy()
+    new_segment[1:] |= np.diff(frames) > max_gap
+
+    segment = np.cumsum(new_segment) - 1
+    segment_first = np.flatnonzero(new_segment)
+    segment_last = np.append(segment_first[1:], len(order)) - 1
+
+    # Window ends: the furthest rows of the same segment within half_window frames
+    keys = (segment << 32) | frames
+    before = np.maximum(np.searchsorted(keys, keys - half_window, 'left'), segment_first[segment])
+    after = np.minimum(np.searchsorted(keys, keys + half_window, 'right') - 1, segment_last[segment])
+
+    time_elapsed = (frames[after] - frames[before]) / frame_rate
+    has_window = time_elapsed > 0
+    elapsed = np.where(has_window, time_elapsed, 1.0)[:, None]
+
+    velocity = np.where(has_window[:, None], (positions[after] - positions[before]) / elapsed, np.nan)
+    acceleration = (velocity[after] - velocity[before]) / elapsed
+    acceleration[~has_window] = np.nan
+
+    speed = np.linalg.norm(velocity, axis=1)
+    acceleration_magnitude = np.linalg.norm(acceleration, axis=1)
+
+    time_step = np.zeros(len(order))
+    time_step[1:] = np.diff(frames) / frame_rate
+    time_step[new_segment] = 0
+
+    metrics['speed'][order] = speed * 3.6
+    metrics['acceleration'][order] = acceleration_magnitude
+    metrics['distance'][order] = cumsum_per_group(np.nan_to_num(speed) * time_step, new_track)
+    metrics['player_load'][order] = cumsum_per_group(np.nan_to_num(acceleration_magnitude) * time_step, new_track)
+
+    return metrics
+
+
+class RollingKinematics:
+    """
+    `compute_kinematics` one frame at a time, over a sliding window of frames.
+
+    Accelerations of a frame are differences of velocities `frame_window // 2`
+    frames away, which are themselves differences of positions another half window
+    away, so the metrics of a frame are final `delay` frames later and only the last
+    `2 * delay + 1` frames of positions are kept. Distance and player load carry on
+    from per-track running totals. The metrics match `compute_kinematics` over the
+    whole video.
+
+    With `track_lifetime`, the totals of a track are dropped once it has not been
+    seen for that many frames, so a stream of new tracks keeps a bounded state. The
+    metrics are unchanged as long as the tracker never brings a track back after
+    such a gap, e.g. with ByteTrack's `max_time_lost` frames.
+    """
+
+    def __init__(self, frame_rate, frame_window=5, max_gap=None, track_lifetime=None):
+        self.frame_rate = frame_rate
+        self.frame_window = frame_window
+        self.max_gap = frame_window if max_gap is None else max_gap
+        self.track_lifetime = track_lifetime
+        self.delay = 2 * max(frame_window // 2, 1)
+        # (frame_num, track_id, position) of the frames in the window
+        self._frames = deque(maxlen=2 * self.delay + 1)
+        self._pending = deque()
+        # track_id -> (last frame with a position, distance, player load)
+        self._totals = {}
+        # track_id -> last frame with the track, with or without a position
+        self._last_seen = {}
+
+    def update(self, frame_num, track_id, position):
+        """
+        Adds the pitch positions of the tracks in the next frame.
+
+        Returns:
+            List[Tuple[int, dict]]: (frame, metrics) of the frames finalized by this
+            one, at most one; metrics are arrays aligned with that frame's tracks, as
+            returned by `compute_kinematics`.
+        """
+        self._frames.append((frame_num, np.asarray(track_id), np.asarray(position, dtype=np.float64).reshape(-1, 2)))
+        self._pending.append(frame_num)
+        if frame_num - self._pending[0] < self.delay:
+            return []
+        return self._emit(1)
+
+    def flush(self):
+        """Finalizes the frames still waiting for later positions at the end of the stream."""
+        return self._emit(len(self._pending))
+
+    def _emit(self, n_frames):
+        frame = np.concatenate([np.full(len(track_id), frame_num) for frame_num, track_id, _ in self._frames])
+        track_id = np.concatenate([track_id for _, track_id, _ in self._frames])
+        position = np.concatenate([position for _, _, position in self._frames])
+        window = compute_kinematics(frame, track_id, position, self.frame_rate, self.frame_window, self.max_gap)
+
+        finalized = []
+        for _ in range(n_frames):
+            frame_num = self._pending.popleft()
+            rows = np.flatnonzero(frame == frame_num)
+            metrics = {name: values[rows] for name, values in window.items()}
+
+            # compute_kinematics' distance and load restart with the window; integrate
+            # them onto the running totals instead
+            for i, row in enumerate(rows):
+                self._last_seen[track_id[row]] = frame_num
+                if np.isnan(position[row]).any():
+                    continue
+                last_frame, distance, player_load = self._totals.get(track_id[row], (None, 0.0, 0.0))
+                time_step = 0.0
+                if last_frame is not None and frame_num - last_frame <= self.max_gap:
+                    time_step = (frame_num - last_frame) / self.frame_rate
+                distance += np.nan_to_num(metrics['speed'][i] / 3.6) * time_step
+                player_load += np.nan_to_num(metrics['acceleration'][i]) * time_step
+                self._totals[track_id[row]] = (frame_num, distance, player_load)
+                metrics['distance'][i], metrics['player_load'][i] = distance, player_load
+
+            if self.track_lifetime is not None:
+                for gone in [track for track, last_seen in self._last_seen.items()
+                             if frame_num - last_seen > self.track_lifetime]:
+                    del self._last_seen[gone]
+                    self._totals.pop(gone, None)
+
+            finalized.append((frame_num, metrics))
+        return finalized
@@ -1,42 +1,101 @@
+import cv2
+import numpy as np
 from sklearn.cluster import KMeans
+from utils.profiling import get_profiler
+from utils.video_utils import iter_video_frames
 
 
 class TeamAssigner:
      def __init__(self):
          self.team_colors= {}
          self.player_team_dict = {}
-
-     def get_clustering_model(self, image):
-         img_2d= image.reshape(-1, 3)
-         clustering = KMeans(n_clusters=2, init= 'k-means++', n_init=1)
-         clustering.fit(img_2d)
-
-         return clustering
-
-     def get_player_color(self, frame, bbox):
-         image= frame[int(bbox[1]):int(bbox[3]), int(bbox[0]):int(bbox[2])]
+         # Crops are downsampled to this (width, height) before clustering their pixels
+         self.crop_size = (16, 16)
+         self.kmeans_iterations = 10
+
+     def get_top_half_crop(self, frame, bbox):
+         height, width = frame.shape[:2]
+         x1, x2 = np.clip([int(bbox[0]), int(bbox[2])], 0, width)
+         y1, y2 = np.clip([int(bbox[1]), int(bbox[3])], 0, height)
+         image = frame[y1:y2, x1:x2]
          top_half = image[0 : int(image.shape[0] // 2), : ]
-         kmeans = self.get_clustering_model(top_half)
-
-         labels = kmeans.labels_
-         clustered_image = labels.reshape(top_half.shape[0], top_half.shape[1])
-         corner_clusters = [clustered_image[0, 0],clustered_image[0, -1],clustered_image[-1, 0], clustered_image[-1, -1] ]
 
-         non_player_cluster = max(set(corner_clusters), key=corner_clusters.count)
-         player_cluster = 1-non_player_cluster
+         if top_half.size == 0:
+             return np.zeros((self.crop_size[1], self.crop_size[0], 3), dtype=frame.dtype)
+         return cv2.resize(top_half, self.crop_size, interpolation=cv2.INTER_AREA)
+
+     def cluster_pixels(self, pixels):
+         """
+         Batched 2-means over the pixels of many crops at once.
+
+         Args:
+             pixels (np.ndarray): (N, P, 3) array with the P pixels of N crops.
+
+         Returns:
+             Tuple[np.ndarray, np.ndarray]: (N, P) cluster labels and (N, 2, 3) centers.
+         """
+         # Deterministic init: the top-left pixel (usually background) and the pixel
+         # furthest from it
+         first = pixels[:, 0]
+         furthest = ((pixels - first[:, None]) ** 2).sum(axis=2).argmax(axis=1)
+         centers = np.stack([first, pixels[np.arange(len(pixels)), furthest]], axis=1)
+
+         for _ in range(self.kmeans_iterations):
+             distances = ((pixels[:, :, None, :] - centers[:, None, :, :]) ** 2).sum(axis=3)
+             in_second = distances[:, :, 1] < distances[:, :, 0]
+
+             count_second = in_second.sum(axis=1)[:, None]
+             sum_second = (pixels * in_second[:, :, None]).sum(axis=1)
+             sum_first = pixels.sum(axis=1) - sum_second
+             count_first = pixels.shape[1] - count_second
+
+             # Empty clusters keep their previous center
+             centers = np.stack([
+                 np.where(count_first > 0, sum_first / np.maximum(count_first, 1), centers[:, 0]),
+                 np.where(count_second > 0, sum_second / np.maximum(count_second, 1), centers[:, 1]),
+             ], axis=1)
+
+         distances = ((pixels[:, :, None, :] - centers[:, None, :, :]) ** 2).sum(axis=3)
+         labels = (distances[:, :, 1] < distances[:, :, 0]).astype(np.int64)
+         return labels, centers
+
+     def get_player_colors(self, frame, bboxes):
+         """
+         Jersey colors of several players in one frame, computed together.
+
+         Args:
+             frame (np.ndarray): The video frame.
+             bboxes (Sequence): Player bounding boxes as (x1, y1, x2, y2).
+
+         Returns:
+             np.ndarray: (N, 3) array of BGR player colors.
+         """
+         if len(bboxes) == 0:
+             return np.empty((0, 3))
+
+         with get_profiler().section('team_assignment.player_colors'):
+             crops = np.stack([self.get_top_half_crop(frame, bbox) for bbox in bboxes])
+             pixels = crops.reshape(len(bboxes), -1, 3).astype(np.float64)
+             labels, centers = self.cluster_pixels(pixels)
+
+         width, height = self.crop_size
+         corners = [0, width - 1, (height - 1) * width, height * width - 1]
+         corner_clusters = labels[:, corners]
+
+         # The background is the cluster most corners belong to (cluster 0 on a tie)
+         non_player_cluster = (corner_clusters.sum(axis=1) > 2).astype(np.int64)
+         player_cluster = 1 - non_player_cluster
+
+         return centers[np.arange(len(bboxes)), player_cluster]
 
-         player_color = kmeans.cluster_centers_[player_cluster]
-         return player_color
-
-     def assign_team_color(self, frame, player_detections):
-         player_colors = []
-         for _, player_detection in player_detections.items():
-             bbox = player_detection['bbox']
-             player_color = self.get_player_color(frame, bbox)
+     def get_player_color(self, frame, bbox):
+         return self.get_player_colors(frame, [bbox])[0]
 
-             player_colors.append(player_color)
+     def fit_team_colors(self, frame, bboxes):
+         player_colors = self.get_player_colors(frame, bboxes)
 
-         kmeans = KMeans(n_clusters=2, init= 'k-means++', n_init=1)
+         # Seeded, so that the same players get the same team numbers on every run
+         kmeans = KMeans(n_clusters=2, init= 'k-means++', n_init=1, random_state=0)
          kmeans.fit(player_colors)
 
          self.kmeans = kmeans
@@ -44,25 +103,53 @@ class TeamAssigner:
          self.team_colors[1] = kmeans.cluster_centers_[0]
          self.team_colors[2] = kmeans.cluster_centers_[1]
 
-     def get_player_team(self, frame, player_bbox, player_id):
-         if player_id in self.player_team_dict:
-             return self.player_team_dict[player_id]
-
-         player_color= self.get_player_color(frame, player_bbox)
-
-         team_id = self.kmeans.predict(player_color.reshape(1, -1))[0]
-         team_id+=1
-
-         if player_id == 89:
-             team_id=1 
-
-         self.player_team_dict[player_id] = team_id
-         return team_id
-
-
-
+     def assign_team_color(self, frame, player_detections):
+         self.fit_team_colors(frame, [player_detection['bbox'] for player_detection in player_detections.values()])
 
+     def get_player_teams(self, frame, player_bboxes, player_ids):
+         """
+         Teams of several players in one frame, with a single batched prediction for
+         the players that have not been seen before.
+         """
+         player_ids = [int(player_id) for player_id in player_ids]
+         new_players = [i for i, player_id in enumerate(player_ids) if player_id not in self.player_team_dict]
 
+         if new_players:
+             player_colors = self.get_player_colors(frame, [player_bboxes[i] for i in new_players])
+             with get_profiler().section('team_assignment.kmeans_predict'):
+                 team_ids = self.kmeans.predict(player_colors) + 1
 
+             for i, team_id in zip(new_players, team_ids):
+                 if player_ids[i] == 89:
+                     team_id = 1
+                 self.player_team_dict[player_ids[i]] = int(team_id)
 
+         return [self.player_team_dict[player_id] for player_id in player_ids]
 
+     def get_player_team(self, frame, player_bbox, player_id):
+         return self.get_player_teams(frame, [player_bbox], [player_id])[0]
+
+     def add_team_to_table(self, video, table, read_ahead=0):
+         """
+         Teams of the player rows of a table. A player's team is decided in the frame
+         where its track first appears, so only those frames are decoded.
+
+         Args:
+             video (str): Path of the video, or its `FrameStore`.
+             table (TrackTable): Tracks of the video.
+             read_ahead (int): See `utils.video_utils.iter_video`.
+         """
+         players = np.flatnonzero(table.object_mask('players'))
+         track_ids, first = np.unique(table.track_id[players], return_index=True)
+         new = [int(track_id) not in self.player_team_dict for track_id in track_ids]
+         first_frames = np.unique(table.frame[players[first[new]]])
+
+         for frame_num, frame in iter_video_frames(video, first_frames[first_frames < table.n_frames].tolist(),
+                                                   read_ahead=read_ahead):
+             rows = table.object_rows(frame_num, 'players')
+             self.get_player_teams(frame, table.bbox[rows], table.track_id[rows])
+
+         for row in players:
+             team = self.player_team_dict.get(int(table.track_id[row]))
+             if team is not None:
+                 table.team[row] = team
@@ -0,0 +1,41 @@
+import numpy as np
+from tracker.track_table import COLUMNS, METRIC_COLUMNS, TrackTable, object_class_id
+
+
+def make_table(n_frames=6, seed=0):
+    """A table of random rows for three players, a referee and the ball, some frames missing each."""
+    rng = np.random.default_rng(seed)
+    rows = [(frame, track_id, object_name) for frame in range(n_frames)
+            for object_name, track_ids in (('players', (3, 7, 12)), ('referees', (40,)), ('ball', (1,)))
+            for track_id in track_ids if rng.random() > 0.2]
+    n_rows = len(rows)
+    is_player = np.array([object_name == 'players' for _, _, object_name in rows], dtype=bool)
+    x, y = rng.uniform(100, 1500, n_rows), rng.uniform(300, 1000, n_rows)
+    columns = {
+        'frame': [frame for frame, _, _ in rows],
+        'track_id': [track_id for _, track_id, _ in rows],
+        'object_class': [object_class_id(object_name) for _, _, object_name in rows],
+        'bbox': np.stack([x, y - 60, x + 30, y], axis=1),
+        'confidence': np.where(rng.random(n_rows) < 0.8, rng.uniform(0.1, 1, n_rows), np.nan),
+        'position': np.stack([x + 15, y], axis=1),
+        'position_adjusted': np.stack([x + 10, y - 2], axis=1),
+        'position_transformed': np.where(rng.random((n_rows, 1)) < 0.7,
+                                         np.stack([rng.uniform(0, 23, n_rows), rng.uniform(0, 68, n_rows)], axis=1),
+                                         np.nan),
+        'team': np.where(is_player, rng.integers(1, 3, n_rows), 0),
+        'has_ball': is_player & (rng.random(n_rows) < 0.1),
+    }
+    for name in METRIC_COLUMNS:
+        columns[name] = np.where(is_player, rng.uniform(0, 30, n_rows), np.nan)
+    return TrackTable(n_frames, **columns)
+
+
+def assert_tables_equal(expected, actual, rtol=1e-6):
+    assert expected.n_frames == actual.n_frames
+    # Rows of a frame may come back in another order
+    expected_order = np.lexsort((expected.track_id, expected.object_class, expected.frame))
+    actual_order = np.lexsort((actual.track_id, actual.object_class, actual.frame))
+    for name in COLUMNS:
+        np.testing.assert_allclose(getattr(expected, name)[expected_order].astype(np.float64),
+                                   getattr(actual, name)[actual_order].astype(np.float64), rtol=rtol,
+                                   err_msg=name)
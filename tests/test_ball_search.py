@@ -0,0 +1,113 @@
+import numpy as np
+import supervision as sv
+from detector.detector import Detector
+from tracker.ball_search import BallSearch
+
+BALL, PLAYER = 0, 1
+FRAME = np.zeros((1080, 1920, 3), dtype=np.uint8)
+
+
+class StubDetector(Detector):
+    """Reports fixed boxes in frame pixels, clipped to each searched region."""
+
+    def __init__(self, xyxy, class_id):
+        super().__init__()
+        self.class_names = {BALL: 'ball', PLAYER: 'player'}
+        self.xyxy = np.array(xyxy, dtype=np.float32).reshape(-1, 4)
+        self.class_id = np.array(class_id)
+        self.calls = []
+
+    def detect_regions(self, frame, regions, frame_num=None):
+        self.calls.append((list(regions), frame_num))
+        detections = []
+        for x1, y1, x2, y2 in regions:
+            xyxy = np.clip(self.xyxy, [x1, y1, x1, y1], [x2, y2, x2, y2])
+            inside = (xyxy[:, 2] > xyxy[:, 0]) & (xyxy[:, 3] > xyxy[:, 1])
+            detections.append(sv.Detections(xyxy=xyxy[inside], confidence=np.full(inside.sum(), 0.5, np.float32),
+                                             class_id=self.class_id[inside]))
+        return detections
+
+
+def ball_at(x, y):
+    return np.array([[x - 7, y - 7, x + 7, y + 7]], dtype=np.float32)
+
+
+def test_no_tiles_before_the_ball_is_seen_or_once_it_is_lost():
+    search = BallSearch()
+    assert search.tiles(FRAME.shape, 5) == []
+
+    search.update(10, ball_at(1000, 500), np.array([0.9]))
+    assert search.tiles(FRAME.shape, 10 + search.max_lost_frames + 1) == []
+
+
+def test_tile_around_a_still_ball():
+    search = BallSearch()
+    search.update(10, ball_at(1000, 500), np.array([0.9]))
+
+    assert search.tiles(FRAME.shape, 11) == [(840, 340, 1160, 660)]
+
+
+def test_tiles_grow_with_speed_and_stay_in_the_frame():
+    search = BallSearch()
+    search.update(10, ball_at(1800, 500), np.array([0.9]))
+    search.update(11, ball_at(1840, 500), np.array([0.9]))
+
+    # Predicted at x=1960, past the right edge, and searched 2 crops wide
+    tiles = search.tiles(FRAME.shape, 14)
+    assert len(tiles) == 2
+    assert all(x2 - x1 == search.crop_size and y2 - y1 == search.crop_size for x1, y1, x2, y2 in tiles)
+    assert max(x2 for _, _, x2, _ in tiles) == 1920
+    (left, _, left_x2, _), (right, _, _, _) = sorted(tiles)
+    assert left_x2 - right >= search.tile_overlap
+
+
+def test_search_keeps_whole_balls_in_frame_pixels():
+    search = BallSearch()
+    search.enabled = True
+    search.update(10, ball_at(1000, 500), np.array([0.9]))
+    # A ball inside the crop, one cut by its edge and a player
+    detector = StubDetector(np.concatenate([ball_at(1020, 480), ball_at(1160, 400), [[950, 400, 990, 490]]]),
+                            [BALL, BALL, PLAYER])
+
+    bboxes, confidence = search.search(FRAME, 11, False, detector.detect_regions, BALL)
+
+    assert detector.calls == [([(840, 340, 1160, 660)], 11)]
+    np.testing.assert_allclose(bboxes, ball_at(1020, 480))
+    np.testing.assert_allclose(confidence, [0.5])
+    # The search follows the ball it found, moving by (20, -20) per frame
+    assert search.tiles(FRAME.shape, 12) == [(880, 300, 1200, 620)]
+
+
+def test_lost_ball_is_searched_in_the_full_frame_every_coarse_interval():
+    search = BallSearch()
+    detector = StubDetector(np.empty((0, 4)), np.empty(0, dtype=int))
+
+    for frame_num in range(14):
+        # Frame 0 was already detected in full
+        search.search(FRAME, frame_num, frame_num == 0, detector.detect_regions, BALL)
+
+    assert detector.calls == [([(0, 0, 1920, 1080)], frame_num) for frame_num in (1, 7, 13)]
+
+
+class CropDetector(Detector):
+    """Finds one ball at the same place of every image it is given."""
+
+    def __init__(self):
+        super().__init__()
+        self.class_names = {BALL: 'ball'}
+        self.frame_nums = []
+
+    def _detect(self, frames, conf, frame_nums):
+        self.frame_nums.append(frame_nums)
+        return [sv.Detections(xyxy=np.array([[10, 20, 24, 34]], dtype=np.float32),
+                              confidence=np.array([0.5], dtype=np.float32), class_id=np.array([BALL]))
+                for _ in frames]
+
+
+def test_detect_regions_returns_boxes_in_frame_pixels():
+    detector = CropDetector()
+    detections = detector.detect_regions(FRAME, [(100, 200, 420, 520), (388, 200, 708, 520)], frame_num=7)
+
+    np.testing.assert_allclose(detections[0].xyxy, [[110, 220, 124, 234]])
+    np.testing.assert_allclose(detections[1].xyxy, [[398, 220, 412, 234]])
+    assert detector.frame_nums == [[7, 7]]
@@ -0,0 +1,36 @@
+import os
+from pipeline import batch
+
+
+def process_or_crash(job, *args):
+    # Stands in for the pipeline in the spawned workers
+    if job['name'] == 'crash':
+        os._exit(1)
+    return {'wall_time': 1.0, 'frames': 25, 'stages': {}}
+
+
+def make_jobs(tmp_path, names):
+    return [{'video': f"{name}.mp4", 'name': name, 'output_dir': str(tmp_path / name), 'config': None}
+            for name in names]
+
+
+def test_dead_worker_is_retried_and_jobs_that_never_started_are_not_charged(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch, '_process_video', process_or_crash)
+    jobs = make_jobs(tmp_path, ['first', 'crash', 'second', 'third'])
+
+    # One worker runs the jobs in order, so the crash kills no other running job
+    summaries = batch.run_batch(jobs, n_workers=1, threads_per_worker=1, retries=1, cache_dir=None)
+
+    by_name = {summary['name']: summary for summary in summaries}
+    assert by_name['crash']['status'] == 'failed' and by_name['crash']['attempts'] == 2
+    for name in ('first', 'second', 'third'):
+        assert by_name[name]['status'] == 'ok' and by_name[name]['attempts'] == 1, by_name[name]
+
+
+def test_dead_worker_is_not_retried_beyond_retries(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch, '_process_video', process_or_crash)
+
+    summaries = batch.run_batch(make_jobs(tmp_path, ['crash']), n_workers=1, threads_per_worker=1, retries=0,
+                                cache_dir=None)
+
+    assert summaries[0]['status'] == 'failed' and summaries[0]['attempts'] == 1
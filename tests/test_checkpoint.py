@@ -0,0 +1,50 @@
+import os
+import numpy as np
+import supervision as sv
+from pipeline.graph import Checkpoint
+from tracker.bytetrack_state import get_bytetrack_state, set_bytetrack_state
+
+
+def make_detections(n_frames=30, seed=0):
+    rng = np.random.default_rng(seed)
+    starts = rng.uniform(50, 900, size=(8, 2))
+    velocities = rng.uniform(-6, 6, size=(8, 2))
+    for frame in range(n_frames):
+        # Objects drop out for a few frames so lost and removed tracks are carried too
+        visible = rng.random(8) < 0.8
+        centers = starts[visible] + frame * velocities[visible] + rng.normal(0, 1, size=(visible.sum(), 2))
+        xyxy = np.hstack([centers - 15, centers + 15]).astype(np.float32)
+        yield sv.Detections(xyxy=xyxy, confidence=rng.uniform(0.3, 1, visible.sum()).astype(np.float32),
+                            class_id=np.zeros(visible.sum(), dtype=int))
+
+
+def test_checkpoint_round_trip(tmp_path):
+    directory = str(tmp_path / 'checkpoint')
+    checkpoint = Checkpoint(directory)
+    checkpoint.save({'frame': np.arange(3)}, {'stop': 3, 'flow': (None, np.ones((2, 1, 2), dtype=np.float32))})
+    checkpoint.save({'frame': np.arange(3, 5)}, {'stop': 5, 'flow': (np.zeros((4, 4), dtype=np.uint8), None),
+                                                 'done': [0, 2]})
+
+    resumed = Checkpoint(directory)
+    np.testing.assert_array_equal(resumed.concatenate('frame', np.empty(0, dtype=int)), np.arange(5))
+    assert resumed.state['stop'] == 5 and resumed.state['done'] == [0, 2]
+    old_gray, features = resumed.state['flow']
+    assert old_gray.dtype == np.uint8 and old_gray.shape == (4, 4) and features is None
+    assert not [name for _, _, files in os.walk(directory) for name in files if name.endswith('.pkl')]
+
+
+def test_bytetrack_state_round_trip(tmp_path):
+    detections = list(make_detections())
+    tracker = sv.ByteTrack(minimum_consecutive_frames=2)
+    for frame_detections in detections[:15]:
+        tracker.update_with_detections(frame_detections)
+    Checkpoint(str(tmp_path)).save({}, {'stop': 15, 'tracker': get_bytetrack_state(tracker)})
+
+    state = Checkpoint(str(tmp_path)).state['tracker']
+    resumed = set_bytetrack_state(sv.ByteTrack(minimum_consecutive_frames=2), state)
+    assert len(resumed.tracked_tracks) and len(resumed.lost_tracks)
+    for frame_detections in detections[15:]:
+        expected = tracker.update_with_detections(frame_detections)
+        actual = resumed.update_with_detections(frame_detections)
+        np.testing.assert_array_equal(expected.tracker_id, actual.tracker_id)
+        np.testing.assert_array_equal(expected.xyxy, actual.xyxy)
@@ -0,0 +1,78 @@
+import numpy as np
+import supervision as sv
+from detector.detector import Detector, OnnxDetector
+
+
+class FakeSession:
+    """Stands in for an ONNX Runtime session with fixed (N, 4 + classes, anchors) outputs."""
+
+    def __init__(self, prediction):
+        self.prediction = prediction
+        self.inputs = []
+
+    def run(self, output_names, feed):
+        batch = next(iter(feed.values()))
+        self.inputs.append(batch)
+        return [np.repeat(self.prediction[None], len(batch), axis=0)]
+
+
+def make_onnx_detector(prediction):
+    detector = OnnxDetector.__new__(OnnxDetector)
+    Detector.__init__(detector)
+    detector.session = FakeSession(prediction)
+    detector.input_name = 'images'
+    detector.model_batch_size = None
+    detector.iou = 0.7
+    detector.class_names = {0: 'ball', 1: 'player'}
+    return detector
+
+
+def anchor(x1, y1, x2, y2, scores):
+    # Model output of one anchor: centre, size and a score per class, in input pixels
+    return [(x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1, *scores]
+
+
+def test_onnx_decode_undoes_letterbox_and_suppresses_overlaps():
+    # A 640x480 frame fills the 640 input with 80 pixels of padding above and below
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    prediction = np.array([
+        anchor(100, 280, 140, 340, (0.0, 0.9)),
+        anchor(102, 282, 142, 342, (0.0, 0.6)),  # Suppressed by the first player
+        anchor(110, 290, 120, 300, (0.8, 0.0)),  # Another class, so kept
+        anchor(300, 300, 340, 340, (0.0, 0.05)),  # Below the threshold
+    ], dtype=np.float32).T
+    detector = make_onnx_detector(prediction)
+
+    detections = detector.detect([frame])[0]
+
+    tensor = detector.session.inputs[0]
+    assert tensor.shape == (1, 3, 640, 640) and tensor.dtype == np.float32
+    np.testing.assert_allclose(tensor[0, :, 0, 0], 114 / 255)
+    np.testing.assert_allclose(tensor[0, :, 80:560, :], 0)
+
+    order = np.argsort(detections.class_id)
+    np.testing.assert_allclose(detections.xyxy[order], [[110, 210, 120, 220], [100, 200, 140, 260]])
+    np.testing.assert_allclose(detections.confidence[order], [0.8, 0.9])
+    assert detections.data['class_name'][order].tolist() == ['ball', 'player']
+
+
+class ConstantDetector(Detector):
+    def __init__(self, detections):
+        super().__init__()
+        self.detections = detections
+
+    def _detect(self, frames, conf, frame_nums):
+        return [self.detections for _ in frames]
+
+
+def test_class_thresholds_with_non_contiguous_class_ids():
+    detector = ConstantDetector(sv.Detections(xyxy=np.zeros((3, 4), dtype=np.float32),
+                                              confidence=np.array([0.3, 0.3, 0.6], dtype=np.float32),
+                                              class_id=np.array([0, 5, 5])))
+    detector.class_names = {0: 'ball', 5: 'referee'}
+    detector.class_conf = {'referee': 0.5}
+
+    detections = detector.detect([np.zeros((4, 4, 3), dtype=np.uint8)])[0]
+
+    assert detections.class_id.tolist() == [0, 5]
+    np.testing.assert_allclose(detections.confidence, [0.3, 0.6])
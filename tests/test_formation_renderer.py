@@ -0,0 +1,38 @@
+import os
+import cv2
+import numpy as np
+from helpers import make_table
+from speed_and_distance_estimator.formation_renderer import FormationRenderer
+
+
+def read_boards(directory):
+    return {name: cv2.imread(os.path.join(directory, name)) for name in sorted(os.listdir(directory))}
+
+
+def test_parallel_render_matches_serial(tmp_path):
+    table = make_table(40)
+    renderer = FormationRenderer((360, 640), team_colors={1: (0, 0, 255), 2: (255, 0, 0)}, trail_length=5)
+    frame_nums = list(range(3, 17)) + [25, 26, 39]
+
+    renderer.render(table, output_dir=str(tmp_path / 'serial'), frame_nums=frame_nums)
+    # More ranges than workers, so tasks are submitted as results are taken
+    renderer.render(table, output_dir=str(tmp_path / 'parallel'), frame_nums=frame_nums, n_workers=2, chunk_size=3)
+
+    serial, parallel = read_boards(tmp_path / 'serial'), read_boards(tmp_path / 'parallel')
+    assert list(serial) == [renderer.frame_path('', frame_num) for frame_num in frame_nums]
+    assert list(parallel) == list(serial)
+    for name, board in serial.items():
+        np.testing.assert_array_equal(parallel[name], board, err_msg=name)
+
+
+def test_parallel_boards_come_in_frame_order():
+    table = make_table(12)
+    renderer = FormationRenderer((180, 320), trail_length=4)
+    ranges = renderer._ranges(table.n_frames, None, chunk_size=2)
+
+    serial = list(renderer._iter_boards(table, ranges, None, True, n_workers=1))
+    parallel = list(renderer._iter_boards(table, ranges, None, True, n_workers=3))
+
+    assert len(parallel) == len(serial) == 12
+    for expected, actual in zip(serial, parallel):
+        np.testing.assert_array_equal(actual, expected)
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+from speed_and_distance_estimator.kinematics import RollingKinematics, compute_kinematics
+
+
+def random_tracks(n_frames, rng, lifetime=None):
+    """Rows of random walks, with gaps, unknown positions and tracks ending for good."""
+    rows = []
+    for track_id in range(12):
+        start = rng.integers(0, n_frames // 2)
+        stop = n_frames if lifetime is None else min(n_frames, start + lifetime)
+        position = rng.uniform(0, 50, size=2)
+        for frame_num in range(start, stop):
+            position = position + rng.normal(0, 0.3, size=2)
+            if rng.random() < 0.15:
+                continue
+            rows.append((frame_num, track_id, (np.nan, np.nan) if rng.random() < 0.05 else tuple(position)))
+    rows.sort(key=lambda row: (row[0], rng.random()))
+    frame = np.array([row[0] for row in rows])
+    track_id = np.array([row[1] for row in rows])
+    position = np.array([row[2] for row in rows], dtype=np.float64)
+    return frame, track_id, position
+
+
+def stream_kinematics(kinematics, frame, track_id, position, n_frames):
+    finalized = []
+    for frame_num in range(n_frames):
+        rows = frame == frame_num
+        finalized += kinematics.update(frame_num, track_id[rows], position[rows])
+    finalized += kinematics.flush()
+    assert [frame_num for frame_num, _ in finalized] == list(range(n_frames))
+    return {name: np.concatenate([metrics[name] for _, metrics in finalized]) for name in finalized[0][1]}
+
+
+@pytest.mark.parametrize('frame_window, max_gap', [(5, None), (3, 1), (9, 4), (1, 0)])
+def test_rolling_matches_batch(frame_window, max_gap):
+    rng = np.random.default_rng(frame_window)
+    n_frames = 120
+    frame, track_id, position = random_tracks(n_frames, rng)
+
+    expected = compute_kinematics(frame, track_id, position, 25, frame_window, max_gap)
+    actual = stream_kinematics(RollingKinematics(25, frame_window, max_gap), frame, track_id, position, n_frames)
+
+    for name, values in expected.items():
+        np.testing.assert_allclose(actual[name], values, rtol=1e-9, atol=1e-9, err_msg=name)
+
+
+def test_track_lifetime_bounds_state():
+    rng = np.random.default_rng(0)
+    n_frames = 300
+    frame, track_id, position = random_tracks(n_frames, rng, lifetime=40)
+
+    kinematics = RollingKinematics(25, track_lifetime=10)
+    expected = compute_kinematics(frame, track_id, position, 25)
+    actual = stream_kinematics(kinematics, frame, track_id, position, n_frames)
+
+    for name, values in expected.items():
+        np.testing.assert_allclose(actual[name], values, rtol=1e-9, atol=1e-9, err_msg=name)
+    assert set(kinematics._totals) <= set(track_id[frame >= n_frames - 11])
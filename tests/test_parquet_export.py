@@ -0,0 +1,90 @@
+import os
+import numpy as np
+import pytest
+from export.parquet import ParquetExporter, read_dataset, read_track_table
+from helpers import assert_tables_equal, make_table
+from possession.analytics import PossessionAnalytics
+from tracker.track_table import COLUMNS, TrackTable
+
+pc = pytest.importorskip('pyarrow.compute')
+
+
+def export(root, table, match='m1', **kwargs):
+    control = np.random.default_rng(1).choice([-1, 1, 2], size=table.n_frames)
+    possession = PossessionAnalytics.from_team_ball_control(control, rolling_window=10)
+    holders = np.where(control == -1, -1, 3)
+    with ParquetExporter(root, match, **kwargs) as exporter:
+        exporter.write(table, possession, holders)
+    return possession, holders
+
+
+def test_tracks_round_trip(tmp_path):
+    table = make_table(50)
+    export(str(tmp_path), table, period_starts=(0, 20), chunk_size=8)
+
+    assert_tables_equal(table, read_track_table(str(tmp_path), 'm1'), rtol=0)
+    assert sorted(os.listdir(tmp_path / 'tracks' / 'match=m1')) == ['period=1', 'period=2']
+
+
+def test_read_frame_range_and_period(tmp_path):
+    table = make_table(50)
+    export(str(tmp_path), table, period_starts=(0, 20), chunk_size=8)
+    root = str(tmp_path)
+
+    part = read_track_table(root, 'm1', start_frame=10, stop_frame=30)
+    rows = (table.frame >= 10) & (table.frame < 30)
+    assert part.n_frames == 30 and len(part) == rows.sum()
+
+    second_half = read_dataset(root, 'tracks', columns=['frame'], match='m1', period=2)
+    assert second_half.num_rows == (table.frame >= 20).sum()
+    assert second_half.column('frame').to_numpy().min() == table.frame[table.frame >= 20].min()
+
+
+def test_possession_round_trip(tmp_path):
+    table = make_table(30)
+    possession, holders = export(str(tmp_path), table)
+
+    dataset = read_dataset(str(tmp_path), 'possession', match='m1')
+    rows = dataset.take(pc.sort_indices(dataset, sort_keys=[('frame', 'ascending')])).to_pydict()
+    np.testing.assert_array_equal(rows['frame'], np.arange(30))
+    np.testing.assert_array_equal(rows['ball_holder'], holders)
+    np.testing.assert_array_equal(rows['team'], possession.team_ball_control)
+    series = possession.time_series()
+    for team in possession.teams:
+        np.testing.assert_allclose(rows[f'possession_{team}'], series[f'possession_{team}'], rtol=1e-6)
+        np.testing.assert_allclose(rows[f'rolling_possession_{team}'], series[f'rolling_possession_{team}'],
+                                   rtol=1e-6)
+
+
+def test_streamed_frames_match_one_write(tmp_path):
+    table = make_table(30)
+    control = np.random.default_rng(1).choice([-1, 1, 2], size=table.n_frames)
+    holders = np.where(control == -1, -1, 3)
+
+    possession = PossessionAnalytics(rolling_window=10, history=11)
+    with ParquetExporter(str(tmp_path), 'live', chunk_size=7) as exporter:
+        for frame_num in range(table.n_frames):
+            possession.update(control[frame_num])
+            rows = table.frame_rows(frame_num)
+            frame = TrackTable(1, **{name: getattr(table, name)[rows] for name in COLUMNS if name != 'frame'},
+                               frame=np.zeros(rows.stop - rows.start))
+            exporter.write(frame, possession, holders[frame_num:frame_num + 1], frame_offset=frame_num)
+
+    assert_tables_equal(table, read_track_table(str(tmp_path), 'live'), rtol=0)
+
+
+def test_reexport_replaces_match_and_failed_export_keeps_it(tmp_path):
+    root = str(tmp_path)
+    export(root, make_table(30))
+    other = make_table(10, seed=5)
+    export(root, other)
+    assert_tables_equal(other, read_track_table(root, 'm1'), rtol=0)
+
+    with pytest.raises(RuntimeError):
+        with ParquetExporter(root, 'm1') as exporter:
+            exporter.write(make_table(5, seed=6), PossessionAnalytics.from_team_ball_control([1] * 5),
+                           np.full(5, -1))
+            exporter.flush()
+            raise RuntimeError
+    assert_tables_equal(other, read_track_table(root, 'm1'), rtol=0)
+    assert sorted(os.listdir(tmp_path / 'tracks')) == ['match=m1']
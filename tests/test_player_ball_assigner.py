@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+from player_ball_assigner.assigner import BallHolderStream, PlayerBallAssigner
+
+
+def stream_holders(assigner, nearest):
+    stream = BallHolderStream(assigner)
+    decided = []
+    for frame_num, holder in enumerate(nearest):
+        decided += stream.update(frame_num, holder)
+    decided += stream.flush()
+    assert [frame_num for frame_num, _ in decided] == list(range(len(nearest)))
+    return np.array([holder for _, holder in decided], dtype=np.int64)
+
+
+def test_short_spells_cascade():
+    assigner = PlayerBallAssigner()
+    nearest = np.array([1, -1, 2, 2, 1])
+    np.testing.assert_array_equal(assigner.smooth_holders(nearest), [1, -1, -1, -1, -1])
+    np.testing.assert_array_equal(stream_holders(assigner, nearest), [1, -1, -1, -1, -1])
+
+
+@pytest.mark.parametrize('max_gap_frames, min_spell_frames', [(5, 3), (1, 1), (2, 4), (0, 2)])
+def test_stream_matches_batch(max_gap_frames, min_spell_frames):
+    rng = np.random.default_rng(max_gap_frames * 10 + min_spell_frames)
+    assigner = PlayerBallAssigner()
+    assigner.max_gap_frames = max_gap_frames
+    assigner.min_spell_frames = min_spell_frames
+
+    for _ in range(300):
+        # Spells of a few players and gaps, with lengths around the thresholds
+        values = rng.choice([-1, 1, 2, 3], size=rng.integers(1, 15))
+        lengths = rng.integers(1, 9, size=len(values))
+        nearest = np.repeat(values, lengths)
+
+        np.testing.assert_array_equal(stream_holders(assigner, nearest), assigner.smooth_holders(nearest),
+                                      err_msg=str(nearest.tolist()))
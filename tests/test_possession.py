@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+from possession.analytics import PossessionAnalytics
+
+
+def random_control(n_frames, rng):
+    return rng.choice([-1, 1, 2], size=n_frames, p=[0.3, 0.35, 0.35]).repeat(rng.integers(1, 20, size=n_frames))[
+        :n_frames]
+
+
+def test_queries_match_time_series():
+    rng = np.random.default_rng(0)
+    possession = PossessionAnalytics.from_team_ball_control(random_control(500, rng), rolling_window=30)
+    series = possession.time_series()
+
+    for frame_num in (0, 17, 250, 499):
+        assert possession.team(frame_num) == series['team'][frame_num]
+        np.testing.assert_allclose(possession.possession(frame_num),
+                                   [series['possession_1'][frame_num], series['possession_2'][frame_num]])
+        np.testing.assert_allclose(possession.rolling_possession(frame_num),
+                                   [series['rolling_possession_1'][frame_num],
+                                    series['rolling_possession_2'][frame_num]])
+
+
+def test_bounded_history_matches_full_history():
+    rng = np.random.default_rng(1)
+    full = PossessionAnalytics(rolling_window=30)
+    bounded = PossessionAnalytics(rolling_window=30, history=31)
+
+    for frame_num, team in enumerate(random_control(2000, rng)):
+        assert bounded.update(team) == full.update(team)
+        assert bounded.team(frame_num) == full.team(frame_num)
+        assert bounded.possession(frame_num) == full.possession(frame_num)
+        assert bounded.rolling_possession(frame_num) == full.rolling_possession(frame_num)
+
+    assert len(bounded) == len(full) == 2000
+    assert len(bounded.team_ball_control) < 2 * 31 and len(bounded.spells) < 2 * 31
+    assert bounded.summary() == full.summary()
+    with pytest.raises(IndexError):
+        bounded.possession(100)
+    with pytest.raises(ValueError):
+        bounded.time_series()
+
+
+def test_summary():
+    possession = PossessionAnalytics.from_team_ball_control([-1, 1, 1, -1, 2, 2, 2, 1, 2])
+
+    assert possession.team_ball_control == [-1, 1, 1, 1, 2, 2, 2, 1, 2]
+    summary = possession.summary()
+    assert summary['frames'] == 9 and summary['spells'] == 4
+    assert (summary['spells_1'], summary['longest_spell_1'], summary['mean_spell_1']) == (2, 3, 2.0)
+    assert (summary['spells_2'], summary['longest_spell_2'], summary['mean_spell_2']) == (2, 3, 2.0)
+    assert summary['possession_1'] == summary['possession_2'] == 0.5
@@ -0,0 +1,66 @@
+import os
+import numpy as np
+from pipeline.stages import FRAME_STORE_DIR
+from utils.stage_cache import StageCache
+
+
+def save_entry(cache, name, n_bytes, accessed):
+    key = cache.key(name)
+    cache.save(key, {'values': np.zeros(n_bytes, dtype=np.uint8)})
+    os.utime(os.path.join(cache.cache_dir, key, 'meta.json'), (accessed, accessed))
+    return key
+
+
+def test_key_depends_on_stage_and_params():
+    cache = StageCache('unused')
+    assert cache.key('tracks', params={'conf': 0.1}) == cache.key('tracks', params={'conf': 0.1})
+    assert cache.key('tracks', params={'conf': 0.1}) != cache.key('tracks', params={'conf': 0.2})
+    assert cache.key('tracks') != cache.key('teams')
+
+
+def test_save_and_load(tmp_path):
+    cache = StageCache(str(tmp_path))
+    key = cache.key('tracks')
+    assert cache.load(key) is None
+
+    cache.save(key, {'frame': np.arange(5), 'bbox': np.ones((5, 4), dtype=np.float32)})
+    arrays = cache.load(key)
+    np.testing.assert_array_equal(arrays['frame'], np.arange(5))
+    assert arrays['bbox'].dtype == np.float32 and arrays['bbox'].shape == (5, 4)
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = StageCache(str(tmp_path), max_bytes=10 ** 6)
+    loaded = save_entry(cache, 'a', 400_000, accessed=1000)
+    unused = save_entry(cache, 'b', 400_000, accessed=2000)
+    # Loading marks an entry as used, so the other one goes first
+    cache.load(loaded)
+
+    newest = cache.key('c')
+    cache.save(newest, {'values': np.zeros(400_000, dtype=np.uint8)})
+
+    assert cache.load(unused) is None
+    assert cache.load(loaded) is not None and cache.load(newest) is not None
+
+
+def test_keeps_entry_larger_than_budget(tmp_path):
+    cache = StageCache(str(tmp_path), max_bytes=1000)
+    other = save_entry(cache, 'a', 100, accessed=1000)
+    key = cache.key('b')
+    cache.save(key, {'values': np.zeros(10_000, dtype=np.uint8)})
+
+    assert cache.load(key) is not None
+    assert cache.load(other) is None
+
+
+def test_frame_stores_are_not_evicted_with_results(tmp_path):
+    store_dir = tmp_path / FRAME_STORE_DIR / 'frames-0'
+    store_dir.mkdir(parents=True)
+    (store_dir / 'meta.json').write_text('{}')
+    (store_dir / 'frames.raw').write_bytes(bytes(50_000))
+
+    cache = StageCache(str(tmp_path), max_bytes=10_000)
+    key = save_entry(cache, 'a', 1000, accessed=1000)
+
+    assert cache.load(key) is not None
+    assert (store_dir / 'frames.raw').exists()
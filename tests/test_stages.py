@@ -0,0 +1,37 @@
+import cv2
+import numpy as np
+from detector.detector import Detector
+from pipeline.stages import build_pipeline, configure_detector
+from tracker.tracker import Tracker
+from utils.stage_cache import StageCache
+
+
+def test_detector_config_does_not_leak_into_shared_detector():
+    shared = Detector()
+    tracker = Tracker(None, model=shared)
+
+    detector = configure_detector(tracker, {'conf': 0.5, 'class_conf': {'ball': 0.05}})
+
+    assert tracker.detector is detector and detector is not shared
+    assert (detector.conf, detector.class_conf) == (0.5, {'ball': 0.05})
+    assert (shared.conf, shared.class_conf) == (0.1, {})
+    assert Tracker(None, model=shared).detector.conf == 0.1
+
+
+def test_plot_workers_do_not_change_the_cache_key(tmp_path):
+    video_path = str(tmp_path / 'video.avi')
+    writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*'MJPG'), 25, (64, 48))
+    writer.write(np.zeros((48, 64, 3), dtype=np.uint8))
+    writer.release()
+
+    cache = StageCache(str(tmp_path / 'cache'))
+
+    def plots_node(config):
+        pipeline = build_pipeline(video_path, str(tmp_path / 'output.avi'), model=Detector(), cache=cache,
+                                  config=config)
+        return pipeline.nodes['plots']
+
+    one, four = plots_node({'plots': {'n_workers': 1}}), plots_node({'plots': {'n_workers': 4}})
+    assert 'n_workers' not in one.params
+    assert one.params == four.params
+    assert plots_node({'plots': {'trail_length': 5}}).params != one.params
@@ -0,0 +1,78 @@
+import cv2
+import numpy as np
+import pytest
+from team_assigner.assigner import TeamAssigner
+from tracker.track_table import TrackTable, object_class_id
+from utils.video_utils import iter_video, iter_video_frames
+
+JERSEYS = {1: (0, 0, 220), 2: (220, 220, 220)}
+
+
+@pytest.fixture
+def video(tmp_path):
+    """Players in red or white jerseys on grass; player i enters at frame 3 * i."""
+    path = str(tmp_path / 'video.avi')
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 25, (320, 120))
+    players = []
+    for frame_num in range(30):
+        frame = np.full((120, 320, 3), (40, 140, 40), dtype=np.uint8)
+        for i in range(min(frame_num // 3 + 1, 8)):
+            x = 10 + 38 * i + frame_num % 3
+            frame[30:60, x + 4:x + 20] = JERSEYS[1 + i % 2]
+            players.append((frame_num, 10 + i, (x, 20, x + 24, 100)))
+        # A frame number in the corner to check which frames are decoded
+        cv2.putText(frame, str(frame_num), (250, 110), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 255))
+        writer.write(frame)
+    writer.release()
+
+    frame, track_id, bbox = zip(*players)
+    return path, TrackTable(30, frame=frame, track_id=track_id, bbox=bbox,
+                            object_class=np.full(len(players), object_class_id('players')))
+
+
+def test_iter_video_frames(video):
+    path, _ = video
+    frames = list(iter_video(path))
+    selected = list(iter_video_frames(path, [0, 1, 7, 20, 29, 40], read_ahead=2))
+
+    assert [frame_num for frame_num, _ in selected] == [0, 1, 7, 20, 29]
+    for frame_num, frame in selected:
+        np.testing.assert_array_equal(frame, frames[frame_num])
+
+
+def fitted_assigner(frames, table):
+    # Frame 3 has a player of each team
+    assigner = TeamAssigner()
+    assigner.fit_team_colors(frames[3], table.bbox[table.object_rows(3, 'players')])
+    return assigner
+
+
+def test_add_team_to_table_matches_every_frame(video):
+    path, table = video
+    frames = list(iter_video(path))
+    expected = fitted_assigner(frames, table)
+    expected_teams = table.team.copy()
+    for frame_num, frame in enumerate(frames):
+        rows = table.object_rows(frame_num, 'players')
+        expected_teams[rows] = expected.get_player_teams(frame, table.bbox[rows], table.track_id[rows])
+
+    fitted_assigner(frames, table).add_team_to_table(path, table)
+
+    np.testing.assert_array_equal(table.team, expected_teams)
+    # Same jersey, same team
+    jersey = (table.track_id - 10) % 2
+    assert len(set(zip(jersey, table.team))) == 2
+
+
+def test_fit_team_colors_is_deterministic(video):
+    path, table = video
+    frame = next(iter_video(path, 24))
+    bboxes = table.bbox[table.object_rows(24, 'players')]
+
+    colors = []
+    for _ in range(3):
+        assigner = TeamAssigner()
+        assigner.fit_team_colors(frame, bboxes)
+        colors.append(np.array([assigner.team_colors[1], assigner.team_colors[2]]))
+    np.testing.assert_array_equal(colors[0], colors[1])
+    np.testing.assert_array_equal(colors[0], colors[2])
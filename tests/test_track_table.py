@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+from helpers import assert_tables_equal, make_table
+from speed_and_distance_estimator.estimator import SpeedAndDistanceEstimator
+from tracker.track_table import TrackTable
+from view_transformer.view_transformer import ViewTransformer
+
+
+def test_tracks_round_trip():
+    table = make_table()
+    assert_tables_equal(table, TrackTable.from_tracks(table.to_tracks()))
+
+
+def test_arrays_round_trip():
+    table = make_table()
+    assert_tables_equal(table, TrackTable.from_arrays(table.to_arrays()))
+
+
+def test_from_tracks_with_missing_optional_fields():
+    tracks = {'players': [{5: {'bbox': [0, 0, 10, 10]}}, {}], 'ball': [{}, {1: {'bbox': [4, 4, 6, 6]}}],
+              'referees': [{}, {}]}
+    table = TrackTable.from_tracks(tracks)
+
+    assert table.n_frames == 2
+    assert len(table) == 2
+    assert np.isnan(table.confidence).all()
+    assert (table.team == 0).all()
+    assert_tables_equal(table, TrackTable.from_tracks(table.to_tracks()))
+
+
+def test_dict_api_entry_points():
+    tracks = {'players': [{5: {'bbox': [100, 500, 140, 600], 'position_adjusted': (600, 600)}}],
+              'ball': [{}], 'referees': [{}]}
+    ViewTransformer().add_transformed_position_to_tracks(tracks)
+    SpeedAndDistanceEstimator(frame_rate=25).add_speed_and_distance_to_tracks(tracks)
+
+    player = tracks['players'][0][5]
+    assert player['position_transformed'] is not None
+    assert player['bbox'] == [100, 500, 140, 600]
+
+
+def test_find_rows():
+    table = make_table()
+    rows = np.flatnonzero(table.object_mask('players'))
+    np.testing.assert_array_equal(table.find_rows(table.frame[rows], table.track_id[rows], 'players'), rows)
+    assert table.find_rows(np.array([0]), np.array([999]), 'players')[0] == -1
+
+
+def test_find_rows_with_large_frames_and_track_ids():
+    # Track ids offset per shard, and frames of a long video, beyond 20 bits each
+    frame = np.array([0, 2 ** 20, 2 ** 21 + 5, 2 ** 20, 2 ** 20])
+    track_id = np.array([2 ** 20, 0, 2 ** 30, 2 ** 31 - 1, 2 ** 20])
+    object_class = np.array([0, 0, 0, 0, 2])
+    table = TrackTable(2 ** 21 + 6, frame=frame, track_id=track_id, object_class=object_class)
+
+    players = np.flatnonzero(table.object_mask('players'))
+    np.testing.assert_array_equal(table.find_rows(table.frame[players], table.track_id[players], 'players'), players)
+    ball = np.flatnonzero(table.object_mask('ball'))
+    assert table.find_rows(table.frame[ball], table.track_id[ball], 'players').tolist() == [-1]
+    assert table.find_rows(np.array([0, -1, 2 ** 20]), np.array([-1, 0, 1]), 'players').tolist() == [-1, -1, -1]
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
@@ -0,0 +1,41 @@
+import threading
+import numpy as np
+import supervision as sv
+from detector.detector import Detector
+from tracker.tracker import Tracker
+
+
+class RecordingDetector(Detector):
+    """Finds nothing, and records the threads it runs on and whether two calls overlap."""
+
+    def __init__(self):
+        super().__init__()
+        self.class_names = {0: 'ball', 1: 'goalkeeper', 2: 'player', 3: 'referee'}
+        self.threads, self.overlapped = set(), False
+        self._running = threading.Lock()
+
+    def _detect(self, frames, conf, frame_nums):
+        if not self._running.acquire(blocking=False):
+            self.overlapped = True
+            self._running.acquire()
+        try:
+            self.threads.add(threading.get_ident())
+            return [sv.Detections.empty() for _ in frames]
+        finally:
+            self._running.release()
+
+
+def test_keyframe_fallback_runs_on_the_inference_thread():
+    detector = RecordingDetector()
+    tracker = Tracker(None, model=detector)
+    tracker.batch_size = 4
+    tracker.keyframes.interval = 3
+    # Every frame in between keyframes is detected again
+    tracker.keyframes.max_lost_fraction = -1
+    frames = [np.full((48, 64, 3), i, dtype=np.uint8) for i in range(24)]
+
+    results = list(tracker.detect_frames(frames))
+
+    assert [detected for _, _, detected in results] == [True] * len(frames)
+    assert len(detector.threads) == 1 and threading.get_ident() not in detector.threads
+    assert not detector.overlapped
@@ -0,0 +1,131 @@
+import math
+import numpy as np
+
+
+class BallSearch:
+    """
+    Looks again for the ball in frames where detection missed it.
+
+    The ball's position is predicted at constant velocity from the last frames it
+    was found in, and the detector is run on a few `crop_size` crops around the
+    prediction. Since the detector scales every crop up to its input size, the
+    ball is searched at a much higher resolution than in the full frame, at the
+    cost of a handful of small inputs. The searched area grows with the ball's
+    speed and the time since it was last seen, up to `max_tiles` crops overlapping
+    by `tile_overlap` pixels; boxes cut by a crop edge inside the frame are dropped,
+    as the neighbouring crop holds the whole ball.
+
+    After `max_lost_frames` frames without the ball, the search falls back to the
+    full frame at the detector's normal resolution, every `coarse_interval` frames
+    that the detector did not already see in full (e.g. between keyframes).
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.crop_size = 320
+        self.max_tiles = 4
+        self.tile_overlap = 32
+        self.max_lost_frames = 12
+        self.coarse_interval = 6
+        self.reset()
+
+    def params(self):
+        return {name: value for name, value in vars(self).items() if not name.startswith('_')}
+
+    def __getstate__(self):
+        # Only the settings are pickled (e.g. for shard workers), not the stream state
+        return self.params()
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.reset()
+
+    def reset(self):
+        """Starts a new frame stream."""
+        self._last_frame = None
+        self._last_center = None
+        self._velocity = np.zeros(2)
+        self._last_coarse_frame = None
+
+    def update(self, frame_num, bboxes, confidence):
+        """Records the ball candidates found in a frame; the most confident is followed."""
+        if len(bboxes) == 0:
+            return
+        best = bboxes[np.argmax(np.nan_to_num(confidence, nan=0.0))] if confidence is not None else bboxes[0]
+        center = (best[:2] + best[2:]) / 2
+
+        if self._last_frame is not None and 0 < frame_num - self._last_frame <= self.max_lost_frames:
+            self._velocity = (center - self._last_center) / (frame_num - self._last_frame)
+        else:
+            self._velocity = np.zeros(2)
+        self._last_frame, self._last_center = frame_num, center
+
+    def tiles(self, frame_shape, frame_num):
+        """
+        Crops to search in a frame, as (x1, y1, x2, y2) pixel boxes, or an empty list
+        when the ball was never seen or is lost.
+        """
+        if self._last_frame is None or not 0 < frame_num - self._last_frame <= self.max_lost_frames:
+            return []
+        frames_lost = frame_num - self._last_frame
+        center = self._last_center + self._velocity * frames_lost
+
+        # The prediction gets less certain the faster the ball and the longer it has
+        # been missing; the searched region is centred on it
+        region = self.crop_size / 2 + 2 * np.abs(self._velocity) * frames_lost
+        step = self.crop_size - self.tile_overlap
+        side = math.isqrt(self.max_tiles)
+        n_x, n_y = (min(side, max(1, math.ceil((extent - self.tile_overlap) / step))) for extent in region)
+
+        height, width = frame_shape[:2]
+        crop_width, crop_height = min(self.crop_size, width), min(self.crop_size, height)
+        tiled_width, tiled_height = n_x * step + self.tile_overlap, n_y * step + self.tile_overlap
+        x0 = int(np.clip(center[0] - tiled_width / 2, 0, max(width - tiled_width, 0)))
+        y0 = int(np.clip(center[1] - tiled_height / 2, 0, max(height - tiled_height, 0)))
+
+        crops = []
+        for i in range(n_y):
+            for j in range(n_x):
+                x1, y1 = min(x0 + j * step, width - crop_width), min(y0 + i * step, height - crop_height)
+                crops.append((x1, y1, x1 + crop_width, y1 + crop_height))
+        return crops
+
+    def search(self, frame, frame_num, detected, detect, ball_class_id):
+        """
+        Ball candidates of a frame whose detections had no ball.
+
+        Args:
+            frame (np.ndarray): The frame.
+            frame_num (int): Its number in the video.
+            detected (bool): Whether the detector already ran on the full frame.
+            detect (Callable): The detector's `detect_regions`, called with the frame,
+                the crops and `frame_num`.
+            ball_class_id (int): The detector's class id of the ball.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (N, 4) boxes in frame pixels and (N,)
+            confidences.
+        """
+        crops = self.tiles(frame.shape, frame_num)
+        if not crops:
+            if detected or (self._last_coarse_frame is not None
+                            and frame_num - self._last_coarse_frame < self.coarse_interval):
+                return np.empty((0, 4), dtype=np.float32), np.empty(0, dtype=np.float32)
+            self._last_coarse_frame = frame_num
+            crops = [(0, 0, frame.shape[1], frame.shape[0])]
+
+        height, width = frame.shape[:2]
+        bboxes, confidence = [], []
+        for (x1, y1, x2, y2), detections in zip(crops, detect(frame, crops, frame_num)):
+            xyxy = detections.xyxy
+            is_ball = detections.class_id == ball_class_id
+            # Boxes touching an edge of the crop that is not an edge of the frame are cut
+            is_ball &= ((xyxy[:, 0] > x1 + 1) | (x1 == 0)) & ((xyxy[:, 1] > y1 + 1) | (y1 == 0))
+            is_ball &= ((xyxy[:, 2] < x2 - 1) | (x2 == width)) & ((xyxy[:, 3] < y2 - 1) | (y2 == height))
+            bboxes.append(xyxy[is_ball])
+            confidence.append(np.full(is_ball.sum(), np.nan, dtype=np.float32) if detections.confidence is None
+                              else detections.confidence[is_ball])
+
+        bboxes, confidence = np.concatenate(bboxes).astype(np.float32), np.concatenate(confidence)
+        self.update(frame_num, bboxes, confidence)
+        return bboxes, confidence
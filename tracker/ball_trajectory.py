@@ -0,0 +1,226 @@
+from collections import deque
+import warnings
+import numpy as np
+
+
+def _rolling_nanmedian(values, window):
+    half_window = window // 2
+    padded = np.full((len(values) + 2 * half_window,) + values.shape[1:], np.nan)
+    padded[half_window:half_window + len(values)] = values
+    windows = np.lib.stride_tricks.sliding_window_view(padded, 2 * half_window + 1, axis=0)
+    with warnings.catch_warnings():
+        # Windows without any detection are expected and simply stay NaN
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return np.nanmedian(windows, axis=-1)
+
+
+class BallTrajectory:
+    """
+    Reconstructs one ball bounding box per frame from raw ball detections.
+
+    Every step works on arrays for the whole video (or a chunk of it):
+
+    1. A reference trajectory is the rolling median of the most confident detection
+       of each frame.
+    2. In each frame, the candidate with the best confidence, minus a penalty for its
+       distance to the reference, is selected.
+    3. Selections further than `max_deviation` pixels from the reference are rejected.
+    4. Gaps of at most `max_gap` frames are linearly interpolated; longer gaps stay NaN.
+    5. Optionally, centers are smoothed with a constant-velocity (alpha-beta) filter.
+    """
+
+    def __init__(self):
+        self.max_gap = 20
+        self.reference_window = 9
+        # Confidence a candidate loses per pixel away from the reference trajectory
+        self.motion_weight = 0.005
+        self.max_deviation = 100
+        self.smoothing = False
+        self.alpha = 0.5
+        self.beta = 0.1
+
+    @staticmethod
+    def _best_per_frame(frame, score, n_frames):
+        order = np.lexsort((-score, frame))
+        first = order[np.r_[True, frame[order][1:] != frame[order][:-1]]] if len(order) else order
+        best = np.full(n_frames, -1, dtype=np.int64)
+        best[frame[first]] = first
+        return best
+
+    def select(self, frame, bbox, confidence, n_frames):
+        """
+        Picks at most one candidate per frame.
+
+        Args:
+            frame (np.ndarray): (N,) frame of each candidate, in [0, n_frames).
+            bbox (np.ndarray): (N, 4) candidate bounding boxes.
+            confidence (np.ndarray): (N,) detector confidences (NaN counts as 0).
+            n_frames (int): Number of frames.
+
+        Returns:
+            np.ndarray: (n_frames, 4) selected bounding boxes, NaN where none is kept.
+        """
+        frame = np.asarray(frame, dtype=np.int64)
+        bbox = np.asarray(bbox, dtype=np.float64).reshape(-1, 4)
+        confidence = np.nan_to_num(np.asarray(confidence, dtype=np.float64))
+        selected = np.full((n_frames, 4), np.nan)
+        if len(frame) == 0:
+            return selected
+
+        centers = (bbox[:, :2] + bbox[:, 2:]) / 2
+
+        most_confident = self._best_per_frame(frame, confidence, n_frames)
+        reference_points = np.full((n_frames, 2), np.nan)
+        has_candidate = most_confident >= 0
+        reference_points[has_candidate] = centers[most_confident[has_candidate]]
+        reference = _rolling_nanmedian(reference_points, self.reference_window)
+
+        deviation = np.linalg.norm(centers - reference[frame], axis=1)
+        score = confidence - self.motion_weight * np.nan_to_num(deviation)
+        best = self._best_per_frame(frame, score, n_frames)
+
+        keep = best >= 0
+        keep[keep] &= ~(deviation[best[keep]] > self.max_deviation)
+        selected[keep] = bbox[best[keep]]
+        return selected
+
+    def interpolate(self, bboxes):
+        """Linearly fills gaps of at most `max_gap` frames between two known boxes."""
+        bboxes = np.array(bboxes, dtype=np.float64).reshape(-1, 4)
+        n_frames = len(bboxes)
+        index = np.arange(n_frames)
+        known = ~np.isnan(bboxes).any(axis=1)
+
+        previous = np.maximum.accumulate(np.where(known, index, -1))
+        following = np.minimum.accumulate(np.where(known, index, n_frames)[::-1])[::-1]
+        fill = (~known & (previous >= 0) & (following < n_frames)
+                & (following - previous - 1 <= self.max_gap))
+
+        previous, following = previous[fill], following[fill]
+        t = ((index[fill] - previous) / (following - previous))[:, None]
+        bboxes[fill] = bboxes[previous] + t * (bboxes[following] - bboxes[previous])
+        return bboxes
+
+    def smooth(self, bboxes):
+        """Alpha-beta (constant-velocity) filtering of box centers, restarted after gaps."""
+        bboxes = np.array(bboxes, dtype=np.float64)
+        centers = (bboxes[:, :2] + bboxes[:, 2:]) / 2
+        smoothed = centers.copy()
+
+        estimate, velocity = None, np.zeros(2)
+        for frame_num, center in enumerate(centers):
+            if np.isnan(center[0]):
+                estimate = None
+                continue
+            if estimate is None:
+                estimate, velocity = center, np.zeros(2)
+            else:
+                predicted = estimate + velocity
+                residual = center - predicted
+                estimate = predicted + self.alpha * residual
+                velocity = velocity + self.beta * residual
+            smoothed[frame_num] = estimate
+
+        shift = smoothed - centers
+        return bboxes + np.tile(shift, 2)
+
+    def reconstruct(self, frame, bbox, confidence, n_frames):
+        bboxes = self.interpolate(self.select(frame, bbox, confidence, n_frames))
+        if self.smoothing:
+            bboxes = self.smooth(bboxes)
+        return bboxes
+
+    def reconstruct_chunks(self, chunks):
+        """
+        Streaming version of `reconstruct` over consecutive chunks of candidates.
+
+        Args:
+            chunks (Iterable): (stop, frame, bbox, confidence) tuples; `stop` is the
+                frame after the chunk and `frame` holds absolute frame numbers.
+
+        Yields:
+            Tuple[int, np.ndarray]: (first frame, bboxes) for each finalized block of
+            frames. Frames are held back until enough later frames have been seen, so
+            results match whole-video reconstruction (apart from smoothing, which
+            restarts at the start of each block's context).
+        """
+        context = self.max_gap + self.reference_window
+        kept_frame = np.empty(0, dtype=np.int64)
+        kept_bbox = np.empty((0, 4))
+        kept_confidence = np.empty(0)
+        window_start, emitted, result, stop = 0, 0, None, 0
+
+        for stop, frame, bbox, confidence in chunks:
+            kept_frame = np.concatenate([kept_frame, np.asarray(frame, dtype=np.int64)])
+            kept_bbox = np.concatenate([kept_bbox, np.asarray(bbox, dtype=np.float64).reshape(-1, 4)])
+            kept_confidence = np.concatenate([kept_confidence, np.asarray(confidence, dtype=np.float64)])
+
+            result = self.reconstruct(kept_frame - window_start, kept_bbox, kept_confidence, stop - window_start)
+            result_start = window_start
+
+            ready = max(emitted, stop - context)
+            if ready > emitted:
+                yield emitted, result[emitted - result_start:ready - result_start]
+                emitted = ready
+
+            window_start = max(0, emitted - context)
+            keep = kept_frame >= window_start
+            kept_frame, kept_bbox, kept_confidence = kept_frame[keep], kept_bbox[keep], kept_confidence[keep]
+
+        if result is not None and stop > emitted:
+            yield emitted, result[emitted - result_start:stop - result_start]
+
+
+class BallTrajectoryStream:
+    """
+    Online `BallTrajectory.reconstruct` with a fixed lookahead.
+
+    The ball of a frame is reconstructed once `lookahead` later frames have been
+    seen, from the candidates of a sliding window that also reaches `max_gap +
+    reference_window` frames back, so the state stays bounded however long the
+    stream. Only gaps that end within the lookahead can be interpolated; with a
+    lookahead of at least `max_gap + reference_window // 2` frames the result matches
+    whole-video reconstruction (apart from smoothing, which restarts at the start of
+    the window).
+    """
+
+    def __init__(self, trajectory, lookahead=8):
+        self.trajectory = trajectory
+        self.lookahead = lookahead
+        context = trajectory.max_gap + trajectory.reference_window
+        # (frame_num, bboxes, confidence) of the frames in the window
+        self._frames = deque(maxlen=context + lookahead + 1)
+        self._emitted = None
+
+    def update(self, frame_num, bbox, confidence):
+        """
+        Adds the ball candidates of the next frame.
+
+        Returns:
+            List[Tuple[int, np.ndarray]]: (frame, bbox) of the frames finalized by this
+            one, at most one; the bbox is NaN where there is no ball.
+        """
+        self._frames.append((frame_num, np.asarray(bbox, dtype=np.float64).reshape(-1, 4),
+                             np.asarray(confidence, dtype=np.float64)))
+        ready = frame_num - self.lookahead
+        if ready < self._frames[0][0]:
+            return []
+        return self._emit(ready)
+
+    def flush(self):
+        """Finalizes the frames still waiting for their lookahead at the end of the stream."""
+        if not self._frames:
+            return []
+        return self._emit(self._frames[-1][0])
+
+    def _emit(self, stop):
+        window_start = self._frames[0][0]
+        frame = np.concatenate([np.full(len(bbox), frame_num) for frame_num, bbox, _ in self._frames])
+        bbox = np.concatenate([bbox for _, bbox, _ in self._frames])
+        confidence = np.concatenate([confidence for _, _, confidence in self._frames])
+        bboxes = self.trajectory.reconstruct(frame - window_start, bbox, confidence,
+                                             self._frames[-1][0] - window_start + 1)
+
+        start = window_start if self._emitted is None else self._emitted + 1
+        self._emitted = stop
+        return [(frame_num, bboxes[frame_num - window_start]) for frame_num in range(start, stop + 1)]
@@ -0,0 +1,75 @@
+import numpy as np
+from supervision.tracker.byte_tracker.single_object_track import STrack, TrackState
+
+# The track lists ByteTrack carries from one frame to the next
+TRACK_LISTS = ('tracked_tracks', 'lost_tracks', 'removed_tracks')
+
+
+def get_bytetrack_state(tracker):
+    """
+    What a `sv.ByteTrack` needs to carry on tracking, as JSON values and arrays:
+    its frame and id counters, and the ids, boxes, scores and Kalman states of its
+    tracks. Its settings are not included.
+    """
+    tracks = {}
+    for name in TRACK_LISTS:
+        for track in getattr(tracker, name):
+            tracks.setdefault(track.internal_track_id, track)
+    tracks = list(tracks.values())
+    index = {track.internal_track_id: i for i, track in enumerate(tracks)}
+
+    return {
+        'frame_id': tracker.frame_id,
+        'internal_id': tracker.internal_id_counter._id,
+        'external_id': tracker.external_id_counter._id,
+        'lists': {name: np.array([index[track.internal_track_id] for track in getattr(tracker, name)],
+                                 dtype=np.int64) for name in TRACK_LISTS},
+        'tracks': {
+            'internal_track_id': np.array([track.internal_track_id for track in tracks], dtype=np.int64),
+            'external_track_id': np.array([track.external_track_id for track in tracks], dtype=np.int64),
+            'state': np.array([track.state.value for track in tracks], dtype=np.int64),
+            'is_activated': np.array([track.is_activated for track in tracks], dtype=bool),
+            'start_frame': np.array([track.start_frame for track in tracks], dtype=np.int64),
+            'frame_id': np.array([track.frame_id for track in tracks], dtype=np.int64),
+            'tracklet_len': np.array([track.tracklet_len for track in tracks], dtype=np.int64),
+            # Scores keep their dtype (float32 from the detections) so matching is unchanged
+            'score': np.array([track.score for track in tracks]),
+            'tlwh': np.array([track._tlwh for track in tracks], dtype=np.float32).reshape(-1, 4),
+            'has_kalman': np.array([track.mean is not None for track in tracks], dtype=bool),
+            'mean': np.array([np.full(8, np.nan) if track.mean is None else track.mean
+                              for track in tracks]).reshape(-1, 8),
+            'covariance': np.array([np.full((8, 8), np.nan) if track.mean is None else track.covariance
+                                    for track in tracks]).reshape(-1, 8, 8),
+        },
+    }
+
+
+def set_bytetrack_state(tracker, state):
+    """Restores the state from `get_bytetrack_state` into `tracker`, keeping its settings."""
+    tracker.reset()
+    tracker.frame_id = int(state['frame_id'])
+    tracker.internal_id_counter._id = int(state['internal_id'])
+    tracker.external_id_counter._id = int(state['external_id'])
+
+    columns = state['tracks']
+    tracks = []
+    for i in range(len(columns['internal_track_id'])):
+        track = STrack(columns['tlwh'][i], columns['score'][i], tracker.minimum_consecutive_frames,
+                       tracker.shared_kalman, tracker.internal_id_counter, tracker.external_id_counter)
+        track.internal_track_id = int(columns['internal_track_id'][i])
+        track.external_track_id = int(columns['external_track_id'][i])
+        track.state = TrackState(int(columns['state'][i]))
+        track.is_activated = bool(columns['is_activated'][i])
+        track.start_frame = int(columns['start_frame'][i])
+        track.frame_id = int(columns['frame_id'][i])
+        track.tracklet_len = int(columns['tracklet_len'][i])
+        if columns['has_kalman'][i]:
+            track.kalman_filter = tracker.kalman_filter
+            track.mean = np.array(columns['mean'][i])
+            track.covariance = np.array(columns['covariance'][i])
+        tracks.append(track)
+
+    for name in TRACK_LISTS:
+        setattr(tracker, name, [tracks[i] for i in state['lists'][name]])
+    return tracker
+
@@ -0,0 +1,140 @@
+import cv2
+import numpy as np
+import supervision as sv
+from camera_movement.estimator import CameraMovementEstimator
+from utils.profiling import get_profiler
+
+
+class KeyframeScheduler:
+    """
+    Decides which frames go through the detector and moves the boxes of the last
+    keyframe along the sparse optical flow of the frames in between.
+
+    A frame is a keyframe every `interval` frames, when the camera moves more than
+    `max_camera_movement` pixels since the previous frame, or when more than
+    `max_lost_fraction` of the propagated boxes lose their flow points. With an
+    `interval` of 1 every frame is detected and nothing is propagated.
+
+    Only players, goalkeepers and referees are propagated; the ball is too small and
+    fast for flow, and its gaps are filled by the ball trajectory reconstruction.
+    """
+
+    def __init__(self):
+        self.interval = 1
+        self.max_camera_movement = 15.0
+        self.max_lost_fraction = 0.3
+        # Flow is computed on a downscaled grayscale frame; boxes stay in full resolution
+        self.downscale = 0.5
+        # Each box is followed by a grid of grid_size x grid_size points in its centre
+        self.grid_size = 3
+        self.propagated_classes = ('player', 'goalkeeper', 'referee')
+        self.lk_params = dict(
+            winSize=(15, 15),
+            maxLevel=2,
+            criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03)
+        )
+        self.reset()
+
+    def params(self):
+        return {name: value for name, value in vars(self).items() if not name.startswith('_')}
+
+    def __getstate__(self):
+        # Only the settings are pickled (e.g. for shard workers), not the stream state
+        return self.params()
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.reset()
+
+    def reset(self):
+        """Starts a new frame stream, whose first frame is a keyframe."""
+        self._camera_movement = None
+        self._since_keyframe = None
+        self._previous = None
+
+    def select(self, frames):
+        """
+        Which of the next `frames` of the stream are keyframes.
+
+        Returns:
+            List[bool]: One flag per frame.
+        """
+        keyframes = []
+        for frame in frames:
+            if self._camera_movement is None:
+                self._camera_movement = CameraMovementEstimator(frame)
+                self._camera_movement.downscale = self.downscale
+                self._camera_movement.start(frame)
+                movement = 0.0
+            else:
+                movement = np.hypot(*self._camera_movement.update(frame))
+
+            is_keyframe = (self._since_keyframe is None or self._since_keyframe + 1 >= self.interval
+                           or movement > self.max_camera_movement)
+            self._since_keyframe = 0 if is_keyframe else self._since_keyframe + 1
+            keyframes.append(is_keyframe)
+        return keyframes
+
+    def propagate(self, frame, detections, detect, class_names):
+        """
+        Detections of the next frame of the stream.
+
+        Args:
+            frame (np.ndarray): The frame.
+            detections (Optional[sv.Detections]): The detector's output for a
+                keyframe, or None for a frame in between.
+            detect (Callable[[np.ndarray], sv.Detections]): Runs the detector on the
+                frame when propagation loses too many boxes.
+            class_names (Dict[int, str]): The detector's class names.
+
+        Returns:
+            Tuple[sv.Detections, bool]: Detected or propagated boxes, and whether the
+            detector ran on the frame.
+        """
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if self.downscale != 1:
+            gray = cv2.resize(gray, None, fx=self.downscale, fy=self.downscale, interpolation=cv2.INTER_AREA)
+
+        detected = True
+        if detections is None and self._previous is not None:
+            with get_profiler().section('detection.propagate', frames=1):
+                detections, lost_fraction = self._propagate(gray)
+            detected = False
+            if lost_fraction > self.max_lost_fraction:
+                detections, detected = None, True
+        if detections is None:
+            detections = detect(frame)
+
+        propagated = np.isin([class_names[class_id] for class_id in detections.class_id], self.propagated_classes)
+        self._previous = (gray, detections[propagated])
+        return detections, detected
+
+    def _propagate(self, gray):
+        previous_gray, previous = self._previous
+        n_boxes = len(previous)
+        if n_boxes == 0:
+            return previous, 0.0
+
+        # Points on a grid over the central half of each box, where the player is
+        steps = 0.25 + 0.5 * (np.arange(self.grid_size) + 0.5) / self.grid_size
+        boxes = previous.xyxy * self.downscale
+        xs = boxes[:, 0, None] + (boxes[:, 2] - boxes[:, 0])[:, None] * steps
+        ys = boxes[:, 1, None] + (boxes[:, 3] - boxes[:, 1])[:, None] * steps
+        points = np.stack(np.broadcast_arrays(xs[:, None, :], ys[:, :, None]), axis=-1)
+        points = points.reshape(-1, 1, 2).astype(np.float32)
+
+        new_points, status, _ = cv2.calcOpticalFlowPyrLK(previous_gray, gray, points, None, **self.lk_params)
+        flow = (new_points - points).reshape(n_boxes, -1, 2) / self.downscale
+        found = status.reshape(n_boxes, -1).astype(bool)
+        tracked = found.sum(axis=1) >= max(1, found.shape[1] // 3)
+
+        # Boxes that lost their points move with the median of the others
+        shift = np.zeros((n_boxes, 2), dtype=np.float32)
+        if tracked.any():
+            flow[~found] = np.nan
+            shift[tracked] = np.nanmedian(flow[tracked], axis=1)
+            shift[~tracked] = np.median(shift[tracked], axis=0)
+
+        propagated = sv.Detections(xyxy=(previous.xyxy + np.tile(shift, 2)).astype(np.float32),
+                                   confidence=previous.confidence, class_id=previous.class_id, data=previous.data)
+        return propagated, 1 - tracked.mean()
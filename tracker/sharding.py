@@ -0,0 +1,190 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from tracker.track_table import object_class_id
+from utils.bbox_utils import iou_matrix
+from utils.video_utils import get_video_info, iter_video
+
+_worker_state = {}
+
+
+def _init_worker(model_path, model, backend, detector_params, params):
+    from detector.detector import load_detector
+    # The model is loaded once per worker and shared by all the shards it tracks
+    detector = load_detector(model_path, model, backend)
+    for name, value in detector_params.items():
+        setattr(detector, name, value)
+    _worker_state.update(model_path=model_path, detector=detector, params=params)
+
+
+def _track_shard(index, video_path, read_start, stop):
+    from tracker.tracker import Tracker
+    tracker = Tracker(_worker_state['model_path'], model=_worker_state['detector'])
+    for name, value in _worker_state['params'].items():
+        setattr(tracker, name, value)
+
+    stop_frame, columns = None, None
+    for stop_frame, columns in tracker._iter_track_chunks(iter_video(video_path, read_start, stop), read_start):
+        pass
+    return index, stop_frame, columns
+
+
+def shard_ranges(frame_count, n_shards, overlap):
+    """
+    (read_start, start, stop) of each shard: a shard owns frames `start:stop` and
+    reads `overlap` frames before them to warm up its tracker. The last shard
+    reads to the end of the video, since containers can miscount frames.
+    """
+    shard_size = max(1, -(-max(frame_count, 1) // n_shards))
+    starts = list(range(0, max(frame_count, 1), shard_size))
+    stops = starts[1:] + [None]
+    return [(max(0, start - overlap), start, stop) for start, stop in zip(starts, stops)]
+
+
+def match_tracks(previous, current, min_iou=0.3):
+    """
+    Matches the track ids of two shards on the frames both of them tracked.
+
+    Args:
+        previous (dict): Columns of the earlier shard's rows in the shared frames.
+        current (dict): Columns of the later shard's rows in the same frames.
+        min_iou (float): Smallest mean IoU over the shared frames for a match.
+
+    Returns:
+        Dict[int, int]: Track id in `current` -> matching track id in `previous`.
+    """
+    frames = np.union1d(previous['frame'], current['frame'])
+    if len(frames) == 0:
+        return {}
+
+    previous_ids, previous_index = np.unique(previous['track_id'], return_inverse=True)
+    current_ids, current_index = np.unique(current['track_id'], return_inverse=True)
+    scores = np.zeros((len(previous_ids), len(current_ids)))
+
+    for frame_num in frames:
+        a = np.flatnonzero(previous['frame'] == frame_num)
+        b = np.flatnonzero(current['frame'] == frame_num)
+        if len(a) == 0 or len(b) == 0:
+            continue
+        iou = iou_matrix(previous['bbox'][a], current['bbox'][b])
+        iou[previous['object_class'][a][:, None] != current['object_class'][b][None, :]] = 0
+        np.add.at(scores, (previous_index[a][:, None], current_index[b][None, :]), iou)
+
+    # A track of the later shard only appears once its tracker has confirmed it, so
+    # its IoU is averaged over the shared frames it was tracked in
+    scores /= np.maximum(np.bincount(current_index, minlength=len(current_ids)), 1)
+
+    # Greedy one-to-one assignment, best mean IoU first
+    pairs = np.argwhere(scores >= min_iou)
+    pairs = pairs[np.argsort(-scores[pairs[:, 0], pairs[:, 1]], kind='stable')]
+
+    matches, used = {}, set()
+    for i, j in pairs:
+        if current_ids[j] not in matches and previous_ids[i] not in used:
+            matches[int(current_ids[j])] = int(previous_ids[i])
+            used.add(previous_ids[i])
+    return matches
+
+
+def _select(columns, mask):
+    return {name: values[mask] for name, values in columns.items()}
+
+
+def stitch_shards(shards, min_iou=0.3):
+    """
+    Joins the rows of consecutive shards into one track set.
+
+    Each shard's tracks are matched to the previous shard's on the frames both
+    tracked; matched tracks take over the earlier id and unmatched ones get ids not
+    used so far. Rows of shared frames are kept from the earlier shard.
+
+    Args:
+        shards (List[Tuple[int, int, dict]]): (read_start, start, columns) per shard,
+            in frame order, as returned by the shard workers.
+        min_iou (float): See `match_tracks`.
+
+    Returns:
+        dict: The stitched columns.
+    """
+    ball_class = object_class_id('ball')
+    stitched, previous = [], None
+    next_id = 1
+
+    for read_start, start, columns in shards:
+        columns = {name: np.asarray(values) for name, values in columns.items()}
+        track_ids = columns['track_id'].copy()
+        tracked = columns['object_class'] != ball_class
+
+        mapping = {}
+        if previous is not None:
+            in_previous = ((previous['frame'] >= read_start) & (previous['frame'] < start)
+                           & (previous['object_class'] != ball_class))
+            in_current = (columns['frame'] < start) & tracked
+            mapping = match_tracks(_select(previous, in_previous), _select(columns, in_current), min_iou)
+
+        for track_id in np.unique(track_ids[tracked]).tolist():
+            if track_id not in mapping:
+                mapping[track_id] = next_id
+                next_id += 1
+        if mapping:
+            old_ids = np.array(list(mapping))
+            new_ids = np.array(list(mapping.values()))
+            order = np.argsort(old_ids)
+            track_ids[tracked] = new_ids[order][np.searchsorted(old_ids[order], track_ids[tracked])]
+        next_id = max(next_id, int(track_ids[tracked].max(initial=0)) + 1)
+        columns['track_id'] = track_ids
+
+        owned = columns['frame'] >= start
+        stitched.append(_select(columns, owned))
+        previous = columns
+
+    return {name: np.concatenate([chunk[name] for chunk in stitched]) for name in stitched[0]}
+
+
+def track_video_sharded(tracker, video_path, n_shards, overlap=30, n_workers=None, min_iou=0.3,
+                        checkpoint=None):
+    """
+    Detection and tracking of a video split into `n_shards` time segments that are
+    tracked in parallel processes and stitched back into one track set.
+
+    Each shard starts `overlap` frames early so that the tracks it shares with the
+    previous shard can be matched by IoU. Track ids are renumbered from 1. With a
+    `Checkpoint`, finished shards are saved and skipped when the run is resumed.
+
+    Returns:
+        Tuple[int, dict]: The number of frames and the stitched columns.
+    """
+    frame_count = get_video_info(video_path)[3]
+    ranges = shard_ranges(frame_count, n_shards, overlap)
+    params = {'batch_size': tracker.batch_size, 'max_batch_size': tracker.max_batch_size,
+              'prefetch_frames': tracker.prefetch_frames, 'keyframes': tracker.keyframes,
+              'ball_search': tracker.ball_search}
+
+    results = {}
+    if checkpoint is not None:
+        for chunk in checkpoint.chunks:
+            results[int(chunk['shard'])] = (int(chunk['stop']), {name: values for name, values in chunk.items()
+                                                                 if name not in ('shard', 'stop')})
+
+    pending = [index for index in range(len(ranges)) if index not in results]
+    if pending:
+        # The model object is only sent to workers when no weights file can be loaded there
+        detector = tracker.detector
+        model = detector if tracker.model_path is None else None
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=min(n_workers or n_shards, len(pending)), mp_context=context,
+                                 initializer=_init_worker,
+                                 initargs=(tracker.model_path, model, detector.name, detector.params(),
+                                           params)) as executor:
+            futures = [executor.submit(_track_shard, index, video_path, ranges[index][0], ranges[index][2])
+                       for index in pending]
+            for future in as_completed(futures):
+                index, stop_frame, columns = future.result()
+                results[index] = (stop_frame, columns)
+                if checkpoint is not None:
+                    checkpoint.save(dict(columns, shard=np.array(index), stop=np.array(stop_frame)),
+                                    {'done': sorted(results)})
+
+    n_frames = max(stop_frame for stop_frame, _ in results.values())
+    shards = [(read_start, start, results[index][1]) for index, (read_start, start, _) in enumerate(ranges)]
+    return n_frames, stitch_shards(shards, min_iou)
@@ -0,0 +1,216 @@
+import numpy as np
+
+
+OBJECT_CLASSES = ('players', 'referees', 'ball')
+
+# name -> (dtype, per-row shape, fill value for rows that have not been computed yet)
+COLUMNS = {
+    'frame': (np.int32, (), 0),
+    'track_id': (np.int32, (), 0),
+    'object_class': (np.int8, (), 0),
+    'bbox': (np.float32, (4,), np.nan),
+    'confidence': (np.float32, (), np.nan),
+    'position': (np.float32, (2,), np.nan),
+    'position_adjusted': (np.float32, (2,), np.nan),
+    'position_transformed': (np.float32, (2,), np.nan),
+    'team': (np.int8, (), 0),
+    'has_ball': (np.bool_, (), False),
+    'speed': (np.float32, (), np.nan),
+    'distance': (np.float32, (), np.nan),
+    'acceleration': (np.float32, (), np.nan),
+    'player_load': (np.float32, (), np.nan),
+}
+
+METRIC_COLUMNS = ('speed', 'distance', 'acceleration', 'player_load')
+
+
+def object_class_id(object_name):
+    return OBJECT_CLASSES.index(object_name)
+
+
+class TrackTable:
+    """
+    Columnar store for every tracked object in a video.
+
+    Each row is one object in one frame. Rows are kept sorted by frame, so the rows of
+    frame `f` are `frame_offsets[f]:frame_offsets[f + 1]`. Values that have not been
+    computed yet are NaN (floats), 0 (team) or False (has_ball).
+
+    `from_tracks` / `to_tracks` convert from and to the nested
+    `tracks[object][frame][track_id]` dicts used by the drawing code.
+    """
+
+    def __init__(self, n_frames, **columns):
+        length = len(columns['frame'])
+        order = np.argsort(np.asarray(columns['frame']), kind='stable')
+
+        for name, (dtype, shape, fill) in COLUMNS.items():
+            if name in columns:
+                values = np.asarray(columns[name], dtype=dtype).reshape((length,) + shape)[order]
+            else:
+                values = np.full((length,) + shape, fill, dtype=dtype)
+            setattr(self, name, values)
+
+        self.n_frames = int(n_frames)
+        self.frame_offsets = np.searchsorted(self.frame, np.arange(self.n_frames + 1))
+        self._row_keys = None
+
+    def __len__(self):
+        return len(self.frame)
+
+    def frame_rows(self, frame_num):
+        return slice(self.frame_offsets[frame_num], self.frame_offsets[frame_num + 1])
+
+    def object_mask(self, object_name):
+        return self.object_class == object_class_id(object_name)
+
+    def object_rows(self, frame_num, object_name):
+        rows = self.frame_rows(frame_num)
+        return rows.start + np.flatnonzero(self.object_class[rows] == object_class_id(object_name))
+
+    def _keys(self, frame, track_id, object_class):
+        # Packs (object_class, track_id, frame) into one sortable uint64, with 31 bits
+        # for frames and track ids: any non-negative int32 the columns can hold
+        frame = np.asarray(frame, dtype=np.int64)
+        track_id = np.asarray(track_id, dtype=np.int64)
+        object_class = np.asarray(object_class, dtype=np.int64)
+        for name, values, limit in (('frame', frame, 2 ** 31), ('track id', track_id, 2 ** 31),
+                                    ('object class', object_class, 4)):
+            if values.size and (values.min() < 0 or values.max() >= limit):
+                raise ValueError(f"Cannot index a {name} outside [0, {limit})")
+        return ((object_class.astype(np.uint64) << np.uint64(62)) | (track_id.astype(np.uint64) << np.uint64(31))
+                | frame.astype(np.uint64))
+
+    def find_rows(self, frame, track_id, object_name):
+        """
+        Vectorized lookup of the rows holding `track_id` of `object_name` in `frame`.
+
+        Returns:
+            np.ndarray: Row indices, -1 where the object is not present in that frame.
+        """
+        if self._row_keys is None:
+            keys = self._keys(self.frame, self.track_id, self.object_class)
+            order = np.argsort(keys, kind='stable')
+            self._row_keys = (keys[order], order)
+        sorted_keys, order = self._row_keys
+
+        # Frames and track ids that no row can have, e.g. -1, are not found
+        frame, track_id = np.broadcast_arrays(np.asarray(frame, dtype=np.int64), np.asarray(track_id, dtype=np.int64))
+        valid = (frame >= 0) & (frame < 2 ** 31) & (track_id >= 0) & (track_id < 2 ** 31)
+        keys = self._keys(np.where(valid, frame, 0), np.where(valid, track_id, 0), object_class_id(object_name))
+        if len(sorted_keys) == 0:
+            return np.full(keys.shape, -1, dtype=np.int64)
+        index = np.minimum(np.searchsorted(sorted_keys, keys), len(sorted_keys) - 1)
+        found = (sorted_keys[index] == keys) & valid
+        return np.where(found, order[index], -1)
+
+    def object_bboxes(self, object_name, track_id):
+        """(n_frames, 4) bounding boxes of one track, NaN in frames where it is missing."""
+        rows = self.find_rows(np.arange(self.n_frames), track_id, object_name)
+        bboxes = np.full((self.n_frames, 4), np.nan, dtype=np.float32)
+        bboxes[rows >= 0] = self.bbox[rows[rows >= 0]]
+        return bboxes
+
+    def replace_object_rows(self, object_name, frame, track_id, **columns):
+        """
+        Returns a new table in which all rows of `object_name` are replaced by the given
+        rows; columns not passed are left at their fill value for the new rows.
+        """
+        keep = ~self.object_mask(object_name)
+        length = len(frame)
+        columns = dict(columns, frame=frame, track_id=track_id,
+                       object_class=np.full(length, object_class_id(object_name)))
+
+        merged = {}
+        for name, (dtype, shape, fill) in COLUMNS.items():
+            if name in columns:
+                new_values = np.asarray(columns[name], dtype=dtype).reshape((length,) + shape)
+            else:
+                new_values = np.full((length,) + shape, fill, dtype=dtype)
+            merged[name] = np.concatenate([getattr(self, name)[keep], new_values])
+
+        return TrackTable(self.n_frames, **merged)
+
+    def to_arrays(self):
+        arrays = {name: getattr(self, name) for name in COLUMNS}
+        arrays['n_frames'] = np.array(self.n_frames)
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        columns = {name: arrays[name] for name in COLUMNS if name in arrays}
+        return cls(int(arrays['n_frames']), **columns)
+
+    @classmethod
+    def from_tracks(cls, tracks):
+        n_frames = max(len(object_tracks) for object_tracks in tracks.values())
+        columns = {name: [] for name in COLUMNS}
+
+        for object_name, object_tracks in tracks.items():
+            object_class = object_class_id(object_name)
+            for frame_num, track in enumerate(object_tracks):
+                for track_id, track_info in track.items():
+                    columns['frame'].append(frame_num)
+                    columns['track_id'].append(track_id)
+                    columns['object_class'].append(object_class)
+                    columns['bbox'].append(track_info['bbox'])
+                    columns['confidence'].append(track_info.get('confidence', np.nan))
+                    for name in ('position', 'position_adjusted', 'position_transformed'):
+                        value = track_info.get(name)
+                        columns[name].append((np.nan, np.nan) if value is None else value)
+                    columns['team'].append(track_info.get('team', 0))
+                    columns['has_ball'].append(track_info.get('has_ball', False))
+                    for name in METRIC_COLUMNS:
+                        columns[name].append(track_info.get(name, np.nan))
+
+        return cls(n_frames, **columns)
+
+    def _track_infos(self, team_colors):
+        # Converting each column with tolist() once is much cheaper than indexing numpy
+        # arrays row by row.
+        columns = {name: getattr(self, name).tolist() for name in COLUMNS}
+
+        for row in range(len(self)):
+            track_info = {'bbox': columns['bbox'][row]}
+
+            confidence = columns['confidence'][row]
+            if confidence == confidence:
+                track_info['confidence'] = confidence
+
+            position = columns['position'][row]
+            if position[0] == position[0]:
+                track_info['position'] = tuple(position)
+            position_adjusted = columns['position_adjusted'][row]
+            if position_adjusted[0] == position_adjusted[0]:
+                track_info['position_adjusted'] = tuple(position_adjusted)
+                transformed = columns['position_transformed'][row]
+                track_info['position_transformed'] = transformed if transformed[0] == transformed[0] else None
+
+            team = columns['team'][row]
+            if team > 0:
+                track_info['team'] = team
+                if team_colors is not None:
+                    track_info['team_color'] = team_colors[team]
+            if columns['has_ball'][row]:
+                track_info['has_ball'] = True
+
+            for name in METRIC_COLUMNS:
+                value = columns[name][row]
+                if value == value:
+                    track_info[name] = value
+
+            object_name = OBJECT_CLASSES[columns['object_class'][row]]
+            yield object_name, columns['frame'][row], columns['track_id'][row], track_info
+
+    def to_tracks(self, team_colors=None):
+        tracks = {object_name: [{} for _ in range(self.n_frames)] for object_name in OBJECT_CLASSES}
+
+        for object_name, frame_num, track_id, track_info in self._track_infos(team_colors):
+            tracks[object_name][frame_num][track_id] = track_info
+
+        return tracks
+
+    def update_tracks(self, tracks, team_colors=None):
+        """Writes the table's values back into the `tracks` dicts it was built from."""
+        for object_name, frame_num, track_id, track_info in self._track_infos(team_colors):
+            tracks[object_name][frame_num][track_id].update(track_info)
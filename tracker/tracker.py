@@ -1,102 +1,321 @@
-import os
-import pickle
-from ultralytics import YOLO
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import count, islice
 import cv2
 import supervision as sv
 import numpy as np
-import pandas as pd
-from utils.bbox_utils import get_center_of_bbox, get_width_of_bbox, get_foot_position
+from detector.detector import load_detector
+from utils.bbox_utils import get_center_of_bbox, get_width_of_bbox
+from utils.prefetch import prefetch
+from utils.profiling import get_profiler
+from utils.renderer import draw_panel
+from utils.video_utils import iter_video
+from tracker.ball_search import BallSearch
+from tracker.ball_trajectory import BallTrajectory
+from tracker.bytetrack_state import get_bytetrack_state, set_bytetrack_state
+from tracker.keyframes import KeyframeScheduler
+from tracker.sharding import track_video_sharded
+from tracker.track_table import COLUMNS, TrackTable, object_class_id
+
+
+# Columns filled in by detection and tracking; the other stages add the rest
+TRACKED_COLUMNS = ('frame', 'track_id', 'object_class', 'bbox', 'confidence')
+
+
+def _concatenate_columns(chunks):
+    columns = {}
+    for name in TRACKED_COLUMNS:
+        _, shape, _ = COLUMNS[name]
+        columns[name] = np.concatenate([np.empty((0,) + shape)] + [chunk[name] for chunk in chunks])
+    return columns
 
 
 class Tracker:
-    def __init__(self, model_path):
-        self.model= YOLO(model_path)
+    def __init__(self, model_path, model=None, backend=None):
+        self.model_path = model_path
+        # A Detector or any object with YOLO's predict() interface can stand in for
+        # the weights, e.g. the deterministic fake detector of the benchmark suite
+        self.detector = load_detector(model_path, model, backend)
         self.tracker = sv.ByteTrack()
+        # None auto-tunes the batch size on the first batches of the video
+        self.batch_size = 20
+        self.max_batch_size = 64
+        self.prefetch_frames = 32
+        # With more than one shard, track_video splits the video into time segments
+        # tracked in parallel processes and stitched on `shard_overlap` shared frames
+        self.n_shards = 1
+        self.shard_overlap = 30
+        # keyframes.interval > 1 detects only keyframes and propagates boxes in between
+        self.keyframes = KeyframeScheduler()
+        # Frames without a ball detection are searched again around its predicted position
+        self.ball_search = BallSearch()
+        self.ball_trajectory = BallTrajectory()
+        # While detect_frames runs, every detector call goes through its inference thread
+        self._inference = None
+
+    def add_position_to_table(self, table):
+        bbox = table.bbox
+        foot_position = np.stack([(bbox[:, 0] + bbox[:, 2]) / 2, bbox[:, 3]], axis=1)
+        # Same truncation as get_center_of_bbox
+        center = np.trunc((bbox[:, :2] + bbox[:, 2:]) / 2)
+        is_ball = table.object_mask('ball')
+        table.position = np.where(is_ball[:, None], center, foot_position).astype(np.float32)
 
     def add_position_to_tracks(self, tracks):
-        for object, object_tracks in tracks.items():
-            for frame_num, track in enumerate(object_tracks):
-                for track_id, track_info in track.items():
-                    bbox= track_info['bbox']
-                    if object == 'ball':
-                        position = get_center_of_bbox(bbox)
-                    else:
-                        position = get_foot_position(bbox)
-                    tracks[object][frame_num][track_id]['position'] = position
+        table = TrackTable.from_tracks(tracks)
+        self.add_position_to_table(table)
+        table.update_tracks(tracks)
 
 
     def interpolate_ball_positions(self, ball_positions):
-        ball_positions = [x.get(1, {}).get('bbox', []) for x in ball_positions]
-        df_ball_positions = pd.DataFrame(ball_positions, columns=['x1', 'y1', 'x2', 'y2'])
-
-        # Interpolate missing values
-        df_ball_positions = df_ball_positions.interpolate()
-        df_ball_positions = df_ball_positions.bfill()
-
-        ball_positions = [{1: {"bbox": x}} for x in df_ball_positions.to_numpy().tolist()]
-
-        return ball_positions
-        
-    def detect_frames(self, frames):
-        batch_size= 20
-        detections = []
-        for i in range(0, len(frames), batch_size):
-            detections_batch = self.model.predict(frames[i:i+batch_size], conf=0.1)
-            detections+= detections_batch
-        return detections 
-        
-    def get_object_tracks(self, frames, read_from_stub= False, stub_path= None):
-
-        if read_from_stub and stub_path is not None and os.path.exists(stub_path):
-            with open(stub_path, 'rb') as f:
-                tracks = pickle.load(f)
-            return tracks
-
-        detections = self.detect_frames(frames)
-        
-        tracks={ 'players' : [],
-                 'ball' : [] ,
-                 'referees' : [] }
-
-        for frame_num, detection in enumerate(detections):
-                cls_names= detection.names
-                cls_names_inv = {v: k for k, v in cls_names.items()}
-            
-                detection_supervision = sv.Detections.from_ultralytics(detection)
-                
-                for object_ind, class_id in enumerate(detection_supervision.class_id):
-                    if cls_names[class_id] == 'goalkeeper':
-                        detection_supervision.class_id[object_ind] = cls_names_inv['player']
-        
-                detection_with_tracks = self.tracker.update_with_detections(detection_supervision)
-        
-                tracks['players'].append({})
-                tracks['ball'].append({})
-                tracks['referees'].append({})
-        
-                for frame_detection in detection_with_tracks:
-                    bbox = frame_detection[0].tolist()
-                    class_id = frame_detection[3]
-                    track_id = frame_detection[4]
-            
-                    if class_id == cls_names_inv['player']:
-                        tracks['players'][frame_num][track_id] = {'bbox' : bbox}
-                
-                    if class_id == cls_names_inv['referee']:
-                        tracks['referees'][frame_num][track_id] = {'bbox' : bbox}
-
-                for frame_detection in detection_supervision:
-                    bbox = frame_detection[0].tolist()
-                    cls_id = frame_detection[3]
-
-                    if cls_id == cls_names_inv['ball']:
-                        tracks['ball'][frame_num][1] = {'bbox' : bbox}
-
-        if stub_path is not None:
-            with open(stub_path, 'wb') as f:
-                pickle.dump(tracks, f)
-
-        return tracks
+        bboxes = np.array([x.get(1, {}).get('bbox', [np.nan] * 4) for x in ball_positions], dtype=np.float64)
+        bboxes = self.ball_trajectory.interpolate(bboxes)
+
+        return [{1: {"bbox": bbox}} if bbox[0] == bbox[0] else {} for bbox in bboxes.tolist()]
+
+    def reconstruct_ball_trajectory(self, table):
+        """
+        Replaces the raw ball candidates of `table` with one reconstructed ball track
+        (track id 1) and returns the new table.
+        """
+        ball_rows = np.flatnonzero(table.object_mask('ball'))
+        bboxes = self.ball_trajectory.reconstruct(table.frame[ball_rows], table.bbox[ball_rows],
+                                                  table.confidence[ball_rows], table.n_frames)
+
+        frames = np.flatnonzero(~np.isnan(bboxes).any(axis=1))
+        return table.replace_object_rows('ball', frames, np.ones(len(frames)), bbox=bboxes[frames])
+
+    def _predict_batches(self, frames, start_frame=0):
+        frames = iter(frames)
+        batch_size = self.batch_size or 4
+        tuning = self.batch_size is None
+        best_rate = 0.0
+        use_keyframes = self.keyframes.interval > 1
+
+        while True:
+            batch = list(islice(frames, batch_size))
+            if not batch:
+                return
+
+            start = time.perf_counter()
+            frame_nums = list(range(start_frame, start_frame + len(batch)))
+            start_frame += len(batch)
+            # Frames in between keyframes are left as None for detect_frames to fill
+            keyframes = self.keyframes.select(batch) if use_keyframes else [True] * len(batch)
+            detected = [i for i, is_keyframe in enumerate(keyframes) if is_keyframe]
+            detections_batch = [None] * len(batch)
+            if detected:
+                with get_profiler().section('detection.predict', frames=len(detected)):
+                    detections = self._infer(self.detector.detect, [batch[i] for i in detected],
+                                             [frame_nums[i] for i in detected])
+                for i, detection in zip(detected, detections):
+                    detections_batch[i] = detection
+            rate = len(batch) / max(time.perf_counter() - start, 1e-9)
+
+            # Double the batch size while it keeps improving throughput, then settle
+            if tuning and len(batch) == batch_size:
+                if rate > best_rate * 1.05 and batch_size * 2 <= self.max_batch_size:
+                    best_rate = rate
+                    batch_size *= 2
+                else:
+                    if rate < best_rate:
+                        batch_size //= 2
+                    tuning = False
+
+            yield batch, detections_batch
+
+    def detect_frames(self, frames, start_frame=0):
+        # Decoding, inference and the caller's tracking loop run concurrently: frames are
+        # decoded on one thread into a bounded queue, batched inference runs on another,
+        # and (frame, detections, detected) are yielded in frame order, `detected` being
+        # False for boxes propagated between keyframes. The detector is not thread-safe,
+        # so it only ever runs on one inference thread, which also serves the frames the
+        # caller detects again (keyframe fallback, ball search).
+        decoded_frames = prefetch(frames, max_size=self.prefetch_frames)
+        self.keyframes.reset()
+        self._inference = ThreadPoolExecutor(max_workers=1, thread_name_prefix='inference')
+        batches = prefetch(self._predict_batches(decoded_frames, start_frame), max_size=2)
+
+        try:
+            frame_nums = count(start_frame)
+            for batch, detections_batch in batches:
+                if self.keyframes.interval == 1:
+                    for frame, detections in zip(batch, detections_batch):
+                        yield frame, detections, True
+                    continue
+                for frame, frame_num, detections in zip(batch, frame_nums, detections_batch):
+                    detect = partial(self._detect_frame, frame_num=frame_num)
+                    yield (frame, *self.keyframes.propagate(frame, detections, detect, self.detector.class_names))
+        finally:
+            # Batches stop being submitted before the inference thread goes away
+            batches.close()
+            self._inference.shutdown()
+            self._inference = None
+
+    def _infer(self, detect, *args):
+        if self._inference is None:
+            return detect(*args)
+        return self._inference.submit(detect, *args).result()
+
+    def get_object_track_table(self, frames, cache=None, video_path=None):
+        # With a StageCache, detections are reused only for the same video, model
+        # weights and detection parameters.
+        if cache is not None:
+            cache_key = cache.key('tracks', files=[video_path, self.model_path],
+                                  params=dict(self.detector.params(), batch_size=self.batch_size or 'auto'))
+            arrays = cache.load(cache_key)
+            if arrays is not None:
+                return TrackTable.from_arrays(arrays)
+
+        table = self._detect_and_track(frames)
+
+        if cache is not None:
+            cache.save(cache_key, table.to_arrays())
+
+        return table
+
+    def _detect_and_track(self, frames):
+        n_frames, chunks = 0, []
+        for n_frames, columns in self._iter_track_chunks(frames):
+            chunks.append(columns)
+        return self._table_from_chunks(n_frames, chunks)
+
+    def _table_from_chunks(self, n_frames, chunks):
+        return TrackTable(n_frames, **_concatenate_columns(chunks))
+
+    def get_tracker_state(self):
+        return get_bytetrack_state(self.tracker)
+
+    def set_tracker_state(self, state):
+        set_bytetrack_state(self.tracker, state)
+
+    def track_video(self, video_path, checkpoint, chunk_size=1000):
+        """
+        Detects and tracks every frame of a video, saving the rows and the tracker
+        state to `checkpoint` after every `chunk_size` frames. When the checkpoint
+        already holds chunks of an interrupted run, tracking resumes after them with
+        the same track ids.
+
+        Returns:
+            TrackTable: The same table as `get_object_track_table`.
+        """
+        if self.n_shards > 1:
+            n_frames, columns = track_video_sharded(self, video_path, self.n_shards, self.shard_overlap,
+                                                    checkpoint=checkpoint)
+            return TrackTable(n_frames, **columns)
+
+        start_frame = 0
+        if checkpoint.state is not None:
+            start_frame = checkpoint.state['stop']
+            self.set_tracker_state(checkpoint.state['tracker'])
+
+        for stop, columns in self._iter_track_chunks(iter_video(video_path, start_frame), start_frame, chunk_size):
+            checkpoint.save(columns, {'stop': stop, 'tracker': self.get_tracker_state()})
+
+        n_frames = checkpoint.state['stop'] if checkpoint.state is not None else 0
+        return self._table_from_chunks(n_frames, checkpoint.chunks)
+
+    def start(self):
+        """Starts tracking a new frame stream with `update`, with fresh track ids."""
+        self.tracker = sv.ByteTrack()
+        self.keyframes.reset()
+        self.ball_search.reset()
+
+    def update(self, frame, frame_num):
+        """
+        Detects and tracks the next frame of a stream started with `start`.
+
+        Returns:
+            dict: The frame's rows as `TRACKED_COLUMNS` arrays, with every ball
+            detection kept as a candidate for `BallTrajectoryStream`.
+        """
+        detections, detected = None, True
+        if self.keyframes.interval == 1 or self.keyframes.select([frame])[0]:
+            detections = self._detect_frame(frame, frame_num)
+        if self.keyframes.interval > 1:
+            detections, detected = self.keyframes.propagate(frame, detections,
+                                                            partial(self._detect_frame, frame_num=frame_num),
+                                                            self.detector.class_names)
+        return self._track_frame(frame, frame_num, detections, detected)
+
+    def _detect_frame(self, frame, frame_num):
+        with get_profiler().section('detection.predict', frames=1):
+            return self._infer(self.detector.detect, [frame], [frame_num])[0]
+
+    def _search_detect(self, frame, regions, frame_num):
+        with get_profiler().section('detection.ball_search', frames=1):
+            return self._infer(self.detector.detect_regions, frame, regions, frame_num)
+
+    def _track_frame(self, frame, frame_num, detection_supervision, detected):
+        """Tracks the detections of one frame and returns its rows as `TRACKED_COLUMNS` arrays."""
+        rows = []
+
+        def add_rows(track_ids, object_class, bboxes, confidence):
+            rows.append({
+                'frame': np.full(len(track_ids), frame_num),
+                'track_id': track_ids,
+                'object_class': np.full(len(track_ids), object_class),
+                'bbox': bboxes.reshape(-1, 4),
+                'confidence': np.full(len(track_ids), np.nan) if confidence is None else confidence,
+            })
+
+        cls_names= self.detector.class_names
+        cls_names_inv = {v: k for k, v in cls_names.items()}
+
+        for object_ind, class_id in enumerate(detection_supervision.class_id):
+            if cls_names[class_id] == 'goalkeeper':
+                detection_supervision.class_id[object_ind] = cls_names_inv['player']
+
+        with get_profiler().section('tracking.bytetrack', frames=1):
+            detection_with_tracks = self.tracker.update_with_detections(detection_supervision)
+
+        for object_name, cls_name in (('players', 'player'), ('referees', 'referee')):
+            if len(detection_with_tracks) == 0:
+                break
+            mask = detection_with_tracks.class_id == cls_names_inv[cls_name]
+            confidence = detection_with_tracks.confidence
+            add_rows(detection_with_tracks.tracker_id[mask], object_class_id(object_name),
+                     detection_with_tracks.xyxy[mask], None if confidence is None else confidence[mask])
+
+        # Every ball detection is kept as a candidate (track ids 1, 2, ...);
+        # reconstruct_ball_trajectory picks one per frame
+        ball_mask = detection_supervision.class_id == cls_names_inv['ball']
+        ball_bboxes = detection_supervision.xyxy[ball_mask]
+        confidence = detection_supervision.confidence
+        ball_confidence = None if confidence is None else confidence[ball_mask]
+        if self.ball_search.enabled:
+            if ball_mask.any():
+                self.ball_search.update(frame_num, ball_bboxes, ball_confidence)
+            else:
+                ball_bboxes, ball_confidence = self.ball_search.search(frame, frame_num, detected,
+                                                                       self._search_detect, cls_names_inv['ball'])
+        if len(ball_bboxes):
+            add_rows(np.arange(1, len(ball_bboxes) + 1), object_class_id('ball'), ball_bboxes, ball_confidence)
+
+        return _concatenate_columns(rows)
+
+    def _iter_track_chunks(self, frames, start_frame=0, chunk_size=None):
+        """
+        Detects and tracks `frames`, numbered from `start_frame`, and yields
+        (stop_frame, columns) every `chunk_size` frames and after the last frame.
+        """
+        chunk = []
+        self.ball_search.reset()
+        frame_num = start_frame - 1
+        for frame_num, (frame, detections, detected) in enumerate(self.detect_frames(frames, start_frame),
+                                                                  start_frame):
+            chunk.append(self._track_frame(frame, frame_num, detections, detected))
+
+            if chunk_size is not None and (frame_num + 1 - start_frame) % chunk_size == 0:
+                yield frame_num + 1, _concatenate_columns(chunk)
+                chunk = []
+
+        if chunk_size is None or (frame_num + 1 - start_frame) % chunk_size != 0:
+            yield frame_num + 1, _concatenate_columns(chunk)
+
+    def get_object_tracks(self, frames, cache=None, video_path=None):
+        return self.get_object_track_table(frames, cache, video_path).to_tracks()
 
     def draw_ellipse(self, frame, bbox, color, track_id= None):
         y2= int(bbox[3])
@@ -157,18 +376,11 @@ class Tracker:
 
         return frame
 
-    def draw_team_ball_control(self, frame, frame_num, team_ball_control):
-        overlay = frame.copy()
-        cv2.rectangle(overlay, (1350, 850), (1900, 970), (255, 255, 255), -1)
-        alpha = 0.4
-        cv2.addWeighted(overlay, alpha, frame, 1 - alpha, 0, frame)
+    def draw_team_ball_control(self, frame, frame_num, possession):
+        draw_panel(frame, (1350, 850), (1900, 970), (255, 255, 255), 0.4)
 
-        team_ball_control_till_frame = team_ball_control[:frame_num + 1]
-        # Get the number of time each team had ball control
-        team_1_num_frames = team_ball_control_till_frame[team_ball_control_till_frame == 1].shape[0]
-        team_2_num_frames = team_ball_control_till_frame[team_ball_control_till_frame == 2].shape[0]
-        team_1 = team_1_num_frames / (team_1_num_frames + team_2_num_frames)
-        team_2 = team_2_num_frames / (team_1_num_frames + team_2_num_frames)
+        # Shares of the frames so far, from the running counts kept by PossessionAnalytics
+        team_1, team_2 = possession.possession(frame_num)
 
         cv2.putText(frame, f"Team 1 Ball Control: {team_1 * 100:.2f}%", (1400, 900), cv2.FONT_HERSHEY_SIMPLEX, 1,
                     (0, 0, 0), 3)
@@ -177,35 +389,28 @@ class Tracker:
 
         return frame
 
-    def draw_annotations(self, video_frames, tracks, team_ball_control):
-        output_video_frames = []
-        for frame_num, frame in enumerate(video_frames):
+    def draw_frame_annotations(self, frame, frame_num, tracks, possession):
+        players_dict = tracks['players'][frame_num]
+        ball_dict = tracks['ball'][frame_num]
+        referees_dict = tracks['referees'][frame_num]
 
-            frame = frame.copy()
+        for track_id, player in players_dict.items():
+            color = player.get('team_color', (0, 255, 0))
+            frame= self.draw_ellipse(frame, player['bbox'], color, track_id)
 
-            players_dict = tracks['players'][frame_num]
-            ball_dict = tracks['ball'][frame_num]
-            referees_dict = tracks['referees'][frame_num]
+            if player.get('has_ball', False):
+                frame= self.draw_triangle(frame, player['bbox'], (255, 0, 0))
 
-            for track_id, player in players_dict.items():
-                color = player.get('team_color', (0, 255, 0))
-                frame= self.draw_ellipse(frame, player['bbox'], color, track_id)
+        for _ , referee in referees_dict.items():
+            frame = self.draw_ellipse(frame, referee['bbox'], (0,255,255))
 
-                if player.get('has_ball', False):
-                    frame= self.draw_triangle(frame, player['bbox'], (255, 0, 0))
+        for track_id, ball in ball_dict.items():
+            frame = self.draw_triangle(frame, ball['bbox'], (0,255,0))
 
-            for _ , referee in referees_dict.items():
-                frame = self.draw_ellipse(frame, referee['bbox'], (0,255,255))
+        frame = self.draw_team_ball_control(frame, frame_num, possession)
 
-            for track_id, ball in ball_dict.items():
-                frame = self.draw_triangle(frame, ball['bbox'], (0,255,0))
-
-            frame = self.draw_team_ball_control(frame, frame_num, team_ball_control)
-
-            output_video_frames.append(frame)
-
-        return output_video_frames
+        return frame
 
-            
-            
-        
\ No newline at end of file
+    def draw_annotations(self, video_frames, tracks, possession):
+        for frame_num, frame in enumerate(video_frames):
+            yield self.draw_frame_annotations(frame.copy(), frame_num, tracks, possession)
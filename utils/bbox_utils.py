@@ -1,3 +1,6 @@
+import numpy as np
+
+
 def get_center_of_bbox(bbox):
     x1, y1, x2, y2 = bbox
     return int((x1 + x2) / 2), int((y1 + y2) / 2)
@@ -16,3 +19,15 @@ def get_foot_position(bbox):
     x1, y1, x2, y2 = bbox
     return (x1 + x2) / 2, y2
 
+
+def iou_matrix(boxes_a, boxes_b):
+    """Pairwise intersection over union of (N, 4) and (M, 4) xyxy boxes, as an (N, M) array."""
+    boxes_a = np.asarray(boxes_a, dtype=np.float64).reshape(-1, 1, 4)
+    boxes_b = np.asarray(boxes_b, dtype=np.float64).reshape(1, -1, 4)
+    width = np.clip(np.minimum(boxes_a[..., 2], boxes_b[..., 2]) - np.maximum(boxes_a[..., 0], boxes_b[..., 0]), 0, None)
+    height = np.clip(np.minimum(boxes_a[..., 3], boxes_b[..., 3]) - np.maximum(boxes_a[..., 1], boxes_b[..., 1]), 0, None)
+    intersection = width * height
+    area_a = (boxes_a[..., 2] - boxes_a[..., 0]) * (boxes_a[..., 3] - boxes_a[..., 1])
+    area_b = (boxes_b[..., 2] - boxes_b[..., 0]) * (boxes_b[..., 3] - boxes_b[..., 1])
+    union = area_a + area_b - intersection
+    return np.where(union > 0, intersection / np.where(union > 0, union, 1), 0.0)
@@ -0,0 +1,71 @@
+import queue
+import threading
+from typing import Iterable, Iterator, TypeVar
+
+T = TypeVar('T')
+
+_END = object()
+
+
+class _Error:
+    def __init__(self, exception):
+        self.exception = exception
+
+
+def prefetch(iterable: Iterable[T], max_size: int = 8) -> Iterator[T]:
+    """
+    Iterates `iterable` on a background thread, keeping up to `max_size` items ready.
+
+    Items are yielded in their original order. Exceptions raised by the producer are
+    re-raised in the consumer, and closing the returned generator stops the producer.
+    Chaining several calls turns a sequence of generators into a pipeline whose stages
+    run concurrently (decoding, OpenCV and model inference release the GIL).
+
+    Args:
+        iterable (Iterable[T]): Source to consume in the background.
+        max_size (int): Maximum number of items buffered ahead of the consumer.
+
+    Yields:
+        T: The items of `iterable`.
+    """
+    source = iter(iterable)
+    items: queue.Queue = queue.Queue(maxsize=max_size)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in source:
+                if not put(item):
+                    return
+            put(_END)
+        except BaseException as e:
+            put(_Error(e))
+        finally:
+            close = getattr(source, 'close', None)
+            if close is not None:
+                close()
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            item = items.get()
+            if item is _END:
+                return
+            if isinstance(item, _Error):
+                raise item.exception
+            yield item
+    finally:
+        stop.set()
+        # The producer finishes at most the item it is working on before exiting
+        thread.join()
@@ -0,0 +1,233 @@
+import cProfile
+import csv
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_mb() -> Optional[float]:
+    """
+    Peak resident set size of the current process so far, in MiB.
+
+    Returns:
+        Optional[float]: The peak RSS, or None where it cannot be measured.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KiB elsewhere
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def _throughput(frames, wall_time):
+    return frames / wall_time if frames and wall_time > 0 else None
+
+
+# Returned by a disabled profiler, so instrumented code pays for one method call only
+_NULL_CONTEXT = nullcontext({})
+
+
+class StageProfiler:
+    """
+    Records telemetry for pipeline stages and the hot loops inside them.
+
+    A stage is a top-level step of the pipeline; for each one the wall time, CPU
+    time of the process, frames processed, throughput and peak RSS are recorded, and
+    optionally a cProfile dump and the peak traced Python allocations. A section is
+    a hot loop body (a batch of inference, one optical-flow step, ...) that can run
+    many times and on any thread; its calls, wall time, thread CPU time and frames
+    are summed per name.
+
+    A disabled profiler records nothing. Instrumented modules reach the profiler
+    activated with `use_profiler` through `get_profiler()`.
+
+    Example:
+        ```python
+        profiler = StageProfiler()
+        with use_profiler(profiler):
+            with profiler.stage('detection') as record:
+                ...
+                with get_profiler().section('detection.predict', frames=len(batch)):
+                    ...
+                record['frames'] = n_frames
+        profiler.write_report('report.json')
+        ```
+    """
+
+    def __init__(self, enabled: bool = True, profile_stages: bool = False, trace_memory: bool = False,
+                 profile_dir: str = "profiles"):
+        """
+        Args:
+            enabled (bool): Whether anything is recorded at all.
+            profile_stages (bool): Run each stage under cProfile and dump its stats to
+                `profile_dir/<stage>.prof`. Only the thread running the stage is profiled.
+            trace_memory (bool): Trace Python allocations with tracemalloc during each
+                stage and record their peak. This slows the stage down noticeably.
+            profile_dir (str): Directory for the cProfile dumps.
+        """
+        self.enabled = enabled
+        self.profile_stages = profile_stages
+        self.trace_memory = trace_memory
+        self.profile_dir = profile_dir
+        self.stages: List[dict] = []
+        self.sections: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def stage(self, name: str, frames: Optional[int] = None):
+        """
+        Times the enclosed block as one stage.
+
+        Args:
+            name (str): Name of the stage.
+            frames (Optional[int]): Number of frames the stage processes, used for
+                its throughput. It can also be set on the yielded record when it is
+                only known at the end of the stage.
+
+        Returns:
+            A context manager yielding the stage's record, completed when the block exits.
+        """
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return self._stage(name, frames)
+
+    @contextmanager
+    def _stage(self, name, frames):
+        record = {'stage': name, 'frames': frames}
+
+        profile = cProfile.Profile() if self.profile_stages else None
+        started_tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+
+        start, start_cpu = time.perf_counter(), time.process_time()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield record
+        finally:
+            if profile is not None:
+                profile.disable()
+            wall_time = time.perf_counter() - start
+            record.update(
+                wall_time=wall_time,
+                cpu_time=time.process_time() - start_cpu,
+                fps=_throughput(record['frames'], wall_time),
+                peak_rss_mb=peak_rss_mb(),
+            )
+
+            if self.trace_memory:
+                record['traced_peak_mb'] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+                if started_tracing:
+                    tracemalloc.stop()
+            if profile is not None:
+                os.makedirs(self.profile_dir, exist_ok=True)
+                record['profile'] = os.path.join(self.profile_dir, f"{name}.prof")
+                profile.dump_stats(record['profile'])
+
+            self.stages.append(record)
+
+    def section(self, name: str, frames: Optional[int] = None):
+        """
+        Adds the enclosed block to the totals of section `name`.
+
+        Args:
+            name (str): Name of the section, e.g. 'detection.predict'.
+            frames (Optional[int]): Number of frames processed by this call.
+        """
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return self._section(name, frames)
+
+    @contextmanager
+    def _section(self, name, frames):
+        start, start_cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            wall_time = time.perf_counter() - start
+            cpu_time = time.thread_time() - start_cpu
+            with self._lock:
+                totals = self.sections.setdefault(name, {'calls': 0, 'wall_time': 0.0, 'cpu_time': 0.0,
+                                                         'frames': 0})
+                totals['calls'] += 1
+                totals['wall_time'] += wall_time
+                totals['cpu_time'] += cpu_time
+                totals['frames'] += frames or 0
+
+    def report(self) -> dict:
+        """The recorded stages and sections, plus the process' peak RSS."""
+        sections = {name: dict(totals, fps=_throughput(totals['frames'], totals['wall_time']))
+                    for name, totals in self.sections.items()}
+        return {'stages': list(self.stages), 'sections': sections, 'peak_rss_mb': peak_rss_mb()}
+
+    def write_report(self, path: str):
+        """
+        Writes the report as JSON, or as CSV (one row per stage and section) when
+        `path` ends with '.csv'.
+        """
+        report = self.report()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        if not path.endswith('.csv'):
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=2)
+            return
+
+        fields = ['kind', 'name', 'calls', 'frames', 'wall_time', 'cpu_time', 'fps', 'peak_rss_mb',
+                  'traced_peak_mb', 'profile']
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fields, extrasaction='ignore')
+            writer.writeheader()
+            for record in report['stages']:
+                writer.writerow(dict(record, kind='stage', name=record['stage']))
+            for name, totals in report['sections'].items():
+                writer.writerow(dict(totals, kind='section', name=name))
+
+    def summary(self) -> str:
+        """Human-readable table of the stages and sections."""
+        def row(name, wall_time, cpu_time, frames, fps, extra=''):
+            fps = f"{fps:.1f}" if fps else '-'
+            return f"{name:<32} {wall_time:>9.3f} {cpu_time:>9.3f} {frames or '-':>8} {fps:>10} {extra}"
+
+        lines = [f"{'stage / section':<32} {'wall (s)':>9} {'cpu (s)':>9} {'frames':>8} {'fps':>10}"]
+        for record in self.stages:
+            peak_rss = record['peak_rss_mb']
+            lines.append(row(record['stage'], record['wall_time'], record['cpu_time'], record['frames'],
+                             record['fps'], f"peak RSS {peak_rss:.0f} MiB" if peak_rss else ''))
+        for name, totals in self.report()['sections'].items():
+            lines.append(row(f"  {name}", totals['wall_time'], totals['cpu_time'], totals['frames'],
+                             totals['fps'], f"{totals['calls']} calls"))
+        return '\n'.join(lines)
+
+
+_active_profiler = StageProfiler(enabled=False)
+
+
+def get_profiler() -> StageProfiler:
+    """The profiler activated with `use_profiler`, or a disabled one."""
+    return _active_profiler
+
+
+@contextmanager
+def use_profiler(profiler: StageProfiler):
+    """Makes `profiler` the one returned by `get_profiler()` within the block."""
+    global _active_profiler
+    previous, _active_profiler = _active_profiler, profiler
+    try:
+        yield profiler
+    finally:
+        _active_profiler = previous
@@ -0,0 +1,56 @@
+import cv2
+import numpy as np
+from utils.profiling import get_profiler
+from utils.video_utils import save_video
+
+
+def draw_panel(frame, top_left, bottom_right, color, alpha):
+    """
+    Alpha-blends a filled rectangle onto `frame` in place, touching only its region.
+
+    Equivalent to drawing the rectangle on a full copy of the frame and blending the
+    copy back, without copying or blending the rest of the frame.
+    """
+    height, width = frame.shape[:2]
+    # cv2.rectangle includes the bottom-right corner
+    x1, x2 = np.clip([top_left[0], bottom_right[0] + 1], 0, width)
+    y1, y2 = np.clip([top_left[1], bottom_right[1] + 1], 0, height)
+
+    roi = frame[y1:y2, x1:x2]
+    if roi.size == 0:
+        return frame
+
+    panel = np.empty_like(roi)
+    panel[:] = color
+    frame[y1:y2, x1:x2] = cv2.addWeighted(panel, alpha, roi, 1 - alpha, 0)
+    return frame
+
+
+class FrameRenderer:
+    """
+    Draws every registered layer onto each frame in a single pass.
+
+    A layer is a callable `draw(frame, frame_num, *args)` that draws onto the frame in
+    place. Layers are applied in registration order, and rendered frames are streamed
+    straight into the video encoder.
+    """
+
+    def __init__(self):
+        self.layers = []
+
+    def add_layer(self, draw, *args):
+        self.layers.append((draw, args))
+        return self
+
+    def render_frame(self, frame, frame_num):
+        with get_profiler().section('rendering.draw', frames=1):
+            for draw, args in self.layers:
+                draw(frame, frame_num, *args)
+        return frame
+
+    def iter_render(self, frames):
+        for frame_num, frame in enumerate(frames):
+            yield self.render_frame(frame, frame_num)
+
+    def render(self, frames, output_video_path, fps=None):
+        save_video(self.iter_render(frames), output_video_path, fps)
@@ -0,0 +1,157 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+# Bump whenever the layout or meaning of a cached stage result changes, so that
+# results written by older code are never reused.
+CACHE_VERSION = 2
+
+_file_digests: Dict[tuple, str] = {}
+
+
+def hash_file(path: str, chunk_size: int = 16 * 1024 * 1024) -> str:
+    """
+    Content hash of a file, memoized per (path, size, mtime) for the current process.
+
+    Args:
+        path (str): Path of the file to hash.
+        chunk_size (int): Number of bytes read at a time.
+
+    Returns:
+        str: Hex digest of the file contents.
+    """
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if memo_key not in _file_digests:
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+        _file_digests[memo_key] = digest.hexdigest()
+    return _file_digests[memo_key]
+
+
+def _json_default(value):
+    if isinstance(value, np.ndarray):
+        contents = hashlib.blake2b(np.ascontiguousarray(value).tobytes(), digest_size=16).hexdigest()
+        return {'ndarray': contents, 'shape': value.shape, 'dtype': str(value.dtype)}
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Cannot hash stage parameter of type {type(value).__name__}")
+
+
+def save_arrays(directory: str, arrays: Dict[str, np.ndarray], **meta):
+    """
+    Writes `arrays` as `.npy` files, and `meta` with the array names to `meta.json`,
+    into `directory`. The directory is replaced atomically, so readers see either
+    the previous contents or the new ones.
+    """
+    parent = os.path.dirname(os.path.abspath(directory))
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=f".{os.path.basename(directory)}-", dir=parent)
+
+    try:
+        for name, values in arrays.items():
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), np.asarray(values), allow_pickle=False)
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+            json.dump(dict(meta, version=CACHE_VERSION, arrays=list(arrays)), f)
+
+        if os.path.exists(directory):
+            shutil.rmtree(directory)
+        os.replace(tmp_dir, directory)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+
+def load_arrays(directory: str, mmap_mode: Optional[str] = 'r') -> Optional[Tuple[Dict[str, np.ndarray], dict]]:
+    """
+    The arrays and meta written by `save_arrays` to `directory`, or None when there
+    are none. Arrays are memory-mapped unless `mmap_mode` is None.
+    """
+    meta_path = os.path.join(directory, 'meta.json')
+    if not os.path.exists(meta_path):
+        return None
+
+    with open(meta_path) as f:
+        meta = json.load(f)
+    arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode, allow_pickle=False)
+              for name in meta['arrays']}
+    return arrays, meta
+
+
+class StageCache:
+    """
+    On-disk cache of stage results shared by all pipeline stages.
+
+    Entries are keyed by a hash of the stage name, the contents of its input files
+    (video, model weights) and its parameters, so a result is only reused when all of
+    them match. Each entry is a directory of `.npy` arrays that are loaded memory-mapped.
+    Least recently used entries are evicted once the cache grows beyond `max_bytes`.
+    """
+
+    def __init__(self, cache_dir: str = "stubs/cache", max_bytes: int = 10 * 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def key(self, stage: str, files: Iterable[str] = (), params: Optional[dict] = None) -> str:
+        description = json.dumps({
+            'version': CACHE_VERSION,
+            'stage': stage,
+            'files': [hash_file(path) for path in files],
+            'params': params or {},
+        }, sort_keys=True, default=_json_default)
+        return f"{stage}-{hashlib.blake2b(description.encode(), digest_size=16).hexdigest()}"
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def load(self, key: str) -> Optional[Dict[str, np.ndarray]]:
+        """
+        Returns the arrays stored under `key` (memory-mapped), or None on a cache miss.
+        """
+        entry_dir = self._entry_dir(key)
+        loaded = load_arrays(entry_dir)
+        if loaded is None:
+            return None
+
+        # The meta file's mtime doubles as the entry's last access time for LRU eviction
+        os.utime(os.path.join(entry_dir, 'meta.json'))
+        return loaded[0]
+
+    def save(self, key: str, arrays: Dict[str, np.ndarray]):
+        save_arrays(self._entry_dir(key), arrays, created=time.time())
+        self.evict(keep=key)
+
+    def _entries(self):
+        if not os.path.isdir(self.cache_dir):
+            return []
+
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            entry_dir = self._entry_dir(key)
+            meta_path = os.path.join(entry_dir, 'meta.json')
+            if key.startswith('.') or not os.path.exists(meta_path):
+                continue
+            size = sum(entry.stat().st_size for entry in os.scandir(entry_dir))
+            entries.append((os.path.getmtime(meta_path), size, key))
+        return entries
+
+    def evict(self, keep: Optional[str] = None):
+        """Removes least recently used entries until the cache fits in `max_bytes`."""
+        entries = sorted(self._entries())
+        total_size = sum(size for _, size, _ in entries)
+
+        for _, size, key in entries:
+            if total_size <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+            total_size -= size
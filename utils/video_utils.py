@@ -1,6 +1,16 @@
+import queue
+import shutil
+import subprocess
+import threading
 import cv2
 import numpy as np
-from typing import List, Tuple
+from typing import Iterable, Iterator, List, Optional, Tuple
+from utils.frame_store import FrameStore
+from utils.prefetch import prefetch
+from utils.profiling import get_profiler
+
+# Used for sources that report no frame rate
+DEFAULT_FPS = 24
 
 
 def read_video(path_video: str) -> List[np.ndarray]:
@@ -37,6 +47,150 @@ def read_video(path_video: str) -> List[np.ndarray]:
     return frames
 
 
+def iter_video(path_video: str, start: int = 0, stop: Optional[int] = None,
+               read_ahead: int = 0) -> Iterator[np.ndarray]:
+    """
+    Lazily decodes a video file, yielding one frame at a time.
+
+    Unlike `read_video`, only the frame currently being consumed is kept in memory,
+    so the cost of reading a video no longer grows with its length.
+
+    Args:
+        path_video (str): The path to the video file.
+        start (int): Index of the first frame to yield.
+        stop (Optional[int]): Index of the frame to stop before, or None to read to the end.
+        read_ahead (int): With a positive value, frames are decoded on a background
+            thread that keeps up to this many frames ready.
+
+    Yields:
+        np.ndarray: The next decoded frame. Frames of a `FrameStore` passed as
+        `path_video` are read-only views.
+
+    Raises:
+        FileNotFoundError: If the video file cannot be found or opened.
+    """
+    if isinstance(path_video, FrameStore):
+        return path_video.iter_frames(start, stop)
+    if read_ahead > 0:
+        return prefetch(_decode_video(path_video, start, stop), max_size=read_ahead)
+    return _decode_video(path_video, start, stop)
+
+
+def _decode_video(path_video: str, start: int, stop: Optional[int]) -> Iterator[np.ndarray]:
+    cap = cv2.VideoCapture(path_video)
+
+    if not cap.isOpened():
+        raise FileNotFoundError(f"Could not open video file: {path_video}")
+
+    try:
+        if start > 0:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+
+        frame_num = start
+        profiler = get_profiler()
+        while stop is None or frame_num < stop:
+            with profiler.section('video.decode', frames=1):
+                ret, frame = cap.read()
+            if not ret:
+                break
+            yield frame
+            frame_num += 1
+    finally:
+        cap.release()
+
+
+def iter_video_frames(path_video: str, frame_nums: Iterable[int],
+                      read_ahead: int = 0) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    Decodes only some frames of a video, e.g. a few frames spread over a long video.
+
+    Frames in between are grabbed without being retrieved and converted to BGR,
+    and a `FrameStore` is indexed directly.
+
+    Args:
+        path_video (str): The path to the video file, or a `FrameStore`.
+        frame_nums (Iterable[int]): Increasing indices of the frames to yield.
+        read_ahead (int): See `iter_video`.
+
+    Yields:
+        Tuple[int, np.ndarray]: The index and the frame, for the frames the video has.
+    """
+    if isinstance(path_video, FrameStore):
+        return ((frame_num, path_video[frame_num]) for frame_num in frame_nums if frame_num < len(path_video))
+    if read_ahead > 0:
+        return prefetch(_decode_frames(path_video, frame_nums), max_size=read_ahead)
+    return _decode_frames(path_video, frame_nums)
+
+
+def _decode_frames(path_video: str, frame_nums: Iterable[int]) -> Iterator[Tuple[int, np.ndarray]]:
+    cap = cv2.VideoCapture(path_video)
+
+    if not cap.isOpened():
+        raise FileNotFoundError(f"Could not open video file: {path_video}")
+
+    try:
+        position = 0
+        profiler = get_profiler()
+        for frame_num in frame_nums:
+            while position < frame_num:
+                with profiler.section('video.grab', frames=1):
+                    ret = cap.grab()
+                if not ret:
+                    return
+                position += 1
+            with profiler.section('video.decode', frames=1):
+                ret, frame = cap.read()
+            if not ret:
+                return
+            position += 1
+            yield frame_num, frame
+    finally:
+        cap.release()
+
+
+def iter_batches(frames: Iterable[np.ndarray], batch_size: int) -> Iterator[List[np.ndarray]]:
+    """
+    Groups an iterable of frames into lists of at most `batch_size` frames.
+
+    Args:
+        frames (Iterable[np.ndarray]): Frames, e.g. from `iter_video` or a list.
+        batch_size (int): Maximum number of frames per batch.
+
+    Yields:
+        List[np.ndarray]: The next window of frames.
+    """
+    batch: List[np.ndarray] = []
+    for frame in frames:
+        batch.append(frame)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def read_first_frame(path_video: str) -> np.ndarray:
+    """
+    Decodes only the first frame of a video file.
+
+    Args:
+        path_video (str): The path to the video file.
+
+    Returns:
+        np.ndarray: The first frame.
+
+    Raises:
+        FileNotFoundError: If the video file cannot be opened or contains no frames.
+    """
+    frames = iter_video(path_video)
+    try:
+        return next(frames)
+    except StopIteration:
+        raise FileNotFoundError(f"Video file has no frames: {path_video}")
+    finally:
+        frames.close()
+
+
 def get_video_info(path_video: str) -> Tuple[int, int, float, int]:
     """
     Get basic information about a video file.
@@ -50,6 +204,9 @@ def get_video_info(path_video: str) -> Tuple[int, int, float, int]:
     Raises:
         FileNotFoundError: If the video file cannot be found or opened.
     """
+    if isinstance(path_video, FrameStore):
+        return path_video.width, path_video.height, path_video.fps, path_video.n_frames
+
     cap = cv2.VideoCapture(path_video)
 
     if not cap.isOpened():
@@ -64,21 +221,152 @@ def get_video_info(path_video: str) -> Tuple[int, int, float, int]:
     return width, height, fps, frame_count
 
 
-def save_video(output_video_frames, output_video_path):
+def iter_video_segment(path_video: str, start_time: float = 0.0, stop_time: Optional[float] = None,
+                       read_ahead: int = 0) -> Iterator[np.ndarray]:
+    """
+    Decodes the frames of a time range of a video file.
+
+    Args:
+        path_video (str): The path to the video file.
+        start_time (float): Time of the first frame, in seconds.
+        stop_time (Optional[float]): Time to stop before, in seconds, or None to read to the end.
+        read_ahead (int): See `iter_video`.
+
+    Yields:
+        np.ndarray: The next decoded frame.
+    """
+    start, stop = time_range_to_frames(path_video, start_time, stop_time)
+    return iter_video(path_video, start, stop, read_ahead)
+
+
+def time_range_to_frames(path_video: str, start_time: float = 0.0,
+                         stop_time: Optional[float] = None) -> Tuple[int, Optional[int]]:
+    """Frame indices (start, stop) of a time range in seconds, at the video's frame rate."""
+    fps = get_video_info(path_video)[2] or DEFAULT_FPS
+    start = max(0, int(round(start_time * fps)))
+    stop = None if stop_time is None else max(start, int(round(stop_time * fps)))
+    return start, stop
+
+
+class VideoWriter:
+    """
+    Encodes frames on a background thread.
+
+    Frames are piped as raw BGR to an ffmpeg subprocess writing H.264 when ffmpeg is
+    on the PATH, and written with OpenCV's mp4v encoder otherwise. `write` only
+    blocks when `queue_size` frames are already waiting, so drawing the next frames
+    overlaps with encoding. Use as a context manager, or call `close`.
+
+    Args:
+        output_video_path (str): The path where the video will be saved.
+        fps (float): Frame rate of the video.
+        frame_size (Tuple[int, int]): (width, height) of the frames.
+        queue_size (int): Maximum number of frames waiting to be encoded.
+        use_ffmpeg (Optional[bool]): Force or disable the ffmpeg encoder; by default
+            it is used when available.
+    """
+
+    def __init__(self, output_video_path: str, fps: float, frame_size: Tuple[int, int], queue_size: int = 16,
+                 use_ffmpeg: Optional[bool] = None):
+        self.output_video_path = output_video_path
+        self.use_ffmpeg = shutil.which('ffmpeg') is not None if use_ffmpeg is None else use_ffmpeg
+        width, height = frame_size
+
+        if self.use_ffmpeg:
+            command = ['ffmpeg', '-y', '-loglevel', 'error',
+                       '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f"{width}x{height}", '-r', str(fps), '-i', '-',
+                       # yuv420p, which every player can decode, needs even dimensions
+                       '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-c:v', 'libx264', '-preset', 'veryfast',
+                       '-pix_fmt', 'yuv420p', output_video_path]
+            self._process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+        else:
+            fourcc = cv2.VideoWriter.fourcc(*'mp4v')
+            self._writer = cv2.VideoWriter(output_video_path, fourcc, fps, (width, height))
+
+        self._frames: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._encode, args=(get_profiler(),), daemon=True)
+        self._thread.start()
+
+    def write(self, frame: np.ndarray) -> None:
+        if self._error is not None:
+            raise self._error
+        self._frames.put(frame)
+
+    def _encode(self, profiler) -> None:
+        while True:
+            frame = self._frames.get()
+            if frame is None:
+                return
+            if self._error is not None:
+                # Keep draining so that write() never blocks on a failed encoder
+                continue
+            try:
+                with profiler.section('video.encode', frames=1):
+                    if self.use_ffmpeg:
+                        self._process.stdin.write(np.ascontiguousarray(frame).data)
+                    else:
+                        self._writer.write(frame)
+            except BaseException as e:
+                self._error = e
+
+    def close(self) -> None:
+        self._frames.put(None)
+        self._thread.join()
+
+        if self.use_ffmpeg:
+            try:
+                self._process.stdin.close()
+            except BrokenPipeError:
+                pass
+            stderr = self._process.stderr.read().decode(errors='replace')
+            if self._process.wait() != 0:
+                raise RuntimeError(f"ffmpeg failed to encode {self.output_video_path}: {stderr.strip()}")
+        else:
+            self._writer.release()
+
+        if self._error is not None:
+            raise self._error
+
+    def __enter__(self) -> 'VideoWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+            return
+        # Do not mask the original error with one from the encoder
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+def save_video(output_video_frames, output_video_path, fps=None):
     """
-    Save a list of frames as a video file.
+    Save frames as a video file.
+
+    Frames are written as they are produced, so a generator of frames is encoded
+    without ever holding the whole video in memory; encoding runs on a background
+    thread (see `VideoWriter`).
+
     Args:
-        output_video_frames (List[np.ndarray]): List of frames to be saved as a video.
+        output_video_frames (Iterable[np.ndarray]): Frames to be saved as a video.
         output_video_path (str): The path where the output video will be saved.
+        fps (Optional[float]): Frame rate, normally the source video's; defaults to
+            `DEFAULT_FPS`.
+
+    Raises:
+        ValueError: If there are no frames to save.
     """
-    fourcc = cv2.VideoWriter.fourcc(*'mp4v')
-    out = cv2.VideoWriter(output_video_path, fourcc, 24, (output_video_frames[0].shape[1],
-        output_video_frames[0].shape[0]))
-   
-    for frame in output_video_frames:
-        out.write(frame)
-    out.release()
-    print(f"Video saved to {output_video_path}")
-    
-    
+    frames = iter(output_video_frames)
+    first_frame = next(frames, None)
+    if first_frame is None:
+        raise ValueError("No frames to save")
 
+    frame_size = (first_frame.shape[1], first_frame.shape[0])
+    with VideoWriter(output_video_path, fps or DEFAULT_FPS, frame_size) as writer:
+        writer.write(first_frame)
+        for frame in frames:
+            writer.write(frame)
+    print(f"Video saved to {output_video_path}")
@@ -1,11 +1,13 @@
 import numpy as np
 import cv2
+from tracker.track_table import TrackTable
 
 
 class ViewTransformer():
     def __init__(self):
         court_width = 68
         court_length = 23.32
+        self.pitch_size = (court_length, court_width)
 
         self.pixel_vertices = np.array([[110, 1035],
                                         [265, 275],
@@ -24,23 +26,48 @@ class ViewTransformer():
 
         self.persepctive_trasnformer = cv2.getPerspectiveTransform(self.pixel_vertices, self.target_vertices)
 
+    def points_inside(self, points):
+        # Vectorized equivalent of cv2.pointPolygonTest(..., False) >= 0 on integer
+        # pixel positions, for the convex pitch polygon: a point is inside (or on an
+        # edge) when it lies on the same side of every edge.
+        points = np.trunc(points)
+        vertices = self.pixel_vertices
+        edges = np.roll(vertices, -1, axis=0) - vertices
+        cross = (edges[:, 0] * (points[:, None, 1] - vertices[:, 1])
+                 - edges[:, 1] * (points[:, None, 0] - vertices[:, 0]))
+        return (cross >= 0).all(axis=1) | (cross <= 0).all(axis=1)
+
+    def transform_points(self, points):
+        """
+        Transforms pixel positions to pitch coordinates in one batch.
+
+        Args:
+            points (np.ndarray): (N, 2) array of camera-adjusted pixel positions.
+
+        Returns:
+            np.ndarray: (N, 2) float32 array of pitch positions, NaN for points outside
+            the pitch polygon (or that were NaN to begin with).
+        """
+        points = np.asarray(points, dtype=np.float32).reshape(-1, 2)
+        transformed = np.full(points.shape, np.nan, dtype=np.float32)
+
+        inside = self.points_inside(points)
+        if inside.any():
+            inside_points = points[inside].reshape(-1, 1, 2)
+            transformed[inside] = cv2.perspectiveTransform(inside_points, self.persepctive_trasnformer).reshape(-1, 2)
+
+        return transformed
+
     def transform_point(self, point):
-        p = (int(point[0]), int(point[1]))
-        is_inside = cv2.pointPolygonTest(self.pixel_vertices, p, False) >= 0
-        if not is_inside:
+        tranform_point = self.transform_points(point)
+        if np.isnan(tranform_point[0, 0]):
             return None
+        return tranform_point
 
-        reshaped_point = point.reshape(-1, 1, 2).astype(np.float32)
-        tranform_point = cv2.perspectiveTransform(reshaped_point, self.persepctive_trasnformer)
-        return tranform_point.reshape(-1, 2)
+    def add_transformed_position_to_table(self, table):
+        table.position_transformed = self.transform_points(table.position_adjusted)
 
     def add_transformed_position_to_tracks(self, tracks):
-        for object, object_tracks in tracks.items():
-            for frame_num, track in enumerate(object_tracks):
-                for track_id, track_info in track.items():
-                    position = track_info['position_adjusted']
-                    position = np.array(position)
-                    position_transformed = self.transform_point(position)
-                    if position_transformed is not None:
-                        position_transformed = position_transformed.squeeze().tolist()
-                    tracks[object][frame_num][track_id]['position_transformed'] = position_transformed
\ No newline at end of file
+        table = TrackTable.from_tracks(tracks)
+        self.add_transformed_position_to_table(table)
+        table.update_tracks(tracks)